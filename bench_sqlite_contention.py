@@ -0,0 +1,120 @@
+"""
+Нагрузочная проверка SQLite: несколько процессов пишут в один файл
+
+Каждый процесс изображает бота: записывает шаг прогресса своим
+пользователям (update_user_progress_obj — CAS, история и счётчики в
+одной транзакции) и читает статистику. Сравниваются настройки
+соединения по умолчанию и SQLITE_PRAGMAS из models.py.
+
+Запуск:
+    python bench_sqlite_contention.py --processes 4 --writes 300
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+MODES = ('default', 'tuned')
+
+
+def _engine(path: str, mode: str):
+    from models import configure_sqlite
+
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if mode == 'tuned':
+        configure_sqlite(engine)
+    return engine
+
+
+def _worker(path: str, mode: str, index: int, users: int, writes: int, results):
+    from models import User
+    from utils.db import get_or_create_user, get_user_stats, update_user_progress_obj
+
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=_engine(path, mode))
+    db = Session()
+    latencies, errors = [], 0
+    telegram_ids = [index * users + offset + 1 for offset in range(users)]
+    try:
+        for telegram_id in telegram_ids:
+            get_or_create_user(db, telegram_id=telegram_id)
+        for step in range(writes):
+            telegram_id = telegram_ids[step % users]
+            started = time.perf_counter()
+            try:
+                user = db.query(User).filter(User.telegram_id == telegram_id).one()
+                update_user_progress_obj(db, user, stage_id=1, step_id=step % 10 + 1, day=1)
+                get_user_stats(db, telegram_id)
+                db.commit()
+            except OperationalError:
+                db.rollback()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    finally:
+        db.close()
+    results.put((latencies, errors))
+
+
+def run(mode: str, processes: int, users: int, writes: int) -> dict:
+    from models import Base
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        engine = _engine(path, mode)
+        Base.metadata.create_all(bind=engine)
+        engine.dispose()
+
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=_worker, args=(path, mode, index, users, writes, results))
+            for index in range(processes)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(value for values, _ in collected for value in values)
+    errors = sum(count for _, count in collected)
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))] * 1000 if latencies else 0.0
+
+    return {
+        'mode': mode,
+        'ok': len(latencies),
+        'errors': errors,
+        'ops_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(50),
+        'p99_ms': percentile(99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конкурентная запись в SQLite из нескольких процессов")
+    parser.add_argument('--processes', type=int, default=4, help="Сколько процессов пишут одновременно")
+    parser.add_argument('--users', type=int, default=20, help="Пользователей на процесс")
+    parser.add_argument('--writes', type=int, default=300, help="Записей прогресса на процесс")
+    parser.add_argument('--mode', choices=MODES + ('both',), default='both')
+    args = parser.parse_args()
+
+    modes = MODES if args.mode == 'both' else (args.mode,)
+    print(f"{'режим':<8} {'успешно':>8} {'ошибок':>7} {'оп/с':>8} {'p50, мс':>8} {'p99, мс':>8}")
+    for mode in modes:
+        result = run(mode, args.processes, args.users, args.writes)
+        print(
+            f"{result['mode']:<8} {result['ok']:>8} {result['errors']:>7} "
+            f"{result['ops_per_second']:>8.0f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
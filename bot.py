@@ -12,14 +12,19 @@ from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
+    ChatMemberHandler,
     MessageHandler,
+    TypeHandler,
     filters,
     ContextTypes
 )
 
 from models import init_db
 from utils import error_handler, global_error_handler, practices_manager
-from utils.scheduler import init_scheduler, schedule_user_reminders, stop_scheduler
+from utils.scheduler import init_scheduler, schedule_user_reminders, schedule_backups, schedule_archival, stop_scheduler
+from utils.outbound import TelegramRateLimiter, telegram_outbound
+from utils.dedupe import TelegramDedupeApplication, telegram_dedupe_handler, telegram_update_mark
+from utils.session_state import session_state
 
 # Импортируем обработчики из handlers/
 from handlers import (
@@ -45,15 +50,19 @@ from handlers import (
     reload_practices_command,
     handle_web_app_data,
 )
-from handlers.admin import admin_test_command
+from handlers.admin import (
+    admin_test_command, admin_metrics_command, admin_stats_command, admin_analytics_command,
+    admin_backup_command,
+)
+from handlers.user import handle_my_chat_member
 from handlers.admin_test import handle_admin_test_callback
 from handlers.admin_fast_test import (
     test_wait_scheduler_command,
     test_status_command,
     test_reset_command,
-    admin_check_user_command,
-    admin_users_command
+    admin_check_user_command
 )
+from handlers.admin_users import admin_users_command, handle_admin_users_callback
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -115,6 +124,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pass
 
 
+async def flush_on_shutdown(application: Application):
+    """При остановке записать в БД то, что ещё ждёт отложенной записи"""
+    try:
+        session_state.flush()
+    except Exception as e:
+        logger.error(f"Не удалось записать состояние диалогов при остановке: {e}")
+    try:
+        telegram_update_mark.save()
+    except Exception as e:
+        logger.error(f"Не удалось записать отметку апдейтов при остановке: {e}")
+
+
 # ============================================================================
 # ГЛАВНАЯ ФУНКЦИЯ
 # ============================================================================
@@ -141,7 +162,20 @@ def main():
 
     # Создать приложение
     logger.info("Создание приложения...")
-    application = Application.builder().token(token).build()
+    # Все отправки идут через приоритетную очередь: ответы на кнопки
+    # обгоняют рассылку напоминаний и не упираются в лимиты Telegram
+    # Отметка обработанных апдейтов сдвигается после обработчиков (utils.dedupe)
+    application = (
+        Application.builder()
+        .application_class(TelegramDedupeApplication)
+        .token(token)
+        .rate_limiter(TelegramRateLimiter(telegram_outbound))
+        .post_shutdown(flush_on_shutdown)
+        .build()
+    )
+
+    # Повторные доставки и двойные нажатия отсекаются до всех обработчиков
+    application.add_handler(TypeHandler(Update, telegram_dedupe_handler), group=-1)
 
     # Зарегистрировать обработчики команд
     application.add_handler(CommandHandler("start", start_command))
@@ -161,6 +195,10 @@ def main():
     # Админские команды
     application.add_handler(CommandHandler("reload_practices", reload_practices_command))
     application.add_handler(CommandHandler("admin_test", admin_test_command))
+    application.add_handler(CommandHandler("admin_metrics", admin_metrics_command))
+    application.add_handler(CommandHandler("admin_stats", admin_stats_command))
+    application.add_handler(CommandHandler("admin_analytics", admin_analytics_command))
+    application.add_handler(CommandHandler("admin_backup", admin_backup_command))
 
     # Тестовые команды для проверки автоматической работы scheduler (только для админов)
     application.add_handler(CommandHandler("test_wait_scheduler", test_wait_scheduler_command))
@@ -171,8 +209,9 @@ def main():
 
     # Обработчик нажатий на кнопки (callback_query)
     # Используем паттерны для разных типов кнопок
-    application.add_handler(CallbackQueryHandler(handle_practice_callback, pattern="^(next_step|prev_step|complete_stage|show_examples_menu|toggle_category_.*|continue_from_examples|show_recipes|expand_recipe_.*|collapse_recipe_.*|show_manifesto|start_daily_practices|sprouts_appeared|continue_practice|confirm_reset|cancel_reset|test_daily_reminder|start_daily_substep|next_daily_substep|prev_daily_substep|daily_choice_A|daily_choice_B|complete_day4_practice|test_stage4_reminder|postpone_reminder|start_waiting_for_daily|stage5_start_substep|stage5_next_substep|stage5_prev_substep|start_stage6_finale|stage1_tz_.*|stage1_time_.*|replant_start|replant_step_\\d+|replant_complete|mold_start|mold_complete|mold_sprouts_start|mold_sprouts_complete|all_dead_step_\\d+|all_dead_complete)$"))
+    application.add_handler(CallbackQueryHandler(handle_practice_callback, pattern="^(next_step|prev_step|complete_stage|show_examples_menu|toggle_category_.*|continue_from_examples|show_recipes|expand_recipe_.*|collapse_recipe_.*|show_manifesto|start_daily_practices|sprouts_appeared|continue_practice|confirm_reset|cancel_reset|test_daily_reminder|start_daily_substep|next_daily_substep|prev_daily_substep|daily_choice_A|daily_choice_B|complete_day4_practice|test_stage4_reminder|postpone_reminder|start_waiting_for_daily|stage5_start_substep|stage5_next_substep|stage5_prev_substep|start_stage6_finale|stage1_tz_.*|stage1_time_.*|replant_start|replant_step_\\d+|replant_complete|mold_start|mold_complete|mold_sprouts_start|mold_sprouts_complete|all_dead_step_\\d+|all_dead_complete)(\\|.*)?$"))
     application.add_handler(CallbackQueryHandler(handle_admin_test_callback, pattern="^(admin_test_day[1-4]|admin_test_stage4|admin_test_stage5_menu|admin_test_stage5_day[1-7]|admin_test_stage6|admin_test_stage2_menu|admin_test_stage2_day[2-5]|admin_refresh_status)$"))
+    application.add_handler(CallbackQueryHandler(handle_admin_users_callback, pattern="^admin_users:(next|prev):\\d+$"))
     application.add_handler(CallbackQueryHandler(handle_time_callback, pattern="^time_"))
     application.add_handler(CallbackQueryHandler(handle_timezone_callback, pattern="^tz_"))
     application.add_handler(CallbackQueryHandler(handle_start_callback, pattern="^start_"))
@@ -190,13 +229,19 @@ def main():
     # Обработчик текстовых сообщений (игнорируем остальные)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
+    # Блокировка/разблокировка бота пользователем: рассылка пропускает заблокировавших
+    application.add_handler(ChatMemberHandler(handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+
     # Глобальный обработчик ошибок
     application.add_error_handler(global_error_handler)
 
     # Инициализировать планировщик напоминаний
     logger.info("Инициализация планировщика напоминаний...")
     init_scheduler()
-    schedule_user_reminders(application.bot)
+    # Только Telegram: напоминания VK рассылает vk_bot.py
+    schedule_user_reminders(application.bot, platforms=('telegram',))
+    schedule_backups()
+    schedule_archival()
     logger.info("Планировщик настроен (проверка каждый час)")
 
     # Запустить бота
@@ -2,7 +2,12 @@
 Обработчики админских команд:
 /reload_practices - перезагрузить practices.json
 /admin_test - тестовое меню для админов
+/admin_metrics - метрики процесса (очереди отправки, задержки)
+/admin_stats - сводка пройденных шагов по этапам и дням
+/admin_analytics - воронка, время между этапами и удержание
+/admin_backup - резервная копия БД сейчас и последние копии
 """
+import asyncio
 import logging
 import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -124,3 +129,155 @@ async def admin_test_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     finally:
         db.close()
+
+
+@error_handler
+async def admin_metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /admin_metrics - снимок метрик процесса"""
+    user = update.effective_user
+
+    if not is_admin(user.id):
+        await update.message.reply_text(
+            "⛔ У вас нет прав для выполнения этой команды."
+        )
+        logger.warning(f"Пользователь {user.id} ({user.username}) попытался выполнить /admin_metrics без прав")
+        return
+
+    from utils.metrics import metrics
+    from utils.outbound import telegram_outbound, vk_outbound
+    from utils.session_state import session_state
+
+    snapshot = metrics.snapshot()
+    lines = ["📈 Метрики процесса", ""]
+
+    lines.append("Очереди отправки (ожидают):")
+    for queue in (telegram_outbound, vk_outbound):
+        pending = ", ".join(f"{name}={count}" for name, count in queue.stats().items())
+        lines.append(f"• {queue.name}: {pending}")
+
+    state = session_state.stats()
+    lines += [
+        "",
+        f"Состояние диалогов: {state['entries']}/{state['max_entries']} записей, "
+        f"~{state['approx_bytes'] // 1024} КБ, ждут записи {state['pending_writes']}, "
+        f"hits={state['hits']} misses={state['misses']} evictions={state['evictions']}",
+    ]
+
+    if snapshot['latency']:
+        lines += ["", "Задержки (p50 / p99, мс):"]
+        for name, data in sorted(snapshot['latency'].items()):
+            lines.append(
+                f"• {name}: {data['p50'] * 1000:.0f} / {data['p99'] * 1000:.0f} (n={data['count']})"
+            )
+
+    if snapshot['counters']:
+        lines += ["", "Счётчики:"]
+        lines += [f"• {name}: {value}" for name, value in sorted(snapshot['counters'].items())]
+
+    if snapshot['gauges']:
+        lines += ["", "Значения:"]
+        lines += [f"• {name}: {value}" for name, value in sorted(snapshot['gauges'].items())]
+
+    # Без parse_mode: в именах метрик есть символы разметки
+    await update.message.reply_text("\n".join(lines))
+
+
+@error_handler
+async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /admin_stats - сводка прогресса по этапам и дням"""
+    user = update.effective_user
+
+    if not is_admin(user.id):
+        await update.message.reply_text(
+            "⛔ У вас нет прав для выполнения этой команды."
+        )
+        logger.warning(f"Пользователь {user.id} ({user.username}) попытался выполнить /admin_stats без прав")
+        return
+
+    from models import SessionLocal
+    from utils.db import get_progress_counters
+
+    db = SessionLocal()
+    try:
+        # Готовые счётчики — чтение не зависит от размера истории
+        counters = get_progress_counters(db)
+    finally:
+        db.close()
+
+    lines = ["📊 Пройдено шагов", ""]
+    lines.append(f"Всего: {sum(counters['stage'].values())}")
+    if counters['stage']:
+        lines += ["", "По этапам:"]
+        lines += [f"• Этап {stage}: {count}" for stage, count in sorted(counters['stage'].items())]
+    if counters['day']:
+        lines += ["", "По дням практики:"]
+        lines += [f"• День {day}: {count}" for day, count in sorted(counters['day'].items())]
+
+    await update.message.reply_text("\n".join(lines))
+
+
+@error_handler
+async def admin_analytics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработчик команды /admin_analytics - когортный отчёт
+    Использование: /admin_analytics [week|tz|platform]
+    """
+    user = update.effective_user
+
+    if not is_admin(user.id):
+        await update.message.reply_text(
+            "⛔ У вас нет прав для выполнения этой команды."
+        )
+        logger.warning(f"Пользователь {user.id} ({user.username}) попытался выполнить /admin_analytics без прав")
+        return
+
+    by = (context.args or [None])[0]
+    if by not in (None, 'week', 'tz', 'platform'):
+        await update.message.reply_text("Использование: /admin_analytics [week|tz|platform]")
+        return
+
+    from models import SessionLocal
+    from utils.analytics import build_report, render_report
+
+    def build():
+        db = SessionLocal()
+        try:
+            return build_report(db, by=by)
+        finally:
+            db.close()
+
+    await update.message.reply_text("⏳ Считаю отчёт...")
+    # Отчёт читает всю историю — не держим event loop
+    report = await asyncio.to_thread(build)
+    # Без parse_mode: метки групп (часовые пояса) не экранируются
+    await update.message.reply_text(render_report(report))
+
+
+@error_handler
+async def admin_backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /admin_backup - сделать копию БД без остановки бота"""
+    user = update.effective_user
+
+    if not is_admin(user.id):
+        await update.message.reply_text(
+            "⛔ У вас нет прав для выполнения этой команды."
+        )
+        logger.warning(f"Пользователь {user.id} ({user.username}) попытался выполнить /admin_backup без прав")
+        return
+
+    from utils.backup import read_history, run_backup
+
+    await update.message.reply_text("⏳ Делаю копию БД...")
+    try:
+        record = await run_backup()
+    except Exception as e:
+        logger.error(f"Ошибка /admin_backup: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ Копия не создана: {e}")
+        return
+
+    lines = [f"✅ {record['path']}", f"{record['bytes'] / 1024 / 1024:.1f} МБ за {record['seconds']} с", "", "Последние копии:"]
+    lines += [
+        f"• {entry['finished_at']}: {entry['bytes'] / 1024 / 1024:.1f} МБ, {entry['seconds']} с"
+        for entry in read_history()
+    ]
+    await update.message.reply_text("\n".join(lines))
@@ -398,61 +398,3 @@ async def admin_check_user_command(update: Update, context: ContextTypes.DEFAULT
 
     finally:
         db.close()
-
-
-@error_handler
-async def admin_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Показать список всех пользователей бота
-    Использование: /admin_users
-    """
-    user = update.effective_user
-
-    if not is_admin(user.id):
-        await update.message.reply_text("⛔ Недостаточно прав")
-        return
-
-    db = SessionLocal()
-    try:
-        # Отладка: проверяем подключение к БД
-        from sqlalchemy import text
-        result = db.execute(text("SELECT telegram_id, username, first_name, current_stage FROM users"))
-        rows = result.fetchall()
-
-        if not rows:
-            import os
-            db_url = os.getenv('DATABASE_URL', 'НЕ ЗАДАН (используется sqlite)')
-            # Скрыть пароль если есть
-            if '@' in db_url:
-                db_url = db_url.split('@')[1]
-            await update.message.reply_text(
-                f"0 записей в таблице users.\n\n"
-                f"БД: {db_url}"
-            )
-            return
-
-        users = rows
-
-        lines = [f"Все пользователи ({len(users)}):\n"]
-        for row in users:
-            tid, uname, fname, stage = row
-            username = f"@{uname}" if uname else "(нет)"
-            name = fname or "(нет имени)"
-            stage_str = stage or "-"
-            lines.append(f"{tid} | {name} | {username} | Stage {stage_str}")
-
-        text = "\n".join(lines)
-
-        if len(text) > 4000:
-            for i in range(0, len(lines), 30):
-                chunk = "\n".join(lines[i:i+30])
-                await update.message.reply_text(chunk)
-        else:
-            await update.message.reply_text(text)
-
-    except Exception as e:
-        logger.error(f"Ошибка в /admin_users: {e}")
-        await update.message.reply_text(f"❌ Ошибка: {e}")
-
-    finally:
-        db.close()
@@ -7,6 +7,7 @@ from telegram.ext import ContextTypes
 from models import SessionLocal, User
 from handlers.admin import ADMIN_IDS
 from utils.scheduler import send_daily_practice_reminder, send_stage4_reminder, send_stage5_daily_reminder, send_stage6_reminder, send_stage2_sprouts_reminder
+from utils.message_edit import edit_message_text
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +22,7 @@ async def handle_admin_test_callback(update: Update, context: ContextTypes.DEFAU
 
     # Проверка прав администратора
     if user.id not in ADMIN_IDS:
-        await query.edit_message_text("⛔ У вас нет прав для выполнения этой команды.")
+        await edit_message_text(query, "⛔ У вас нет прав для выполнения этой команды.")
         return
 
     db = SessionLocal()
@@ -30,7 +31,7 @@ async def handle_admin_test_callback(update: Update, context: ContextTypes.DEFAU
         db_user = db.query(User).filter(User.telegram_id == user.id).first()
 
         if not db_user:
-            await query.edit_message_text("❌ Пользователь не найден в БД")
+            await edit_message_text(query, "❌ Пользователь не найден в БД")
             return
 
         if action == "admin_refresh_status":
@@ -60,7 +61,8 @@ async def handle_admin_test_callback(update: Update, context: ContextTypes.DEFAU
                 [InlineKeyboardButton("📊 Обновить статус", callback_data="admin_refresh_status")],
             ]
 
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 status_text,
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode='Markdown'
@@ -127,7 +129,8 @@ async def handle_admin_test_callback(update: Update, context: ContextTypes.DEFAU
                 [InlineKeyboardButton("← Назад", callback_data="admin_refresh_status")],
             ]
 
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 status_text,
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode='Markdown'
@@ -171,7 +174,8 @@ async def handle_admin_test_callback(update: Update, context: ContextTypes.DEFAU
                 [InlineKeyboardButton("← Назад", callback_data="admin_refresh_status")],
             ]
 
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 status_text,
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode='Markdown'
@@ -0,0 +1,143 @@
+"""
+Просмотр пользователей для админов: /admin_users
+
+Использование: /admin_users [tg|vk] [stage=N] [paused|active] [начало имени]
+Примеры:
+- /admin_users
+- /admin_users vk stage=3
+- /admin_users paused ann
+
+Страницы листаются кнопками; каждая страница — один небольшой запрос
+с keyset-пагинацией по id (см. utils.db.list_users_page). Фильтр
+запоминается в состоянии диалога админа, а в кнопке — только курсор.
+"""
+import logging
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+from models import SessionLocal
+from utils import error_handler
+from utils.db import list_users_page
+from utils.message_edit import edit_message_text
+from utils.session_state import session_state
+from handlers.admin import is_admin
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 15
+FILTER_FIELD = 'admin_users_filter'
+
+PLATFORM_ALIASES = {'tg': 'telegram', 'telegram': 'telegram', 'vk': 'vk'}
+
+
+def parse_filters(args) -> dict:
+    """Разобрать аргументы команды в фильтр для list_users_page"""
+    filters = {}
+    search = []
+    for arg in args:
+        lowered = arg.lower()
+        if lowered in PLATFORM_ALIASES:
+            filters['platform'] = PLATFORM_ALIASES[lowered]
+        elif lowered.startswith('stage=') and lowered[6:].isdigit():
+            filters['stage'] = int(lowered[6:])
+        elif lowered == 'paused':
+            filters['paused'] = True
+        elif lowered == 'active':
+            filters['paused'] = False
+        else:
+            search.append(arg.lstrip('@'))
+    if search:
+        filters['search'] = " ".join(search)
+    return filters
+
+
+def _describe(filters: dict) -> str:
+    parts = []
+    if filters.get('platform'):
+        parts.append(filters['platform'])
+    if filters.get('stage') is not None:
+        parts.append(f"этап {filters['stage']}")
+    if filters.get('paused') is not None:
+        parts.append("на паузе" if filters['paused'] else "без паузы")
+    if filters.get('search'):
+        parts.append(f"«{filters['search']}…»")
+    return ", ".join(parts) or "все"
+
+
+def render_page(filters: dict, after_id: int = None, before_id: int = None):
+    """
+    Текст и клавиатура страницы
+
+    Returns:
+        tuple: (text, InlineKeyboardMarkup или None)
+    """
+    db = SessionLocal()
+    try:
+        rows, has_prev, has_next = list_users_page(
+            db, after_id=after_id, before_id=before_id, limit=PAGE_SIZE, **filters
+        )
+    finally:
+        db.close()
+
+    lines = [f"👥 Пользователи ({_describe(filters)})", ""]
+    if not rows:
+        lines.append("Никого не найдено.")
+    for row in rows:
+        platform_id = row.telegram_id if row.platform == 'telegram' else row.vk_id
+        prefix = "vk:" if row.platform == 'vk' else ""
+        username = f"@{row.username}" if row.username else "(нет)"
+        flags = ("⏸" if row.is_paused else "") + ("" if row.is_active else " 🚫")
+        lines.append(
+            f"{prefix}{platform_id} | {row.first_name or '(нет имени)'} | {username} | "
+            f"Stage {row.current_stage or '-'} {flags}".rstrip()
+        )
+
+    buttons = []
+    if rows and has_prev:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"admin_users:prev:{rows[0].id}"))
+    if rows and has_next:
+        buttons.append(InlineKeyboardButton("Далее ▶️", callback_data=f"admin_users:next:{rows[-1].id}"))
+    keyboard = InlineKeyboardMarkup([buttons]) if buttons else None
+    return "\n".join(lines), keyboard
+
+
+@error_handler
+async def admin_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Показать первую страницу пользователей
+    Использование: /admin_users [tg|vk] [stage=N] [paused|active] [начало имени]
+    """
+    user = update.effective_user
+
+    if not is_admin(user.id):
+        await update.message.reply_text("⛔ Недостаточно прав")
+        return
+
+    filters = parse_filters(context.args or [])
+    session_state.set('telegram', user.id, FILTER_FIELD, filters)
+
+    text, keyboard = render_page(filters)
+    # Без parse_mode: в username бывают символы разметки
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+@error_handler
+async def handle_admin_users_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание страниц /admin_users (callback_data: admin_users:next|prev:<id>)"""
+    query = update.callback_query
+    user = update.effective_user
+
+    if not is_admin(user.id):
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+
+    _, direction, cursor = query.data.split(':')
+    filters = session_state.get('telegram', user.id, FILTER_FIELD, {})
+    if direction == 'next':
+        text, keyboard = render_page(filters, after_id=int(cursor))
+    else:
+        text, keyboard = render_page(filters, before_id=int(cursor))
+
+    await edit_message_text(query, text, reply_markup=keyboard)
@@ -5,9 +5,15 @@
 import logging
 import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 from utils import error_handler, practices_manager
 from utils.db import get_or_create_user, update_user_progress
+from utils.message_edit import edit_message_text
+from utils.accordion import render_examples, render_recipes
+from utils.session_state import session_state
+from utils import callback_codec
+from utils.metrics import metrics
 from models import SessionLocal, User
 from handlers.admin import is_admin, ADMIN_IDS
 from utils.scheduler import send_daily_practice_reminder
@@ -19,19 +25,21 @@ logger = logging.getLogger(__name__)
 TIMER_WEBAPP_URL = "https://ana-soroka.github.io/Sogreto_bot/webapp/timer.html?v=5"
 
 
-def create_practice_keyboard(buttons_data):
+def create_practice_keyboard(buttons_data, stage=None, step=None):
     """
     Создать InlineKeyboard из данных кнопок практики
 
     Args:
         buttons_data: список словарей с keys 'text' и 'action'
+        stage, step: Шаг, на котором показаны кнопки — кнопки навигации
+            получают контекст шага (см. utils.callback_codec)
 
     Returns:
         InlineKeyboardMarkup с кнопками
     """
     keyboard = []
     for button in buttons_data:
-        callback_data = button.get('action', 'unknown')
+        callback_data = callback_codec.encode(button.get('action', 'unknown'), stage, step)
         button_text = button.get('text', 'Продолжить')
         keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
 
@@ -91,7 +99,7 @@ async def start_practice_command(update: Update, context: ContextTypes.DEFAULT_T
 
         # Создать клавиатуру с кнопками
         buttons = first_step.get('buttons', [])
-        keyboard = create_practice_keyboard(buttons)
+        keyboard = create_practice_keyboard(buttons, stage=1, step=1)
 
         # Отправить практику с кнопками
         await update.message.reply_text(
@@ -166,7 +174,8 @@ async def _send_substep_message(query, substep):
         buttons = substep.get('buttons', [])
         keyboard = create_practice_keyboard(buttons) if buttons else None
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         full_message,
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -187,14 +196,14 @@ async def handle_start_daily_substep(query, user, db):
     stage = practices_manager.get_stage(3)
     if not stage:
         logger.error("Этап 3 не найден в practices.json")
-        await query.edit_message_text("Ошибка: этап не найден")
+        await edit_message_text(query, "Ошибка: этап не найден")
         return
 
     daily_practice = _get_daily_practice_by_day(stage, current_day)
 
     if not daily_practice:
         logger.error(f"Практика дня {current_day} не найдена")
-        await query.edit_message_text(f"Ошибка: практика дня {current_day} не найдена")
+        await edit_message_text(query, f"Ошибка: практика дня {current_day} не найдена")
         return
 
     # Установить текущий подшаг = "intro"
@@ -206,7 +215,7 @@ async def handle_start_daily_substep(query, user, db):
 
     if not substep:
         logger.error(f"Подшаг 'intro' не найден для дня {current_day}")
-        await query.edit_message_text("Ошибка: подшаг не найден")
+        await edit_message_text(query, "Ошибка: подшаг не найден")
         return
 
     # Отправить сообщение подшага
@@ -228,13 +237,13 @@ async def handle_next_daily_substep(query, user, db, context):
     stage = practices_manager.get_stage(3)
     if not stage:
         logger.error("Этап 3 не найден в practices.json")
-        await query.edit_message_text("Ошибка: этап не найден")
+        await edit_message_text(query, "Ошибка: этап не найден")
         return
 
     daily_practice = _get_daily_practice_by_day(stage, current_day)
     if not daily_practice:
         logger.error(f"Практика дня {current_day} не найдена")
-        await query.edit_message_text(f"Ошибка: практика дня {current_day} не найдена")
+        await edit_message_text(query, f"Ошибка: практика дня {current_day} не найдена")
         return
 
     # Определить следующий подшаг
@@ -252,7 +261,7 @@ async def handle_next_daily_substep(query, user, db, context):
 
     if not substep:
         logger.error(f"Подшаг '{next_substep_id}' не найден для дня {current_day}")
-        await query.edit_message_text("Ошибка: подшаг не найден")
+        await edit_message_text(query, "Ошибка: подшаг не найден")
         return
 
     # Обновить текущий подшаг
@@ -299,19 +308,19 @@ async def _send_response_substep(query, user, db, context, substep_id):
     stage = practices_manager.get_stage(3)
     if not stage:
         logger.error("Этап 3 не найден в practices.json")
-        await query.edit_message_text("Ошибка: этап не найден")
+        await edit_message_text(query, "Ошибка: этап не найден")
         return
 
     daily_practice = _get_daily_practice_by_day(stage, current_day)
     if not daily_practice:
         logger.error(f"Практика дня {current_day} не найдена")
-        await query.edit_message_text(f"Ошибка: практика дня {current_day} не найдена")
+        await edit_message_text(query, f"Ошибка: практика дня {current_day} не найдена")
         return
 
     substep = _get_substep_by_id(daily_practice, substep_id)
     if not substep:
         logger.error(f"Подшаг '{substep_id}' не найден для дня {current_day}")
-        await query.edit_message_text("Ошибка: подшаг не найден")
+        await edit_message_text(query, "Ошибка: подшаг не найден")
         return
 
     # Отправить сообщение с кнопками
@@ -330,7 +339,7 @@ async def _complete_daily_practice_flow(query, user, db, final_substep):
 
     # Отправить финальное сообщение
     message = final_substep.get('message', '')
-    await query.edit_message_text(message, parse_mode='Markdown')
+    await edit_message_text(query, message, parse_mode='Markdown')
 
     # Проверить, был ли это последний день
     if current_day >= 4:
@@ -393,13 +402,13 @@ async def handle_prev_daily_substep(query, user, db):
     stage = practices_manager.get_stage(3)
     if not stage:
         logger.error("Этап 3 не найден в practices.json")
-        await query.edit_message_text("Ошибка: этап не найден")
+        await edit_message_text(query, "Ошибка: этап не найден")
         return
 
     daily_practice = _get_daily_practice_by_day(stage, current_day)
     if not daily_practice:
         logger.error(f"Практика дня {current_day} не найдена")
-        await query.edit_message_text(f"Ошибка: практика дня {current_day} не найдена")
+        await edit_message_text(query, f"Ошибка: практика дня {current_day} не найдена")
         return
 
     prev_substep_data = _get_substep_by_id(daily_practice, prev_substep)
@@ -420,12 +429,24 @@ async def handle_practice_callback(update: Update, context: ContextTypes.DEFAULT
     Обработчик нажатий на кнопки практик (callback_query)
     """
     query = update.callback_query
-    await query.answer()  # Подтвердить нажатие кнопки
+    callback = callback_codec.decode(query.data)
+    action = callback.action
 
     user_id = update.effective_user.id
-    action = query.data  # Получить action из callback_data
-
-    logger.info(f"Пользователь {user_id} нажал кнопку: {action}")
+    logger.info(f"Пользователь {user_id} нажал кнопку: {query.data}")
+
+    # Устаревшую кнопку отклонить по её данным, не загружая пользователя
+    reason = callback_codec.stale_reason(callback)
+    if reason:
+        metrics.inc(f'callback.stale.{reason}')
+        await query.answer(callback_codec.STALE_BUTTON_TEXT, show_alert=True)
+        logger.info(f"Пользователь {user_id}: кнопка {query.data} устарела ({reason})")
+        return
+    # Кнопку с контекстом шага подтверждаем после сверки с прогрессом (чтобы
+    # показать подсказку), но в finally — даже если до сверки что-то упало
+    answered = not callback.has_context
+    if answered:
+        await query.answer()  # Подтвердить нажатие кнопки
 
     db = SessionLocal()
     try:
@@ -437,6 +458,20 @@ async def handle_practice_callback(update: Update, context: ContextTypes.DEFAULT
             last_name=update.effective_user.last_name
         )
 
+        # Кнопка навигации с чужого шага не должна сдвигать прогресс
+        if callback.has_context:
+            if not callback_codec.matches_progress(callback, user.current_stage, user.current_step):
+                metrics.inc('callback.stale.progress')
+                answered = True
+                await query.answer(callback_codec.STALE_BUTTON_TEXT, show_alert=True)
+                logger.info(
+                    f"Пользователь {user_id}: кнопка шага {callback.stage}.{callback.step} "
+                    f"нажата на шаге {user.current_stage}.{user.current_step}"
+                )
+                return
+            answered = True
+            await query.answer()
+
         # Обработать разные действия
         if action == "next_step":
             await handle_next_step(query, user, db)
@@ -446,32 +481,24 @@ async def handle_practice_callback(update: Update, context: ContextTypes.DEFAULT
             await handle_complete_stage(query, user, db)
         elif action == "show_examples_menu":
             # Сбросить состояние при входе в меню
-            context.user_data['opened_categories'] = set()
+            session_state.delete('telegram', user_id, 'opened_categories')
             await handle_show_examples(query, user, db)
         elif action.startswith("toggle_category_"):
             # Извлечь ID категории из callback_data
             category_id = action.replace("toggle_category_", "")
-            # Получить или создать set открытых категорий
-            if 'opened_categories' not in context.user_data:
-                context.user_data['opened_categories'] = set()
-            opened_categories = context.user_data['opened_categories']
-            await handle_category_toggle(query, user, db, category_id, opened_categories)
+            await handle_category_toggle(query, user, db, category_id)
         elif action == "continue_from_examples":
             # Очистить состояние и вернуться к практике
-            context.user_data.pop('opened_categories', None)
+            session_state.delete('telegram', user_id, 'opened_categories')
             await handle_next_step(query, user, db)
         elif action == "show_recipes":
             # Сбросить состояние при входе в меню рецептов
-            context.user_data['opened_recipes'] = set()
-            await handle_show_recipes(query, user, db, context)
+            session_state.delete('telegram', user_id, 'opened_recipes')
+            await handle_show_recipes(query, user, db)
         elif action.startswith("expand_recipe_") or action.startswith("collapse_recipe_"):
             # Извлечь ID рецепта из callback_data
             recipe_id = action.replace("expand_recipe_", "").replace("collapse_recipe_", "")
-            # Получить или создать set открытых рецептов
-            if 'opened_recipes' not in context.user_data:
-                context.user_data['opened_recipes'] = set()
-            opened_recipes = context.user_data['opened_recipes']
-            await handle_recipe_toggle(query, user, db, recipe_id, opened_recipes, context)
+            await handle_recipe_toggle(query, user, db, recipe_id)
         elif action == "start_waiting_for_daily":
             await handle_start_waiting_for_daily(query, user, db)
         elif action == "complete_daily_practice":
@@ -543,7 +570,8 @@ async def handle_practice_callback(update: Update, context: ContextTypes.DEFAULT
         elif action == "all_dead_complete":
             await handle_all_dead_complete(query, user, db)
         else:
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 f"Действие '{action}' пока не реализовано.\n"
                 f"Скоро будет добавлено! 🌱"
             )
@@ -551,6 +579,11 @@ async def handle_practice_callback(update: Update, context: ContextTypes.DEFAULT
 
     finally:
         db.close()
+        if not answered:
+            try:
+                await query.answer()
+            except TelegramError as e:
+                logger.warning(f"Не удалось подтвердить нажатие {query.data}: {e}")
 
 
 async def handle_next_step(query, user, db):
@@ -561,7 +594,7 @@ async def handle_next_step(query, user, db):
     # Получить текущий этап
     stage = practices_manager.get_stage(current_stage)
     if not stage:
-        await query.edit_message_text("Ошибка: этап не найден")
+        await edit_message_text(query, "Ошибка: этап не найден")
         return
 
     steps = stage.get('steps', [])
@@ -584,10 +617,11 @@ async def handle_next_step(query, user, db):
 
         # Создать клавиатуру
         buttons = next_step.get('buttons', [])
-        keyboard = create_practice_keyboard(buttons)
+        keyboard = create_practice_keyboard(buttons, stage=current_stage, step=next_step_id)
 
         # Отправить следующий шаг
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             message,
             reply_markup=keyboard,
             parse_mode='Markdown'
@@ -596,7 +630,8 @@ async def handle_next_step(query, user, db):
         logger.info(f"Пользователь {user.telegram_id} перешел на шаг {next_step_id} этапа {current_stage}")
     else:
         # Шагов больше нет в текущем этапе
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             f"Этап {current_stage} завершен! 🎉\n\n"
             f"Следующий этап будет доступен позже.\n"
             f"Используйте /status чтобы увидеть прогресс."
@@ -616,7 +651,7 @@ async def handle_prev_step(query, user, db):
     # Получить текущий этап
     stage = practices_manager.get_stage(current_stage)
     if not stage:
-        await query.edit_message_text("Ошибка: этап не найден")
+        await edit_message_text(query, "Ошибка: этап не найден")
         return
 
     steps = stage.get('steps', [])
@@ -639,10 +674,11 @@ async def handle_prev_step(query, user, db):
 
         # Создать клавиатуру
         buttons = prev_step.get('buttons', [])
-        keyboard = create_practice_keyboard(buttons)
+        keyboard = create_practice_keyboard(buttons, stage=current_stage, step=prev_step_id)
 
         # Отправить предыдущий шаг
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             message,
             reply_markup=keyboard,
             parse_mode='Markdown'
@@ -650,7 +686,7 @@ async def handle_prev_step(query, user, db):
 
         logger.info(f"Пользователь {user.telegram_id} вернулся на шаг {prev_step_id} этапа {current_stage}")
     else:
-        await query.edit_message_text("Ошибка: предыдущий шаг не найден")
+        await edit_message_text(query, "Ошибка: предыдущий шаг не найден")
 
 
 async def handle_complete_stage(query, user, db):
@@ -672,7 +708,8 @@ async def handle_complete_stage(query, user, db):
             [InlineKeyboardButton("🇷🇺 Владивосток (UTC+10)", callback_data="stage1_tz_Asia/Vladivostok")],
         ]
 
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             f"🌍 **Настройка часового пояса**\n\n"
             f"Прежде чем продолжить, давай настроим напоминания!\n\n"
             f"Выбери свой часовой пояс, чтобы напоминания приходили вовремя:",
@@ -719,7 +756,8 @@ async def handle_complete_stage(query, user, db):
 
                 keyboard = InlineKeyboardMarkup(keyboard_buttons)
 
-                await query.edit_message_text(
+                await edit_message_text(
+                    query,
                     message,
                     reply_markup=keyboard,
                     parse_mode='Markdown'
@@ -728,7 +766,7 @@ async def handle_complete_stage(query, user, db):
                 return
 
         # Fallback если не нашли переходный шаг
-        await query.edit_message_text("Ошибка: переходное сообщение этапа 3 не найдено")
+        await edit_message_text(query, "Ошибка: переходное сообщение этапа 3 не найдено")
         return
 
     # Перейти к следующему этапу
@@ -741,7 +779,8 @@ async def handle_complete_stage(query, user, db):
         # Обновить прогресс: новый этап, первый шаг
         update_user_progress(db, user.telegram_id, stage_id=next_stage, step_id=1, day=user.current_day)
 
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             f"🎉 Этап {current_stage} завершён!\n\n"
             f"Переходим к этапу {next_stage}: **{stage.get('stage_name', 'Следующий этап')}**\n\n"
             f"Следующая практика придёт позже (автоматические напоминания будут реализованы на следующем этапе).\n\n"
@@ -753,7 +792,8 @@ async def handle_complete_stage(query, user, db):
         user.current_stage = 7
         db.commit()
 
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             f"🎊 **ПОЗДРАВЛЯЕМ!** 🎊\n\n"
             f"Вы завершили все практики предвкушения!\n\n"
             f"Вы прошли путь от семечка до урожая. 🌱"
@@ -795,7 +835,8 @@ async def handle_stage1_timezone(query, user, db, action):
         ],
     ]
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         f"⏰ **Настройка времени напоминаний**\n\n"
         f"Часовой пояс: **{timezone_str}** ✓\n\n"
         f"Теперь выбери время, в которое тебе удобно получать напоминания о проверке всходов:",
@@ -825,7 +866,8 @@ async def handle_stage1_time(query, user, db, action):
         [InlineKeyboardButton("🌱 Появились первые всходы!", callback_data="sprouts_appeared")]
     ])
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         f"🎉 **Этап 1 завершён!**\n\n"
         f"Отличная работа! Семена посажены, и теперь начинается самое волнующее — ожидание.\n\n"
         f"⏰ Напоминания настроены: **{time_str}** ({user.timezone})\n\n"
@@ -845,7 +887,8 @@ async def handle_sprouts_appeared(query, user, db):
     """Обработать нажатие кнопки 'У меня появились первые всходы!'"""
     # Проверить, что пользователь на Этапе 1
     if user.current_stage != 1:
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             "Эта функция доступна только на Этапе 1 (после посадки).\n\n"
             "Используйте /status для проверки вашего прогресса."
         )
@@ -861,7 +904,7 @@ async def handle_sprouts_appeared(query, user, db):
     # Получить первый шаг Этапа 2
     stage2 = practices_manager.get_stage(2)
     if not stage2:
-        await query.edit_message_text("Ошибка: не найден Этап 2")
+        await edit_message_text(query, "Ошибка: не найден Этап 2")
         return
 
     first_step = stage2['steps'][0]
@@ -876,7 +919,8 @@ async def handle_sprouts_appeared(query, user, db):
     keyboard = create_practice_keyboard(buttons)
 
     # Отправить новый этап
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         message,
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -891,61 +935,19 @@ async def handle_show_examples(query, user, db, opened_categories=None):
     Args:
         opened_categories: set строк с id открытых категорий
     """
-    if opened_categories is None:
-        opened_categories = set()
-
-    examples = practices_manager.get_examples_menu()
-
-    message = f"**{examples.get('title', 'Примеры желаний')}**\n\n"
-    message += examples.get('message', '') + "\n\n"
-
-    categories = examples.get('categories', [])
-    keyboard = []
-
-    # Создаём кнопки для каждой категории
-    for category in categories:
-        cat_id = category.get('id', '')
-        is_open = cat_id in opened_categories
-
-        # Иконка стрелки: вниз если открыто, вправо если закрыто
-        arrow = "🔽" if is_open else "▶️"
-        button_text = f"{arrow} {category.get('title', '')}"
-
-        # Кнопка переключения категории
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"toggle_category_{cat_id}")])
+    text, keyboard = render_examples('telegram', opened_categories)
+    await edit_message_text(query, text, reply_markup=keyboard, parse_mode='Markdown')
 
-        # Если категория открыта, добавляем её содержимое в сообщение
-        if is_open:
-            message += f"\n**{category.get('title', '')}**\n"
-            message += f"_{category.get('description', '')}_\n\n"
 
-            for item in category.get('items', []):
-                message += f"• {item}\n"
-
-            message += "\n"
-
-    # Кнопка "Продолжить практику"
-    keyboard.append([InlineKeyboardButton("✅ Продолжить практику", callback_data="continue_from_examples")])
-
-    await query.edit_message_text(
-        message,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
-    )
-
-
-async def handle_category_toggle(query, user, db, category_id, opened_categories):
+async def handle_category_toggle(query, user, db, category_id):
     """Переключить состояние категории (открыть/закрыть)"""
-    if category_id in opened_categories:
-        opened_categories.remove(category_id)
-    else:
-        opened_categories.add(category_id)
+    opened_categories = session_state.toggle('telegram', user.telegram_id, 'opened_categories', category_id)
 
     # Перерисовать меню с обновлённым состоянием
     await handle_show_examples(query, user, db, opened_categories)
 
 
-async def handle_show_recipes(query, user, db, context=None, opened_recipes=None):
+async def handle_show_recipes(query, user, db, opened_recipes=None):
     """
     Показать рецепты с микрозеленью в виде разворачивающихся кнопок
 
@@ -953,75 +955,18 @@ async def handle_show_recipes(query, user, db, context=None, opened_recipes=None
         query: CallbackQuery объект
         user: User объект из БД
         db: Database session
-        context: CallbackContext для хранения состояния
-        opened_recipes: Set[str] - множество ID развернутых рецептов (опционально)
+        opened_recipes: Set[str] - множество ID развернутых рецептов (по умолчанию из session_state)
     """
-    recipes = practices_manager.get_recipes()
-
-    # Получить состояние развернутых рецептов
     if opened_recipes is None:
-        if context and hasattr(context, 'user_data'):
-            opened_recipes = context.user_data.get('opened_recipes', set())
-        else:
-            opened_recipes = set()
-
-    # Формируем сообщение
-    message = f"**{recipes.get('title', 'Рецепты')}** 🍽\n\n"
-    message += recipes.get('message', '')
-
-    items = recipes.get('items', [])
-
-    # Добавляем развернутые рецепты в текст сообщения
-    for recipe in items:
-        recipe_id = recipe.get('id', '')
-        if recipe_id in opened_recipes:
-            message += f"\n\n**{recipe.get('title', '')}**\n"
-            message += f"_{recipe.get('subtitle', '')}_\n\n"
-            message += f"**Ингредиенты:** {recipe.get('ingredients', '')}\n"
-            message += f"**Как делать:** {recipe.get('instructions', '')}\n"
-
-            if recipe.get('secret'):
-                message += f"**В чём секрет:** {recipe.get('secret')}\n"
-
-            if recipe.get('meaning'):
-                message += f"**Смысл:** {recipe.get('meaning')}\n"
-
-    # Создаем кнопки для всех рецептов
-    keyboard = []
-    for recipe in items:
-        recipe_id = recipe.get('id', '')
-        title = recipe.get('title', '')
-
-        # Кнопка для сворачивания или разворачивания
-        if recipe_id in opened_recipes:
-            # Рецепт развернут - кнопка для сворачивания
-            button_text = f"▼ {title}"
-            callback_data = f"collapse_recipe_{recipe_id}"
-        else:
-            # Рецепт свернут - кнопка для разворачивания
-            button_text = title
-            callback_data = f"expand_recipe_{recipe_id}"
-
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
+        opened_recipes = set(session_state.get('telegram', user.telegram_id, 'opened_recipes', ()))
 
-    # Добавляем кнопку для продолжения
-    # Для Stage 4 - переход к следующему шагу (Step 16)
-    # Для Stage 5 (daily practices) - использовать next_daily_substep
-    if user.current_stage == 4:
-        keyboard.append([InlineKeyboardButton("✅ Продолжить", callback_data="next_step")])
-    else:
-        keyboard.append([InlineKeyboardButton("✅ Завершить практику", callback_data="next_daily_substep")])
-
-    await query.edit_message_text(
-        message,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
-    )
+    text, keyboard = render_recipes('telegram', opened_recipes, stage4=user.current_stage == 4)
+    await edit_message_text(query, text, reply_markup=keyboard, parse_mode='Markdown')
 
     logger.info(f"Пользователь {user.telegram_id} просматривает меню рецептов (развернуто: {opened_recipes})")
 
 
-async def handle_recipe_toggle(query, user, db, recipe_id, opened_recipes, context):
+async def handle_recipe_toggle(query, user, db, recipe_id):
     """
     Переключить состояние рецепта (развернуть/свернуть)
 
@@ -1030,23 +975,15 @@ async def handle_recipe_toggle(query, user, db, recipe_id, opened_recipes, conte
         user: User объект из БД
         db: Database session
         recipe_id: str - ID рецепта для переключения
-        opened_recipes: Set[str] - множество ID развернутых рецептов
-        context: CallbackContext для хранения состояния
     """
-    # Переключить состояние рецепта
+    opened_recipes = session_state.toggle('telegram', user.telegram_id, 'opened_recipes', recipe_id)
     if recipe_id in opened_recipes:
-        opened_recipes.remove(recipe_id)
-        logger.info(f"Пользователь {user.telegram_id} свернул рецепт {recipe_id}")
-    else:
-        opened_recipes.add(recipe_id)
         logger.info(f"Пользователь {user.telegram_id} развернул рецепт {recipe_id}")
-
-    # Сохранить состояние в context
-    if context and hasattr(context, 'user_data'):
-        context.user_data['opened_recipes'] = opened_recipes
+    else:
+        logger.info(f"Пользователь {user.telegram_id} свернул рецепт {recipe_id}")
 
     # Перерисовать меню с обновлённым состоянием
-    await handle_show_recipes(query, user, db, context, opened_recipes)
+    await handle_show_recipes(query, user, db, opened_recipes)
 
 
 async def handle_show_manifesto(query, user, db):
@@ -1062,7 +999,7 @@ async def handle_show_manifesto(query, user, db):
 
     message += f"\n\n{manifesto.get('closing', '')}"
 
-    await query.edit_message_text(message, parse_mode='Markdown')
+    await edit_message_text(query, message, parse_mode='Markdown')
     logger.info(f"Пользователь {user.telegram_id} получил Манифест Предвкушения")
 
 
@@ -1087,7 +1024,8 @@ async def handle_start_daily_practices(query, user, db):
     logger.info(f"Пользователь {user.telegram_id} начал Stage 5 (ежедневные практики до беби-лифа)")
 
     # Показать подтверждающее сообщение
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         "✅ **Отлично! Начинаем новый цикл.**\n\n"
         "Следующие 7 дней ты будешь получать ежедневные практики в установленное время.\n\n"
         "Каждый день — новая тема для работы с долгосрочными целями.\n\n"
@@ -1107,7 +1045,8 @@ async def handle_continue_practice(query, user, db):
     # Получить данные этапа
     stage = practices_manager.get_stage(current_stage)
     if not stage:
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             f"❌ Не удалось найти Этап {current_stage}\n\n"
             "Пожалуйста, свяжитесь с поддержкой: /contact"
         )
@@ -1129,7 +1068,8 @@ async def handle_continue_practice(query, user, db):
             db.commit()
             logger.info(f"Исправлен current_step для пользователя {user.telegram_id}: {current_step_id} -> {correct_step_id}")
         else:
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 f"❌ Этап {current_stage} не содержит практик\n\n"
                 "Пожалуйста, свяжитесь с поддержкой: /contact"
             )
@@ -1145,7 +1085,8 @@ async def handle_continue_practice(query, user, db):
     keyboard = create_practice_keyboard(buttons)
 
     # Отправить практику
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         message,
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -1184,7 +1125,8 @@ async def handle_confirm_reset(query, user, db):
     first_step = practices_manager.get_step(stage_id=1, step_id=1)
 
     if not first_step:
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             "😞 Извините, произошла ошибка при загрузке практик.\n"
             "Пожалуйста, попробуйте позже."
         )
@@ -1209,7 +1151,8 @@ async def handle_confirm_reset(query, user, db):
     keyboard = create_practice_keyboard(buttons)
 
     # Отправить первый шаг
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         message,
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -1230,7 +1173,8 @@ async def handle_start_practice_after_reset(query, user, db):
     logger.info(f"[DEBUG] first_step получен: {first_step is not None}")
 
     if not first_step:
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             "😞 Извините, произошла ошибка при загрузке практик.\n"
             "Пожалуйста, попробуйте позже или свяжитесь с поддержкой: /contact"
         )
@@ -1258,7 +1202,8 @@ async def handle_start_practice_after_reset(query, user, db):
 
     # Отправить первый шаг
     try:
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             message,
             reply_markup=keyboard,
             parse_mode='Markdown'
@@ -1280,7 +1225,8 @@ async def handle_cancel_reset(query, user, db):
     # Получить данные этапа
     stage = practices_manager.get_stage(current_stage)
     if not stage:
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             "❌ Сброс отменён.\n\n"
             f"Не удалось загрузить вашу текущую практику.\n"
             "Используйте /status для проверки прогресса."
@@ -1301,7 +1247,8 @@ async def handle_cancel_reset(query, user, db):
             user.current_step = correct_step_id
             db.commit()
         else:
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 "❌ Сброс отменён.\n\n"
                 "Используйте /status для проверки прогресса."
             )
@@ -1318,7 +1265,8 @@ async def handle_cancel_reset(query, user, db):
     keyboard = create_practice_keyboard(buttons)
 
     # Отправить текущую практику
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         message,
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -1333,7 +1281,8 @@ async def handle_start_waiting_for_daily(query, user, db):
     user.daily_practice_day = 0  # 0 = ожидание первой практики
     db.commit()
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         "✅ Отлично! Я буду присылать напоминания о практиках.\n\n"
         "Первое напоминание придёт в твоё предпочтительное время.\n\n"
         "🌱 До встречи на практике!",
@@ -1358,7 +1307,8 @@ async def handle_complete_daily_practice(query, user, db):
         user.postponed_until = None
         db.commit()
 
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             "🎉 **Все 4 дня практик «Свидетель» завершены!**\n\n"
             "Отличная работа! Ты освоил(а) навык не-вмешательства.\n\n"
             "Скоро мы перейдём к практике первого урожая!\n\n"
@@ -1374,7 +1324,8 @@ async def handle_complete_daily_practice(query, user, db):
         user.postponed_until = None
         db.commit()
 
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             f"✅ **Практика дня {current_day} завершена!**\n\n"
             f"Молодец! Ты сделал(а) ещё один шаг в развитии навыка наблюдения.\n\n"
             f"До встречи завтра! 🌱",
@@ -1392,7 +1343,8 @@ async def handle_postpone_reminder(query, user, db):
     user.postponed_until = postponed_time
     db.commit()
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         f"⏰ **Напоминание отложено**\n\n"
         f"Я напомню тебе о практике через 2 часа.\n\n"
         f"Время напоминания: {postponed_time.strftime('%H:%M')}\n\n"
@@ -1409,7 +1361,7 @@ async def handle_view_daily_practice(query, user, db):
     # Получить практику текущего дня
     stage = practices_manager.get_stage(3)
     if not stage:
-        await query.edit_message_text("Ошибка: этап 3 не найден")
+        await edit_message_text(query, "Ошибка: этап 3 не найден")
         return
 
     daily_practices = stage.get('daily_practices', [])
@@ -1420,7 +1372,7 @@ async def handle_view_daily_practice(query, user, db):
             break
 
     if not practice:
-        await query.edit_message_text(f"Ошибка: практика дня {current_day} не найдена")
+        await edit_message_text(query, f"Ошибка: практика дня {current_day} не найдена")
         return
 
     # Показать практику
@@ -1430,7 +1382,8 @@ async def handle_view_daily_practice(query, user, db):
     buttons = practice.get('buttons', [])
     keyboard = create_practice_keyboard(buttons)
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         message,
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -1529,7 +1482,7 @@ async def handle_start_stage6_finale(query, user, db):
     # Получить Step 24
     stage = practices_manager.get_stage(6)
     if not stage:
-        await query.edit_message_text("Ошибка: Stage 6 не найден")
+        await edit_message_text(query, "Ошибка: Stage 6 не найден")
         return
 
     steps = stage.get('steps', [])
@@ -1540,7 +1493,7 @@ async def handle_start_stage6_finale(query, user, db):
             break
 
     if not step:
-        await query.edit_message_text("Ошибка: Step 24 не найден")
+        await edit_message_text(query, "Ошибка: Step 24 не найден")
         return
 
     # Показать Step 24
@@ -1550,7 +1503,7 @@ async def handle_start_stage6_finale(query, user, db):
     buttons_data = step.get('buttons', [])
     keyboard = create_practice_keyboard(buttons_data)
 
-    await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+    await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
 
     logger.info(f"Пользователь {user.telegram_id} начал Step 24 (Stage 6)")
 
@@ -1567,7 +1520,7 @@ async def handle_replant_step(query, user, db, step_id: int):
     """Показать указанный шаг сценария 'Салат не взошёл'"""
     replant = practices_manager.get_replant_scenario()
     if not replant:
-        await query.edit_message_text("Ошибка: сценарий не найден")
+        await edit_message_text(query, "Ошибка: сценарий не найден")
         return
 
     step = None
@@ -1577,13 +1530,13 @@ async def handle_replant_step(query, user, db, step_id: int):
             break
 
     if not step:
-        await query.edit_message_text(f"Ошибка: шаг {step_id} не найден")
+        await edit_message_text(query, f"Ошибка: шаг {step_id} не найден")
         return
 
     message = f"**{step.get('title', '')}**\n\n{step.get('message', '')}"
     keyboard = create_practice_keyboard(step.get('buttons', []))
 
-    await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+    await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
     logger.info(f"Пользователь {user.telegram_id} на шаге {step_id} сценария 'Салат не взошёл'")
 
 
@@ -1602,7 +1555,8 @@ async def handle_replant_complete(query, user, db):
         [InlineKeyboardButton("✅ Всходы появились!", callback_data="sprouts_appeared")]
     ])
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         "🌱 **Семена посажены заново!**\n\n"
         "Таймер сброшен. Жди новых всходов — обычно они появляются через 2-4 дня.\n\n"
         "Я буду присылать напоминания проверить горшок.\n\n"
@@ -1622,13 +1576,13 @@ async def handle_mold_start(query, user, db):
 
     mold = practices_manager.get_mold_scenario()
     if not mold:
-        await query.edit_message_text("Ошибка: сценарий не найден")
+        await edit_message_text(query, "Ошибка: сценарий не найден")
         return
 
     message = f"**{mold.get('title', '')}**\n\n{mold.get('message', '')}"
     keyboard = create_practice_keyboard(mold.get('buttons', []))
 
-    await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+    await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
 
 
 async def handle_mold_complete(query, user, db):
@@ -1641,7 +1595,8 @@ async def handle_mold_complete(query, user, db):
         [InlineKeyboardButton("🍄 Что-то пошло не так / Плесень", callback_data="mold_start")]
     ])
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         "🌱 **Отлично!**\n\n"
         "Ты справился(ась) с плесенью. Продолжай наблюдать за своим горшком.\n\n"
         "Как только увидишь первые зелёные петельки — нажми кнопку! 🌱",
@@ -1657,13 +1612,13 @@ async def handle_mold_sprouts_start(query, user, db):
 
     mold = practices_manager.get_mold_sprouts_scenario()
     if not mold:
-        await query.edit_message_text("Ошибка: сценарий не найден")
+        await edit_message_text(query, "Ошибка: сценарий не найден")
         return
 
     message = f"**{mold.get('title', '')}**\n\n{mold.get('message', '')}"
     keyboard = create_practice_keyboard(mold.get('buttons', []))
 
-    await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+    await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
 
 
 async def handle_mold_sprouts_complete(query, user, db):
@@ -1698,7 +1653,8 @@ async def handle_mold_sprouts_complete(query, user, db):
                 keyboard_buttons.append([InlineKeyboardButton("🍄 Что-то пошло не так / Плесень", callback_data="mold_sprouts_start")])
                 keyboard = InlineKeyboardMarkup(keyboard_buttons)
 
-                await query.edit_message_text(
+                await edit_message_text(
+                    query,
                     f"🌱 **Отлично!** Ты справился(ась) с плесенью.\n\n{message}",
                     reply_markup=keyboard,
                     parse_mode='Markdown'
@@ -1727,7 +1683,7 @@ async def handle_mold_sprouts_complete(query, user, db):
                 keyboard_buttons.append([InlineKeyboardButton("🍄 Что-то пошло не так / Плесень", callback_data="mold_sprouts_start")])
                 keyboard = InlineKeyboardMarkup(keyboard_buttons)
 
-                await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+                await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
                 logger.info(f"Пользователь {user.telegram_id} вернулся к напоминанию Stage 4")
                 return
 
@@ -1755,7 +1711,7 @@ async def handle_mold_sprouts_complete(query, user, db):
                     [InlineKeyboardButton("🍄 Что-то пошло не так / Плесень", callback_data="mold_sprouts_start")]
                 ])
 
-                await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+                await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
                 logger.info(f"Пользователь {user.telegram_id} вернулся к напоминанию Stage 5 день {current_day}")
                 return
 
@@ -1764,7 +1720,8 @@ async def handle_mold_sprouts_complete(query, user, db):
         [InlineKeyboardButton("Продолжить практику", callback_data="continue_practice")]
     ])
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         "🌱 **Отлично!**\n\n"
         "Ты справился(ась) с плесенью. Возвращайся к практике!",
         reply_markup=keyboard,
@@ -1785,7 +1742,7 @@ async def handle_all_dead_step(query, user, db, step_id: int):
     """Показать указанный шаг сценария 'Всё погибло'"""
     all_dead = practices_manager.get_all_dead_scenario()
     if not all_dead:
-        await query.edit_message_text("Ошибка: сценарий не найден")
+        await edit_message_text(query, "Ошибка: сценарий не найден")
         return
 
     step = None
@@ -1795,13 +1752,13 @@ async def handle_all_dead_step(query, user, db, step_id: int):
             break
 
     if not step:
-        await query.edit_message_text(f"Ошибка: шаг {step_id} не найден")
+        await edit_message_text(query, f"Ошибка: шаг {step_id} не найден")
         return
 
     message = f"**{step.get('title', '')}**\n\n{step.get('message', '')}"
     keyboard = create_practice_keyboard(step.get('buttons', []))
 
-    await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+    await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
     logger.info(f"Пользователь {user.telegram_id} на шаге {step_id} сценария 'Всё погибло'")
 
 
@@ -1828,7 +1785,8 @@ async def handle_all_dead_complete(query, user, db):
         [InlineKeyboardButton("✅ Появились первые всходы", callback_data="sprouts_appeared")]
     ])
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         "🌱 **Жди уведомлений о всходах, удачи!**\n\n"
         "Я буду присылать напоминания проверить горшок.\n"
         "Как только увидишь первые зелёные петельки — нажми кнопку!",
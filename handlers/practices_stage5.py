@@ -9,6 +9,7 @@ from datetime import date
 from utils import practices_manager
 from utils.db import update_user_progress
 from models import SessionLocal, User
+from utils.message_edit import edit_message_text
 
 logger = logging.getLogger(__name__)
 
@@ -70,7 +71,7 @@ async def handle_stage5_start_substep(query, user, db):
 
     if not practice:
         logger.error(f"Практика дня {current_day} не найдена для Stage 5")
-        await query.edit_message_text("Ошибка: практика дня не найдена")
+        await edit_message_text(query, "Ошибка: практика дня не найдена")
         return
 
     # Установить текущий подшаг = "intro"
@@ -82,7 +83,7 @@ async def handle_stage5_start_substep(query, user, db):
 
     if not step:
         logger.error(f"Подшаг 'intro' не найден для дня {current_day}")
-        await query.edit_message_text("Ошибка: подшаг не найден")
+        await edit_message_text(query, "Ошибка: подшаг не найден")
         return
 
     # Сформировать сообщение
@@ -95,7 +96,7 @@ async def handle_stage5_start_substep(query, user, db):
         [InlineKeyboardButton("Продолжить", callback_data="stage5_next_substep")]
     ])
 
-    await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+    await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
 
     logger.info(f"Пользователь {user.telegram_id} начал подшаг 'intro' дня {current_day} (Stage 5)")
 
@@ -114,7 +115,7 @@ async def handle_stage5_next_substep(query, user, db):
 
     if not practice:
         logger.error(f"Практика дня {current_day} не найдена для Stage 5")
-        await query.edit_message_text("Ошибка: практика дня не найдена")
+        await edit_message_text(query, "Ошибка: практика дня не найдена")
         return
 
     # Определить следующий подшаг
@@ -132,7 +133,7 @@ async def handle_stage5_next_substep(query, user, db):
 
     if not next_substep:
         logger.error(f"Неизвестный подшаг '{current_substep}' для Stage 5")
-        await query.edit_message_text("Ошибка: неизвестный подшаг")
+        await edit_message_text(query, "Ошибка: неизвестный подшаг")
         return
 
     # Обновить текущий подшаг
@@ -144,7 +145,7 @@ async def handle_stage5_next_substep(query, user, db):
 
     if not step:
         logger.error(f"Подшаг '{next_substep}' не найден для дня {current_day}")
-        await query.edit_message_text("Ошибка: подшаг не найден")
+        await edit_message_text(query, "Ошибка: подшаг не найден")
         return
 
     # Сформировать сообщение
@@ -179,7 +180,7 @@ async def handle_stage5_next_substep(query, user, db):
             [InlineKeyboardButton("Продолжить", callback_data="stage5_next_substep")]
         ])
 
-    await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+    await edit_message_text(query, message, reply_markup=keyboard, parse_mode='Markdown')
 
     logger.info(f"Пользователь {user.telegram_id} перешёл к подшагу '{next_substep}' (Stage 5)")
 
@@ -217,7 +218,8 @@ async def _complete_stage5_day(query, user, db, practice):
         user.postponed_until = None
         db.commit()
 
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             "🎉 **Все 7 дней практик завершены!**\n\n"
             "Отличная работа! Ты освоил(а) навык работы с долгосрочными целями.\n\n"
             "Твой беби-лиф готов! Скоро мы перейдём к финальному этапу.",
@@ -236,7 +238,8 @@ async def _complete_stage5_day(query, user, db, practice):
     db.commit()
 
     theme = practice.get('theme', '')
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         f"✅ **День {current_day} завершён!**\n\n"
         f"Тема: {theme}\n\n"
         f"Молодец! Ты сделал(а) ещё один шаг в работе с долгосрочными целями.\n\n"
@@ -276,7 +279,7 @@ async def handle_stage5_prev_substep(query, user, db):
 
     if not practice:
         logger.error(f"Практика дня {current_day} не найдена для Stage 5")
-        await query.edit_message_text("Ошибка: практика дня не найдена")
+        await edit_message_text(query, "Ошибка: практика дня не найдена")
         return
 
     # Найти предыдущий подшаг
@@ -315,7 +318,8 @@ async def handle_stage5_prev_substep(query, user, db):
             [InlineKeyboardButton("Продолжить", callback_data="stage5_next_substep")]
         ])
 
-    await query.edit_message_text(
+    await edit_message_text(
+        query,
         message,
         reply_markup=keyboard,
         parse_mode='Markdown'
@@ -8,6 +8,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from utils import error_handler
 from utils.db import get_or_create_user
+from utils.message_edit import edit_message_text
 from models import SessionLocal
 import pytz
 
@@ -99,7 +100,8 @@ async def handle_time_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 
             db.commit()
 
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 f"✅ **Время напоминаний установлено!**\n\n"
                 f"Вы будете получать напоминания о практиках каждый день в **{time_str}**.\n\n"
                 f"Часовой пояс: {user.timezone}"
@@ -186,7 +188,8 @@ async def handle_timezone_callback(update: Update, context: ContextTypes.DEFAULT
             from datetime import datetime
             current_time = datetime.now(tz).strftime("%H:%M")
 
-            await query.edit_message_text(
+            await edit_message_text(
+                query,
                 f"✅ **Часовой пояс установлен!**\n\n"
                 f"Ваш часовой пояс: **{timezone_str}**\n"
                 f"Текущее время: **{current_time}**"
@@ -338,7 +338,7 @@ async def handle_start_callback(update: Update, context: ContextTypes.DEFAULT_TY
 
             # Создать клавиатуру с кнопками
             buttons = first_step.get('buttons', [])
-            keyboard = create_practice_keyboard(buttons)
+            keyboard = create_practice_keyboard(buttons, stage=1, step=1)
 
             # Отправить практику
             await query.message.reply_text(
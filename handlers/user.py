@@ -1,6 +1,7 @@
 """
 Обработчики команд управления пользователем:
 /status, /pause, /resume, /reset
+а также блокировка/разблокировка бота пользователем (my_chat_member)
 """
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -31,6 +32,7 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"📝 Шаг: {stats['current_step']}\n"
             f"📅 День: {stats['current_day']}\n"
             f"✅ Завершено шагов: {stats['completed_steps']}\n"
+            f"🗓 Дней с практикой: {stats['days_practiced']}\n"
             f"⏸ Статус: {'На паузе' if stats['is_paused'] else 'Активно'}\n\n"
             f"Дата начала: {stats['created_at'].strftime('%d.%m.%Y')}\n"
             f"Последняя активность: {stats['last_interaction'].strftime('%d.%m.%Y %H:%M')}\n\n"
@@ -116,3 +118,23 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Пользователь {user.id} запросил сброс прогресса (ожидание подтверждения)")
     finally:
         db.close()
+
+
+async def handle_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пользователь заблокировал или разблокировал бота в личном чате"""
+    from utils.db import mark_users_inactive, reactivate_user
+
+    member_update = update.my_chat_member
+    if not member_update or member_update.chat.type != 'private':
+        return
+
+    telegram_id = member_update.chat.id
+    status = member_update.new_chat_member.status
+    db = SessionLocal()
+    try:
+        if status == 'kicked':
+            mark_users_inactive(db, 'telegram', [telegram_id], 'blocked')
+        elif status == 'member':
+            reactivate_user(db, 'telegram', telegram_id)
+    finally:
+        db.close()
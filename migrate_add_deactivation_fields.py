@@ -0,0 +1,30 @@
+"""
+Миграция: добавление полей deactivated_at и deactivation_reason в таблицу users
+Запустить один раз: python migrate_add_deactivation_fields.py
+"""
+from sqlalchemy import inspect, text
+from models import engine
+
+COLUMNS = {
+    'deactivated_at': 'TIMESTAMP',
+    'deactivation_reason': 'VARCHAR(50)',
+}
+
+
+def migrate():
+    """Добавить поля деактивации, если их нет"""
+    existing = {column['name'] for column in inspect(engine).get_columns('users')}
+
+    with engine.connect() as conn:
+        for name, column_type in COLUMNS.items():
+            if name in existing:
+                print(f"⚠️ Поле {name} уже существует, пропускаем")
+                continue
+            print(f"Добавляем поле {name}...")
+            conn.execute(text(f"ALTER TABLE users ADD COLUMN {name} {column_type}"))
+        conn.commit()
+    print("✅ Миграция завершена")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,25 @@
+"""
+Миграция: индекс users(updated_at, id) для инкрементальной выгрузки
+Запустить один раз: python migrate_add_export_index.py
+"""
+from sqlalchemy import inspect
+from models import engine, User
+
+INDEX_NAME = 'ix_users_updated_at_id'
+
+
+def migrate():
+    """Создать индекс, если его нет"""
+    existing = {index['name'] for index in inspect(engine).get_indexes('users')}
+    if INDEX_NAME in existing:
+        print(f"⚠️ Индекс {INDEX_NAME} уже существует, пропускаем")
+        return
+
+    index = next(index for index in User.__table__.indexes if index.name == INDEX_NAME)
+    print(f"Создаём индекс {INDEX_NAME}...")
+    index.create(bind=engine)
+    print("✅ Миграция завершена")
+
+
+if __name__ == "__main__":
+    migrate()
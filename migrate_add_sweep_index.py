@@ -0,0 +1,36 @@
+"""
+Миграция: индекс ix_users_reminder_sweep для прохода планировщика напоминаний
+Запустить один раз: python migrate_add_sweep_index.py
+"""
+from sqlalchemy import inspect
+from models import engine, User
+
+INDEX_NAME = 'ix_users_reminder_sweep'
+
+
+def _has_include(index: dict) -> bool:
+    """Индекс создан прежней версией — покрывающим (PostgreSQL INCLUDE)"""
+    options = index.get('dialect_options') or {}
+    return bool(options.get('postgresql_include') or index.get('include_columns'))
+
+
+def migrate():
+    """Создать индекс, если его нет; покрывающий индекс пересоздать без INCLUDE"""
+    existing = {index['name']: index for index in inspect(engine).get_indexes('users')}
+    index = next(index for index in User.__table__.indexes if index.name == INDEX_NAME)
+
+    if INDEX_NAME in existing:
+        if not _has_include(existing[INDEX_NAME]):
+            print(f"⚠️ Индекс {INDEX_NAME} уже существует, пропускаем")
+            return
+        # INCLUDE с часто меняющимися колонками мешает HOT-обновлениям users
+        print(f"Пересоздаём индекс {INDEX_NAME} без INCLUDE...")
+        index.drop(bind=engine)
+
+    print(f"Создаём индекс {INDEX_NAME}...")
+    index.create(bind=engine)
+    print("✅ Миграция завершена")
+
+
+if __name__ == "__main__":
+    migrate()
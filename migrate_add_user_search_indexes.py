@@ -0,0 +1,27 @@
+"""
+Миграция: индексы для поиска по началу username/имени в /admin_users
+Запустить один раз: python migrate_add_user_search_indexes.py
+"""
+from sqlalchemy import inspect
+from models import engine, User
+
+INDEX_NAMES = ('ix_users_username_lower', 'ix_users_first_name_lower')
+
+
+def migrate():
+    """Создать индексы, которых нет"""
+    existing = {index['name'] for index in inspect(engine).get_indexes('users')}
+
+    for index in User.__table__.indexes:
+        if index.name not in INDEX_NAMES:
+            continue
+        if index.name in existing:
+            print(f"⚠️ Индекс {index.name} уже существует, пропускаем")
+            continue
+        print(f"Создаём индекс {index.name}...")
+        index.create(bind=engine)
+    print("✅ Миграция завершена")
+
+
+if __name__ == "__main__":
+    migrate()
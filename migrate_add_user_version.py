@@ -0,0 +1,24 @@
+"""
+Миграция: добавление поля version в таблицу users (оптимистичная блокировка)
+Запустить один раз: python migrate_add_user_version.py
+"""
+from sqlalchemy import inspect, text
+from models import engine
+
+
+def migrate():
+    """Добавить поле version, если его нет"""
+    existing = {column['name'] for column in inspect(engine).get_columns('users')}
+    if 'version' in existing:
+        print("⚠️ Поле version уже существует, пропускаем")
+        return
+
+    with engine.connect() as conn:
+        print("Добавляем поле version...")
+        conn.execute(text("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        conn.commit()
+    print("✅ Миграция завершена")
+
+
+if __name__ == "__main__":
+    migrate()
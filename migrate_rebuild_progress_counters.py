@@ -0,0 +1,75 @@
+"""
+Миграция: заполнить user_stats и progress_counters по существующей истории
+Запустить один раз после обновления: python migrate_rebuild_progress_counters.py
+
+Дальше счётчики обновляются вместе с каждой новой записью user_progress.
+Повторный запуск пересчитывает их с нуля (ботов лучше остановить).
+После архивации истории (utils.archive) пересчёт с нуля потеряет
+архивные строки, поэтому при наличии архива нужен флаг --force.
+"""
+import glob
+import os
+import sys
+from collections import Counter
+
+from sqlalchemy import delete, select
+
+from models import SessionLocal, User, UserProgress, UserStats, ProgressCounter
+from utils.archive import ARCHIVE_DIR
+from utils.db import _local_date
+
+BATCH_SIZE = 5000
+
+
+def migrate():
+    """Пересчитать счётчики одним проходом по user_progress"""
+    if glob.glob(os.path.join(ARCHIVE_DIR, 'user_progress_*.jsonl.gz')) and '--force' not in sys.argv:
+        print(f"⚠️ В {ARCHIVE_DIR} есть архив истории: пересчёт по таблице занизит счётчики.")
+        print("Запустите с --force, если это и нужно.")
+        return
+
+    db = SessionLocal()
+    try:
+        users = {user.id: user for user in db.scalars(select(User))}
+        stats = {}
+        global_counts = Counter()
+
+        rows = db.execute(
+            select(UserProgress.user_id, UserProgress.stage_id, UserProgress.day, UserProgress.completed_at)
+            .order_by(UserProgress.user_id, UserProgress.completed_at)
+            .execution_options(yield_per=BATCH_SIZE)
+        )
+        for user_id, stage_id, day, completed_at in rows:
+            global_counts[('stage', stage_id)] += 1
+            global_counts[('day', day)] += 1
+            if user_id not in users:
+                continue  # Строки без user_id — см. migrate_user_progress_user_id.py
+            entry = stats.setdefault(user_id, {'steps': 0, 'dates': set(), 'last': None})
+            entry['steps'] += 1
+            entry['dates'].add(_local_date(users[user_id], completed_at))
+            entry['last'] = completed_at
+
+        db.execute(delete(UserStats))
+        db.execute(delete(ProgressCounter))
+        db.add_all(
+            UserStats(
+                user_id=user_id,
+                completed_steps=entry['steps'],
+                days_practiced=len(entry['dates']),
+                last_completed_at=entry['last'],
+                last_completed_date=_local_date(users[user_id], entry['last']),
+            )
+            for user_id, entry in stats.items()
+        )
+        db.add_all(
+            ProgressCounter(kind=kind, key=key, count=count)
+            for (kind, key), count in global_counts.items()
+        )
+        db.commit()
+        print(f"✅ Счётчики пересчитаны: пользователей {len(stats)}, событий {sum(e['steps'] for e in stats.values())}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,64 @@
+"""
+Миграция: user_progress.user_id (ссылка на users.id) + индекс (user_id, completed_at)
+и заполнение user_id для существующей истории.
+Запустить один раз: python migrate_user_progress_user_id.py
+
+Раньше история хранила ID на платформе в user_telegram_id, и ID Telegram
+и VK могли совпасть. Строка привязывается к пользователю, только если
+такой ID есть ровно у одного пользователя; неоднозначные строки остаются
+с user_id = NULL (их количество выводится в конце).
+"""
+from sqlalchemy import inspect, text
+from models import engine
+
+INDEX_NAME = 'ix_user_progress_user_completed'
+BATCH_SIZE = 5000
+
+# Ровно один пользователь с таким ID на любой из платформ
+MATCHING_USERS = (
+    "FROM users u WHERE u.telegram_id = user_progress.user_telegram_id "
+    "OR u.vk_id = user_progress.user_telegram_id"
+)
+
+
+def migrate():
+    """Добавить колонку и индекс, заполнить user_id пачками по id"""
+    inspector = inspect(engine)
+    columns = {column['name'] for column in inspector.get_columns('user_progress')}
+    indexes = {index['name'] for index in inspector.get_indexes('user_progress')}
+
+    with engine.connect() as conn:
+        if 'user_id' in columns:
+            print("⚠️ Поле user_id уже существует, пропускаем")
+        else:
+            print("Добавляем поле user_id...")
+            conn.execute(text(
+                "ALTER TABLE user_progress ADD COLUMN user_id INTEGER REFERENCES users(id) ON DELETE CASCADE"
+            ))
+        if INDEX_NAME in indexes:
+            print(f"⚠️ Индекс {INDEX_NAME} уже существует, пропускаем")
+        else:
+            print(f"Создаём индекс {INDEX_NAME}...")
+            conn.execute(text(f"CREATE INDEX {INDEX_NAME} ON user_progress (user_id, completed_at)"))
+        conn.commit()
+
+        max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM user_progress")).scalar()
+        filled = 0
+        # Короткие транзакции по диапазонам id, чтобы не держать блокировку на всю таблицу
+        for start in range(0, max_id, BATCH_SIZE):
+            result = conn.execute(text(
+                f"UPDATE user_progress SET user_id = (SELECT u.id {MATCHING_USERS}) "
+                f"WHERE id > :start AND id <= :end AND user_id IS NULL "
+                f"AND (SELECT COUNT(*) {MATCHING_USERS}) = 1"
+            ), {"start": start, "end": start + BATCH_SIZE})
+            conn.commit()
+            filled += result.rowcount
+            print(f"  id {start + 1}..{min(start + BATCH_SIZE, max_id)}: +{result.rowcount}")
+
+        left = conn.execute(text("SELECT COUNT(*) FROM user_progress WHERE user_id IS NULL")).scalar()
+
+    print(f"✅ Миграция завершена: заполнено {filled}, без пользователя осталось {left}")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,10 +1,13 @@
 """
 Модели базы данных для Sogreto Bot
 """
+import time
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Boolean, Text
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, String, DateTime, Boolean, Text, Index, ForeignKey, and_, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
 from dotenv import load_dotenv
 
@@ -17,16 +20,199 @@ DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///sogreto_bot.db')
 if DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
+# Пул соединений. Вместо pre-ping (лишний запрос на каждую выдачу) —
+# pool_recycle против закрытых сервером простаивающих соединений и повтор
+# первого запроса транзакции после обрыва (RetryingSession)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # секунды ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 30 * 60))  # секунды
+DB_PRE_PING = os.getenv('DB_PRE_PING', '0') == '1'
+# pgbouncer в режиме transaction pooling: серверное соединение меняется
+# между транзакциями, поэтому без prepared statements на сервере. Влияет
+# только на драйвер psycopg 3 (postgresql+psycopg://): psycopg2 из
+# requirements.txt серверных prepared statements не создаёт и работает
+# через pgbouncer без этой настройки
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', '0') == '1'
+
+
+def _metrics():
+    # utils импортирует models, поэтому реестр берётся при первом событии
+    from utils.metrics import metrics
+    return metrics
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, который замеряет ожидание свободного соединения"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            _metrics().inc('db.pool.timeouts')
+            raise
+        finally:
+            _metrics().observe('db.pool.checkout_wait', time.perf_counter() - started)
+
+
+def instrument_pool(engine):
+    """Метрики пула: выдачи, занятые соединения, overflow, обрывы и инвалидации"""
+    pool = engine.pool
+
+    def report(returning: int = 0):
+        # Занятость и overflow считает только QueuePool; у SingletonThreadPool
+        # (in-memory SQLite) и NullPool этих счётчиков нет
+        if not isinstance(pool, QueuePool):
+            return
+        metrics = _metrics()
+        # checkin срабатывает до возврата соединения в пул — оно ещё считается занятым
+        metrics.set_gauge('db.pool.in_use', pool.checkedout() - returning)
+        metrics.set_gauge('db.pool.overflow', max(0, pool.overflow()))
+        metrics.set_gauge('db.pool.idle', pool.checkedin() + returning)
+
+    @event.listens_for(engine, 'checkout')
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        _metrics().inc('db.pool.checkouts')
+        report()
+
+    @event.listens_for(engine, 'checkin')
+    def _checkin(dbapi_connection, connection_record):
+        report(returning=1)
+
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        _metrics().inc('db.pool.connects')
+
+    @event.listens_for(engine, 'invalidate')
+    def _invalidate(dbapi_connection, connection_record, exception):
+        _metrics().inc('db.pool.invalidations')
+
+    @event.listens_for(engine, 'handle_error')
+    def _handle_error(context):
+        if context.is_disconnect:
+            _metrics().inc('db.pool.disconnects')
+
+
+def engine_options(url: str) -> dict:
+    """Параметры create_engine для URL с учётом DB_POOL_* и DB_PGBOUNCER"""
+    if url.startswith('sqlite'):
+        options = {'connect_args': {"check_same_thread": False}}
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            return options  # in-memory БД живёт в одном соединении — пул по умолчанию
+    else:
+        options = {'connect_args': {}}
+        if DB_PGBOUNCER and url.startswith('postgresql+psycopg:'):
+            # psycopg 3 готовит повторяющиеся запросы на сервере; psycopg2 этого не делает
+            options['connect_args']['prepare_threshold'] = None
+
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_PRE_PING,
+    )
+    return options
+
+
 # Создание движка БД
 engine = create_engine(
     DATABASE_URL,
     echo=False,  # Отключить логи SQL в продакшене
-    pool_pre_ping=True,  # Проверять соединение перед использованием (защита от EOF/disconnect)
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith('sqlite') else {}
+    **engine_options(DATABASE_URL)
 )
+instrument_pool(engine)
+
+# SQLite в продакшене: bot.py и vk_bot.py пишут в один файл. WAL — читатели
+# не ждут писателя и наоборот; busy_timeout — писатель ждёт освобождения
+# блокировки, а не падает сразу с "database is locked". Пустое значение
+# переменной окружения — не выставлять PRAGMA.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),  # в WAL без риска повредить файл
+    'busy_timeout': os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    'mmap_size': os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': os.getenv('SQLITE_CACHE_SIZE', '-32000'),  # отрицательное — в КиБ
+}
+
+
+def configure_sqlite(engine, pragmas: dict = None):
+    """
+    Выставлять PRAGMA на каждом новом соединении SQLite (для других БД — ничего)
+
+    Политика коротких записей: транзакция записи — это mutate и сразу
+    commit (utils.db.update_user_cas), без ожиданий сети внутри; занятость
+    БД при записи повторяется там же, как конфликт версий.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                if value not in (None, ''):
+                    cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+configure_sqlite(engine)
+
+
+class RetryingSession(Session):
+    """
+    Сессия, которая один раз повторяет первый запрос транзакции после обрыва
+
+    Пока в транзакции ничего не сделано, повтор безопасен: пул уже
+    выбросил оборванные соединения, и запрос уйдёт по новому. Обрыв
+    посреди транзакции пробрасывается как есть — её нужно начинать заново.
+
+    Конфликт версий (version_id_col у User) commit() не разрешает, а
+    пробрасывает StaleDataError: повторная запись значений, вычисленных
+    по устаревшей строке, затёрла бы чужое изменение. Повтор с
+    перепроверкой условий — utils.db.update_user_cas.
+    """
+
+    def _retry_on_disconnect(self, method, *args, **kwargs):
+        fresh = not self.in_transaction()
+        try:
+            return method(*args, **kwargs)
+        except DBAPIError as e:
+            if not (fresh and e.connection_invalidated):
+                raise
+            self.rollback()
+            _metrics().inc('db.pool.disconnect_retries')
+            return method(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._retry_on_disconnect(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._retry_on_disconnect(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._retry_on_disconnect(super().scalars, *args, **kwargs)
+
 
 # Фабрика сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=RetryingSession, autocommit=False, autoflush=False, bind=engine)
+
+
+# Колонки, которые читает проход планировщика напоминаний (utils.scheduler):
+# остальные (профиль, служебные отметки времени) при проходе не загружаются
+REMINDER_SWEEP_COLUMNS = (
+    'platform', 'telegram_id', 'vk_id',
+    'current_stage', 'current_step', 'current_day',
+    'daily_practice_day', 'awaiting_sprouts', 'last_practice_date',
+    'timezone', 'preferred_time', 'reminder_time', 'started_at', 'last_reminder_sent',
+    'reminder_postponed', 'postponed_until', 'stage4_reminder_date', 'stage6_reminder_date',
+    'is_active', 'is_paused', 'version',
+)
 
 
 class User(Base):
@@ -48,6 +234,8 @@ class User(Base):
 
     # Статус
     is_active = Column(Boolean, default=True)
+    deactivated_at = Column(DateTime, nullable=True)  # Когда отправка перестала доходить
+    deactivation_reason = Column(String(50), nullable=True)  # 'blocked', 'vk_901', ...
     is_paused = Column(Boolean, default=False)
     awaiting_sprouts = Column(Boolean, default=False)  # Ожидание всходов после этапа 1
 
@@ -78,6 +266,37 @@ class User(Base):
     paused_at = Column(DateTime, nullable=True)
     resumed_at = Column(DateTime, nullable=True)
 
+    # Версия строки: каждый UPDATE через ORM идёт с условием version = <прочитанная>
+    # и увеличивает её, поэтому параллельная запись не затирается молча (см. utils.db.update_user_cas)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    __table_args__ = (
+        # Частичный индекс по кандидатам на напоминание: он только сужает проход
+        # до активных начавших пользователей, строки затем читаются из таблицы
+        # (load_only ограничивает лишь передаваемые колонки). Покрывающий
+        # вариант (INCLUDE) не делаем: колонки прохода (version,
+        # last_reminder_sent, ...) меняются почти при каждой записи, и такой
+        # индекс лишил бы эти UPDATE HOT-обновлений
+        Index(
+            'ix_users_reminder_sweep', 'id',
+            postgresql_where=and_(is_active == True, is_paused == False, started_at.isnot(None)),
+            sqlite_where=and_(is_active == True, is_paused == False, started_at.isnot(None)),
+        ),
+        # Поиск по началу имени в /admin_users: lower(...) LIKE 'prefix%'
+        Index(
+            'ix_users_username_lower', func.lower(username).label('username_lower'),
+            postgresql_ops={'username_lower': 'text_pattern_ops'},
+        ),
+        Index(
+            'ix_users_first_name_lower', func.lower(first_name).label('first_name_lower'),
+            postgresql_ops={'first_name_lower': 'text_pattern_ops'},
+        ),
+        # Водяной знак инкрементальной выгрузки (utils.export): (updated_at, id) > отметки
+        Index('ix_users_updated_at_id', 'updated_at', 'id'),
+    )
+
     @property
     def platform_id(self):
         """Вернуть ID пользователя на его платформе"""
@@ -92,6 +311,8 @@ class UserProgress(Base):
     __tablename__ = 'user_progress'
 
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=True)  # users.id
+    # Устаревшее: ID на платформе (Telegram и VK в одной колонке могут совпасть) — читать user_id
     user_telegram_id = Column(BigInteger, nullable=False, index=True)
 
     # Какой этап/шаг пройден
@@ -105,8 +326,39 @@ class UserProgress(Base):
     # Временные метки
     completed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        # История и статистика пользователя — диапазон по индексу (последние N, за период)
+        Index('ix_user_progress_user_completed', 'user_id', 'completed_at'),
+    )
+
     def __repr__(self):
-        return f"<UserProgress(user={self.user_telegram_id}, stage={self.stage_id}, step={self.step_id})>"
+        return f"<UserProgress(user={self.user_id}, stage={self.stage_id}, step={self.step_id})>"
+
+
+class UserStats(Base):
+    """Свёрнутые счётчики пользователя — обновляются в той же транзакции, что и история"""
+    __tablename__ = 'user_stats'
+
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    completed_steps = Column(Integer, nullable=False, default=0)  # Записей в user_progress
+    days_practiced = Column(Integer, nullable=False, default=0)  # Разных дней (по часовому поясу пользователя)
+    last_completed_at = Column(DateTime, nullable=True)
+    last_completed_date = Column(String(10), nullable=True)  # YYYY-MM-DD, для подсчёта days_practiced
+
+    def __repr__(self):
+        return f"<UserStats(user={self.user_id}, steps={self.completed_steps}, days={self.days_practiced})>"
+
+
+class ProgressCounter(Base):
+    """Глобальные счётчики событий прогресса: kind='stage'|'day', key — номер этапа/дня"""
+    __tablename__ = 'progress_counters'
+
+    kind = Column(String(10), primary_key=True)
+    key = Column(Integer, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ProgressCounter({self.kind}={self.key}: {self.count})>"
 
 
 class ScheduledReminder(Base):
@@ -135,6 +387,31 @@ class ScheduledReminder(Base):
         return f"<ScheduledReminder(user={self.user_telegram_id}, type={self.reminder_type}, time={self.scheduled_time})>"
 
 
+class SessionState(Base):
+    """Состояние диалога (аккордеоны и т.п.) — постоянный уровень utils.session_state"""
+    __tablename__ = 'session_state'
+
+    platform = Column(String(10), primary_key=True)  # 'telegram' или 'vk'
+    user_id = Column(BigInteger, primary_key=True)
+    data = Column(Text, nullable=False, default='{}')  # JSON
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<SessionState(platform={self.platform}, user={self.user_id})>"
+
+
+class UpdateWatermark(Base):
+    """Наибольший обработанный update_id платформы — защита от повторной доставки после перезапуска"""
+    __tablename__ = 'update_watermarks'
+
+    platform = Column(String(10), primary_key=True)  # 'telegram'
+    update_id = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<UpdateWatermark(platform={self.platform}, update_id={self.update_id})>"
+
+
 def init_db():
     """Инициализация базы данных - создание всех таблиц"""
     Base.metadata.create_all(bind=engine)
@@ -1,53 +1,18 @@
 #!/bin/bash
 
-# Скрипт автоматического бэкапа базы данных Sogreto Bot
+# Скрипт бэкапа базы данных Sogreto Bot
 # Использование: ./backup_db.sh
+#
+# Копию делает utils/backup.py: VACUUM INTO для SQLite и потоковый
+# pg_dump для PostgreSQL — бота останавливать не нужно. Каталог, число
+# хранимых копий и сжатие — переменные BACKUP_DIR, BACKUP_KEEP,
+# BACKUP_COMPRESSION (см. utils/backup.py).
 
-# Конфигурация
-DB_FILE="sogreto_bot.db"
-BACKUP_DIR="backups"
-MAX_BACKUPS=7  # Хранить последние 7 бэкапов
-DATE=$(date +%Y%m%d_%H%M%S)
-BACKUP_FILE="${BACKUP_DIR}/sogreto_bot_${DATE}.db"
+cd "$(dirname "$0")/.." || exit 1
 
-# Создать директорию для бэкапов если не существует
-mkdir -p "$BACKUP_DIR"
-
-# Проверить что БД существует
-if [ ! -f "$DB_FILE" ]; then
-    echo "❌ Ошибка: Файл базы данных $DB_FILE не найден"
-    exit 1
-fi
-
-# Создать бэкап
 echo "📦 Создание бэкапа базы данных..."
-cp "$DB_FILE" "$BACKUP_FILE"
-
-if [ $? -eq 0 ]; then
-    echo "✅ Бэкап создан: $BACKUP_FILE"
-
-    # Получить размер файла
-    SIZE=$(du -h "$BACKUP_FILE" | cut -f1)
-    echo "📊 Размер бэкапа: $SIZE"
-
-    # Удалить старые бэкапы (оставить только последние MAX_BACKUPS)
-    BACKUP_COUNT=$(ls -1 "$BACKUP_DIR"/sogreto_bot_*.db 2>/dev/null | wc -l)
-
-    if [ "$BACKUP_COUNT" -gt "$MAX_BACKUPS" ]; then
-        echo "🧹 Удаление старых бэкапов (оставляем последние $MAX_BACKUPS)..."
-        ls -1t "$BACKUP_DIR"/sogreto_bot_*.db | tail -n +$((MAX_BACKUPS + 1)) | xargs rm -f
-        echo "✅ Старые бэкапы удалены"
-    fi
-
-    # Показать список существующих бэкапов
-    echo ""
-    echo "📁 Список бэкапов:"
-    ls -lh "$BACKUP_DIR"/sogreto_bot_*.db
-
-else
-    echo "❌ Ошибка при создании бэкапа"
-    exit 1
-fi
+python -m utils.backup || { echo "❌ Ошибка при создании бэкапа"; exit 1; }
 
 echo ""
-echo "✅ Бэкап завершён успешно"
+echo "📁 Список бэкапов:"
+ls -lh "${BACKUP_DIR:-backups}"/sogreto_* 2>/dev/null
@@ -0,0 +1,34 @@
+"""
+Общие фикстуры тестов: отдельная in-memory БД на каждый тест
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base
+
+
+@pytest.fixture
+def session_factory():
+    """Фабрика сессий над отдельной in-memory БД"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    """Сессия над отдельной in-memory БД"""
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,35 @@
+"""
+Тесты кэша отрисовки аккордеонов примеров и рецептов
+"""
+
+from utils.accordion import render_examples, render_recipes
+from utils.practices import practices_manager
+
+
+def _category_ids():
+    return [c['id'] for c in practices_manager.get_examples_menu().get('categories', [])]
+
+
+def test_same_state_returns_cached_render():
+    first_id = _category_ids()[0]
+    first = render_examples('telegram', {first_id})
+    again = render_examples('telegram', {first_id, 'unknown'})
+    assert first is again
+    assert render_examples('telegram', set()) is not first
+
+
+def test_platforms_rendered_separately():
+    text_tg, keyboard_tg = render_recipes('telegram', set(), stage4=True)
+    text_vk, keyboard_vk = render_recipes('vk', set(), stage4=True)
+    assert "**" in text_tg
+    assert "**" not in text_vk
+    assert isinstance(keyboard_vk, str) and 'next_step' in keyboard_vk
+    assert keyboard_tg.inline_keyboard[-1][0].callback_data == "next_step"
+
+
+def test_reload_invalidates_cache():
+    before = render_examples('vk', set())
+    practices_manager.load_practices()
+    after = render_examples('vk', set())
+    assert before is not after
+    assert before == after
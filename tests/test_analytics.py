@@ -0,0 +1,61 @@
+"""
+Тесты для когортной аналитики (in-memory SQLite)
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import User, UserProgress
+from utils.analytics import build_report, funnel, load_columns, retention, stage_durations
+
+
+START = datetime(2026, 1, 5, 9, 0)  # понедельник
+
+
+def _user(db, telegram_id, platform='telegram', stage=1, events=()):
+    user = User(
+        telegram_id=telegram_id, platform=platform, timezone='Europe/Moscow',
+        current_stage=stage, created_at=START, started_at=START
+    )
+    db.add(user)
+    db.flush()
+    for stage_id, day in events:
+        db.add(UserProgress(
+            user_id=user.id, user_telegram_id=telegram_id, stage_id=stage_id, step_id=1, day=day + 1,
+            completed_at=START + timedelta(days=day, hours=1)
+        ))
+    return user
+
+
+def test_report_counts_funnel_durations_and_retention(db):
+    _user(db, 1, events=[(1, 0), (2, 1), (3, 3)], stage=3)
+    _user(db, 2, events=[(1, 0), (2, 3)], stage=2)
+    _user(db, 3, platform='vk', events=[(1, 0)])
+    db.commit()
+
+    # Маленькие порции: свёртка не должна зависеть от границ чанков
+    columns = load_columns(db, chunk_size=2)
+    assert columns.events == 6
+
+    assert funnel(columns) == {'все': [3, 2, 1, 0, 0, 0]}
+    assert funnel(columns, by='platform') == {'telegram': [2, 2, 1, 0, 0, 0], 'vk': [1, 0, 0, 0, 0, 0]}
+
+    durations = stage_durations(columns)
+    assert durations[(1, 2)]['count'] == 2
+    assert durations[(1, 2)]['p50'] == pytest.approx(2.0)
+    assert durations[(2, 3)]['count'] == 1
+    assert durations[(3, 4)] == {'count': 0}
+
+    now = (START + timedelta(days=5)).timestamp()
+    shares = retention(columns, days=(1, 3, 7), now=now)['все']
+    assert shares[1] == pytest.approx(1 / 3)
+    assert shares[3] == pytest.approx(2 / 3)
+    assert shares[7] is None  # никто ещё не прожил 7 дней
+
+
+def test_report_on_empty_database(db):
+    report = build_report(db, by='week')
+
+    assert report['users'] == 0
+    assert report['events'] == 0
+    assert report['funnel'] == {}
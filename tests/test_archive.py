@@ -0,0 +1,43 @@
+"""
+Тесты для архивации истории прогресса (in-memory SQLite)
+"""
+import os
+from datetime import datetime
+
+from models import User, UserProgress
+from utils.archive import archive_progress, iter_archive
+from utils.db import get_or_create_user, get_user_stats, update_user_progress
+
+
+def _history(db, telegram_id, steps):
+    get_or_create_user(db, telegram_id=telegram_id)
+    for step in range(1, steps + 1):
+        update_user_progress(db, telegram_id, stage_id=1, step_id=step, day=1)
+
+
+def test_archives_old_rows_of_finished_and_inactive_users_only(db, tmp_path):
+    _history(db, 1, 3)  # завершил практики
+    _history(db, 2, 2)  # неактивен
+    _history(db, 3, 2)  # в процессе — не трогаем
+    db.query(User).filter_by(telegram_id=1).update({'current_stage': 7})
+    db.query(User).filter_by(telegram_id=2).update({'is_active': False})
+    db.query(UserProgress).update({'completed_at': datetime(2025, 1, 15)})
+    db.commit()
+
+    result = archive_progress(db, str(tmp_path), horizon_days=30, batch_size=2, pause=0)
+
+    assert result == {'rows': 5, 'months': {'2025-01': 5}}
+    assert db.query(UserProgress).count() == 2
+    archived = list(iter_archive(os.path.join(tmp_path, 'user_progress_2025-01.jsonl.gz')))
+    assert sorted(row['step_id'] for row in archived) == [1, 1, 2, 2, 3]
+    # Свёрнутые счётчики не уменьшаются
+    assert get_user_stats(db, 1)['completed_steps'] == 3
+
+
+def test_recent_rows_stay_in_table(db, tmp_path):
+    _history(db, 1, 2)
+    db.query(User).filter_by(telegram_id=1).update({'current_stage': 7})
+    db.commit()
+
+    assert archive_progress(db, str(tmp_path), horizon_days=30, pause=0)['rows'] == 0
+    assert db.query(UserProgress).count() == 2
@@ -0,0 +1,59 @@
+"""
+Тесты для резервного копирования (файловая SQLite во временном каталоге)
+"""
+import asyncio
+import gzip
+import sqlite3
+
+from utils.backup import read_history, run_backup
+
+
+def _make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO items (name) VALUES (?)", [(f"item{i}",) for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def test_sqlite_backup_is_restorable_and_recorded(tmp_path):
+    source = tmp_path / "bot.db"
+    _make_db(source, 500)
+    backup_dir = tmp_path / "backups"
+
+    record = asyncio.run(run_backup(f"sqlite:///{source}", str(backup_dir), keep=3, compression='gzip'))
+
+    restored = tmp_path / "restored.db"
+    with gzip.open(record['path'], 'rb') as src:
+        restored.write_bytes(src.read())
+    conn = sqlite3.connect(restored)
+    assert conn.execute("SELECT count(*) FROM items").fetchone()[0] == 500
+    conn.close()
+
+    assert record['bytes'] > 0
+    assert read_history(str(backup_dir)) == [record]
+    assert not [path for path in backup_dir.iterdir() if path.suffix in ('.part', '.snapshot')]
+
+
+def test_old_backups_are_rotated(tmp_path):
+    source = tmp_path / "bot.db"
+    _make_db(source, 10)
+    backup_dir = tmp_path / "backups"
+    backup_dir.mkdir()
+    for day in range(1, 4):
+        (backup_dir / f"sogreto_db_2026010{day}_030000.db.gz").write_bytes(b"old")
+
+    record = asyncio.run(run_backup(f"sqlite:///{source}", str(backup_dir), keep=2))
+
+    kept = sorted(path.name for path in backup_dir.glob("sogreto_db_*"))
+    assert kept == ["sogreto_db_20260103_030000.db.gz", record['path'].rsplit('/', 1)[-1]]
+
+
+def test_pg_dump_password_goes_to_environment():
+    from utils.backup import _pg_dump_args
+
+    dsn, env = _pg_dump_args("postgresql+psycopg2://bot:s3cret@db:5432/sogreto")
+
+    assert "s3cret" not in dsn
+    assert dsn == "postgresql://bot@db:5432/sogreto"
+    assert env['PGPASSWORD'] == "s3cret"
@@ -0,0 +1,58 @@
+"""
+Тесты формата callback-данных кнопок навигации
+"""
+
+from utils import callback_codec
+from utils.practices import practices_manager
+
+
+def test_roundtrip_fits_telegram_limit():
+    data = callback_codec.encode('complete_stage', 12, 345, now=1_700_000_000)
+    assert len(data.encode('utf-8')) <= 64
+
+    callback = callback_codec.decode(data)
+    assert callback.action == 'complete_stage'
+    assert (callback.stage, callback.step) == (12, 345)
+    assert callback.version == practices_manager.content_tag
+    assert callback.issued == 1_700_000_000
+
+
+def test_legacy_and_stateless_actions_pass_through():
+    assert callback_codec.encode('show_recipes', 1, 2) == 'show_recipes'
+    assert callback_codec.encode('next_step') == 'next_step'
+
+    callback = callback_codec.decode('replant_step_3')
+    assert callback.action == 'replant_step_3'
+    assert not callback.has_context
+    assert callback_codec.stale_reason(callback) is None
+    assert callback_codec.matches_progress(callback, 4, 1)
+
+
+def test_stale_buttons_are_rejected():
+    now = 1_700_000_000
+    fresh = callback_codec.decode(callback_codec.encode('next_step', 1, 3, now=now))
+    assert callback_codec.stale_reason(fresh, now=now + 60) is None
+    assert callback_codec.stale_reason(fresh, now=now + callback_codec.CALLBACK_TTL + 1) == 'expired'
+    assert callback_codec.stale_reason(fresh._replace(version='000000'), now=now) == 'version'
+
+    assert callback_codec.matches_progress(fresh, 1, 3)
+    assert not callback_codec.matches_progress(fresh, 1, 4)
+
+
+def test_press_is_answered_when_router_fails_before_progress_check(monkeypatch):
+    """Ошибка до сверки с прогрессом не оставляет кнопку VK «крутиться»"""
+    import asyncio
+    from vk_handlers import practices as vk_practices
+
+    def broken_lookup(db, user_id):
+        raise RuntimeError("БД недоступна")
+
+    monkeypatch.setattr(vk_practices, '_get_user', broken_lookup)
+    answers = []
+
+    async def answer(text=None):
+        answers.append(text)
+
+    action = callback_codec.encode('next_step', 1, 2)
+    asyncio.run(vk_practices.vk_handle_practice_callback(None, 1, 1, 1, action, answer=answer))
+    assert answers == [None]
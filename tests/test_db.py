@@ -0,0 +1,330 @@
+"""
+Тесты для утилит работы с базой данных (in-memory SQLite)
+"""
+
+from sqlalchemy import create_engine
+
+from models import User, UserProgress
+from utils.db import get_or_create_user, get_or_create_vk_user
+
+
+def test_get_or_create_user_inserts_once(db):
+    """Повторный контакт обновляет строку, а не создаёт новую"""
+    first = get_or_create_user(db, telegram_id=111, username="old", first_name="Аня")
+    second = get_or_create_user(db, telegram_id=111, username="new", first_name="Аня")
+
+    assert first.id == second.id
+    assert second.username == "new"
+    assert second.platform == "telegram"
+    assert second.current_stage == 1
+    assert db.query(User).count() == 1
+
+
+def test_get_or_create_user_keeps_progress(db):
+    """Upsert не затирает прогресс существующего пользователя"""
+    user = get_or_create_user(db, telegram_id=222)
+    user.current_stage = 3
+    user.current_step = 9
+    db.commit()
+
+    again = get_or_create_user(db, telegram_id=222, first_name="Иван")
+    assert again.current_stage == 3
+    assert again.current_step == 9
+    assert again.first_name == "Иван"
+
+
+def test_get_or_create_vk_user(db):
+    """VK-пользователь создаётся с platform='vk' и не конфликтует с Telegram"""
+    tg = get_or_create_user(db, telegram_id=333)
+    vk = get_or_create_vk_user(db, vk_id=333, first_name="Оля")
+    vk_again = get_or_create_vk_user(db, vk_id=333, first_name="Оля", last_name="К")
+
+    assert tg.id != vk.id
+    assert vk.id == vk_again.id
+    assert vk_again.platform == "vk"
+    assert vk_again.last_name == "К"
+    assert db.query(User).count() == 2
+
+
+def test_mark_users_inactive_and_reactivate_on_contact(db):
+    """Заблокировавшие бота деактивируются пачкой и возвращаются при новом сообщении"""
+    from utils.db import mark_users_inactive
+
+    for telegram_id in (1, 2, 3):
+        get_or_create_user(db, telegram_id=telegram_id)
+
+    assert mark_users_inactive(db, 'telegram', [1, 2], 'blocked') == 2
+    # Повторная пометка не трогает уже неактивных
+    assert mark_users_inactive(db, 'telegram', [1], 'blocked') == 0
+
+    inactive = db.query(User).filter(User.is_active == False).all()
+    assert sorted(u.telegram_id for u in inactive) == [1, 2]
+    assert all(u.deactivation_reason == 'blocked' and u.deactivated_at for u in inactive)
+
+    user = get_or_create_user(db, telegram_id=1)
+    assert user.is_active is True
+    assert user.deactivation_reason is None
+
+
+def test_concurrent_user_update_is_retried_on_fresh_row(db):
+    """Запись по устаревшей версии не затирает чужую, а повторяется поверх неё"""
+    from sqlalchemy.orm import Session
+    from utils.db import update_user_cas
+
+    user = get_or_create_user(db, telegram_id=444)
+    version = user.version
+
+    # Другой процесс успел изменить строку
+    other = Session(bind=db.get_bind())
+    other.get(User, user.id).daily_practice_substep = "practice"
+    other.commit()
+    other.close()
+
+    def start_day(u):
+        if u.daily_practice_day != 0:
+            return False
+        u.daily_practice_day = 1
+
+    assert update_user_cas(db, user, start_day) is True
+    assert user.daily_practice_day == 1
+    assert user.daily_practice_substep == "practice"
+    assert user.version == version + 2
+
+    # Условие больше не выполняется — ничего не пишется
+    assert update_user_cas(db, user, start_day) is False
+    assert user.version == version + 2
+
+
+def test_stale_progress_step_is_not_reapplied(session_factory):
+    """Шаг, вычисленный по устаревшей строке, не записывается поверх чужого продвижения"""
+    from sqlalchemy.orm.exc import StaleDataError
+    from utils.db import update_user_progress_obj
+
+    db = session_factory()
+    user = get_or_create_user(db, telegram_id=445)
+    update_user_progress_obj(db, user, stage_id=1, step_id=2, day=1)
+    history = db.query(UserProgress).count()
+
+    # Другой процесс уже перевёл пользователя на шаг 3, пока обработчик держал шаг 2
+    other = session_factory()
+    assert update_user_progress_obj(other, other.get(User, user.id), stage_id=1, step_id=3, day=1)
+    other.close()
+
+    assert update_user_progress_obj(db, user, stage_id=1, step_id=3, day=1) is False
+    assert (user.current_stage, user.current_step) == (1, 3)
+    assert db.query(UserProgress).count() == history + 1
+
+    # Прямой commit по устаревшей версии не затирает чужую запись, а падает
+    other = session_factory()
+    other.get(User, user.id).is_paused = True
+    other.commit()
+    other.close()
+    user.daily_practice_substep = "practice"
+    try:
+        db.commit()
+        assert False, "ожидался конфликт версий"
+    except StaleDataError:
+        db.rollback()
+    assert user.is_paused is True
+    assert user.daily_practice_substep != "practice"
+    db.close()
+
+
+def test_reminder_sweep_projection_is_narrow_and_writable(db):
+    """Проход планировщика загружает только свои колонки и может писать по версии"""
+    from datetime import datetime
+    from sqlalchemy.orm import load_only
+    from models import REMINDER_SWEEP_COLUMNS
+    from utils.db import update_user_cas
+
+    user = get_or_create_user(db, telegram_id=555, first_name="Аня")
+    user.started_at = datetime.utcnow()
+    db.commit()
+    db.expunge_all()
+
+    swept = db.query(User).options(
+        load_only(*(getattr(User, name) for name in REMINDER_SWEEP_COLUMNS))
+    ).filter(User.is_active == True, User.started_at.isnot(None)).one()
+    assert 'first_name' not in swept.__dict__
+    assert 'timezone' in swept.__dict__
+
+    assert update_user_cas(db, swept, lambda u: setattr(u, 'last_reminder_sent', datetime.utcnow()))
+    assert swept.first_name == "Аня"
+
+
+def test_reminder_sweep_uses_partial_index(db):
+    """Запрос прохода планировщика отбирает строки по частичному ix_users_reminder_sweep"""
+    from sqlalchemy.orm import load_only
+    from models import REMINDER_SWEEP_COLUMNS
+
+    query = db.query(User).options(
+        load_only(*(getattr(User, name) for name in REMINDER_SWEEP_COLUMNS))
+    ).filter(
+        User.is_active == True,
+        User.is_paused == False,
+        User.started_at.isnot(None),
+        User.platform.in_(('telegram', 'vk'))
+    )
+    compiled = query.statement.compile(db.get_bind(), compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    assert any('USING INDEX ix_users_reminder_sweep' in row[-1] for row in plan), plan
+
+def test_progress_history_is_keyed_by_user_not_platform_id(db):
+    """Одинаковые ID в Telegram и VK не смешивают историю"""
+    from utils.db import get_user_history, get_user_stats, update_user_progress_obj
+
+    tg = get_or_create_user(db, telegram_id=777)
+    vk = get_or_create_vk_user(db, vk_id=777)
+    update_user_progress_obj(db, tg, stage_id=1, step_id=2, day=1)
+    update_user_progress_obj(db, tg, stage_id=1, step_id=3, day=1)
+    update_user_progress_obj(db, vk, stage_id=1, step_id=2, day=1)
+
+    assert get_user_stats(db, 777)['completed_steps'] == 2
+    history = get_user_history(db, tg, limit=1)
+    assert [(p.user_id, p.step_id) for p in history] == [(tg.id, 3)]
+
+
+def test_progress_counters_follow_history(db):
+    """Счётчики пользователя и глобальные растут вместе с историей"""
+    from utils.db import get_progress_counters, get_user_stats, update_user_progress_obj
+
+    user = get_or_create_user(db, telegram_id=888)
+    update_user_progress_obj(db, user, stage_id=3, step_id=1, day=1)
+    update_user_progress_obj(db, user, stage_id=3, step_id=2, day=2)
+    other = get_or_create_vk_user(db, vk_id=888)
+    update_user_progress_obj(db, other, stage_id=1, step_id=2, day=1)
+
+    stats = get_user_stats(db, 888)
+    assert stats['completed_steps'] == 2
+    assert stats['days_practiced'] == 1  # Оба шага в один день
+    assert stats['last_completed_at'] is not None
+    assert get_progress_counters(db) == {'stage': {1: 1, 3: 2}, 'day': {1: 2, 2: 1}}
+
+
+def test_list_users_page_keyset_and_filters(db):
+    """Страницы идут по id без пропусков, фильтры и поиск по началу имени"""
+    from utils.db import list_users_page
+
+    for telegram_id in range(1, 8):
+        get_or_create_user(db, telegram_id=telegram_id, username=f"user{telegram_id}",
+                           first_name="Anna" if telegram_id % 3 == 0 else "Bob")
+    get_or_create_vk_user(db, vk_id=100, first_name="An_na")
+
+    first, has_prev, has_next = list_users_page(db, limit=3)
+    assert [row.telegram_id for row in first] == [1, 2, 3] and not has_prev and has_next
+    second, has_prev, has_next = list_users_page(db, after_id=first[-1].id, limit=3)
+    assert [row.telegram_id for row in second] == [4, 5, 6] and has_prev and has_next
+    back, has_prev, _ = list_users_page(db, before_id=second[0].id, limit=3)
+    assert [row.id for row in back] == [row.id for row in first] and not has_prev
+
+    found, _, _ = list_users_page(db, search="AN", limit=10)
+    assert [row.first_name for row in found] == ["Anna", "Anna", "An_na"]
+    # '_' в запросе — обычный символ, а не шаблон LIKE
+    found, _, _ = list_users_page(db, search="an_", platform='vk', limit=10)
+    assert [row.vk_id for row in found] == [100]
+    assert list_users_page(db, search="an_", platform='telegram', limit=10)[0] == []
+
+
+def test_sqlite_engine_gets_production_pragmas(tmp_path):
+    """Файловая SQLite открывается в WAL с busy_timeout"""
+    from sqlalchemy import text
+    from models import configure_sqlite
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'bot.db'}")
+    configure_sqlite(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+    engine.dispose()
+
+
+def test_busy_database_write_is_retried(db, monkeypatch):
+    """'database is locked' при коммите повторяется как короткая транзакция"""
+    import sqlite3
+    from sqlalchemy.exc import OperationalError
+    from utils.db import update_user_cas
+
+    user = get_or_create_user(db, telegram_id=666)
+    commit = db.commit
+    failures = []
+
+    def flaky_commit():
+        if not failures:
+            failures.append(1)
+            raise OperationalError("COMMIT", {}, sqlite3.OperationalError("database is locked"))
+        commit()
+
+    monkeypatch.setattr(db, 'commit', flaky_commit)
+
+    def pause(u):
+        u.is_paused = True
+
+    assert update_user_cas(db, user, pause) is True
+    assert failures == [1]
+    assert user.is_paused is True
+
+
+def test_pool_events_feed_metrics(tmp_path):
+    """Выдачи соединений, занятые и ожидание попадают в метрики"""
+    from models import InstrumentedQueuePool, instrument_pool
+    from utils.metrics import metrics
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool, pool_size=2)
+    instrument_pool(engine)
+    checkouts = metrics.counter('db.pool.checkouts')
+
+    with engine.connect():
+        with engine.connect():
+            assert metrics.snapshot()['gauges']['db.pool.in_use'] == 2
+    assert metrics.snapshot()['gauges']['db.pool.in_use'] == 0
+    assert metrics.counter('db.pool.checkouts') == checkouts + 2
+    assert metrics.snapshot()['latency']['db.pool.checkout_wait']['count'] >= 2
+    engine.dispose()
+
+
+def test_in_memory_engine_without_queue_pool_can_connect():
+    """in-memory SQLite остаётся на SingletonThreadPool — метрики пула его не ломают"""
+    from sqlalchemy import text
+    from models import engine_options, instrument_pool
+    from utils.metrics import metrics
+
+    engine = create_engine("sqlite://", **engine_options("sqlite://"))
+    instrument_pool(engine)
+    checkouts = metrics.counter('db.pool.checkouts')
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+    assert metrics.counter('db.pool.checkouts') == checkouts + 1
+    engine.dispose()
+
+
+def test_first_query_is_retried_after_disconnect(tmp_path):
+    """Обрыв на первом запросе транзакции повторяется по новому соединению"""
+    import sqlite3
+    from sqlalchemy import event, select
+    from models import RetryingSession, instrument_pool
+    from utils.metrics import metrics
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'retry.db'}")
+    instrument_pool(engine)
+    failures = []
+
+    @event.listens_for(engine, 'do_execute')
+    def drop_once(cursor, statement, parameters, context):
+        if not failures:
+            failures.append(statement)
+            raise sqlite3.OperationalError("server closed the connection unexpectedly")
+
+    @event.listens_for(engine, 'handle_error')
+    def as_disconnect(context):
+        context.is_disconnect = True
+
+    retries = metrics.counter('db.pool.disconnect_retries')
+    session = RetryingSession(bind=engine)
+    assert session.scalar(select(1)) == 1
+    assert len(failures) == 1
+    assert metrics.counter('db.pool.disconnect_retries') == retries + 1
+    session.close()
+    engine.dispose()
@@ -0,0 +1,73 @@
+"""
+Тесты для переноса данных между базами (две in-memory SQLite)
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, delete, update
+from sqlalchemy.pool import StaticPool
+
+from models import Base, User, UserProgress
+from utils.db_transfer import table_checksum, transfer, transfer_table
+
+
+def _engine():
+    return create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+
+
+@pytest.fixture
+def engines():
+    source, target = _engine(), _engine()
+    Base.metadata.create_all(bind=source)
+    with source.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'id': i, 'telegram_id': 100 + i, 'first_name': f"u{i}", 'is_paused': i % 2 == 0,
+             'created_at': datetime(2026, 1, i), 'updated_at': datetime(2026, 1, i)}
+            for i in range(1, 8)
+        ])
+        conn.execute(UserProgress.__table__.insert(), [
+            {'user_id': 1, 'user_telegram_id': 101, 'stage_id': 1, 'step_id': step, 'day': 1,
+             'user_response': None, 'completed_at': datetime(2026, 1, 1, 10, step)}
+            for step in range(1, 4)
+        ])
+    try:
+        yield source, target
+    finally:
+        source.dispose()
+        target.dispose()
+
+
+def test_transfer_copies_and_verifies(engines):
+    source, target = engines
+
+    report = transfer(source, target, chunk_size=3)
+
+    assert report['users']['copied'] == 7
+    assert report['user_progress']['copied'] == 3
+    assert all(entry['ok'] for entry in report.values())
+
+
+def test_transfer_resumes_after_last_copied_id(engines):
+    source, target = engines
+    Base.metadata.create_all(bind=target)
+    transfer_table(source, target, User.__table__)
+    with target.begin() as conn:
+        # Как будто прошлый запуск успел записать только первые порции
+        conn.execute(delete(User.__table__).where(User.__table__.c.id > 4))
+
+    assert transfer_table(source, target, User.__table__, chunk_size=2) == 3
+    assert table_checksum(source, User.__table__) == table_checksum(target, User.__table__)
+
+
+def test_checksum_detects_changed_row(engines):
+    source, target = engines
+    transfer(source, target)
+
+    with target.begin() as conn:
+        conn.execute(update(User.__table__).where(User.__table__.c.id == 3).values(first_name="other"))
+
+    assert table_checksum(source, User.__table__) != table_checksum(target, User.__table__)
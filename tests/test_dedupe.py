@@ -0,0 +1,100 @@
+"""
+Тесты защиты от повторной обработки апдейтов
+"""
+
+from datetime import datetime, timedelta
+
+from utils.dedupe import ExpiringKeys, UpdateDeduplicator, UpdateHighWaterMark
+from utils.metrics import metrics
+
+
+def test_redelivery_and_double_tap_are_suppressed():
+    dedupe = UpdateDeduplicator(ttl=60, debounce=1.5)
+    suppressed = metrics.counter('vk.dedupe.update')
+
+    assert dedupe.check('vk', ['event:a'], user_id=1, action='next_step', now=0) is None
+    assert dedupe.check('vk', ['event:a'], user_id=1, action='next_step', now=5) == 'update'
+    assert metrics.counter('vk.dedupe.update') == suppressed + 1
+
+    # Новое событие с тем же действием сразу после первого — двойное нажатие
+    assert dedupe.check('vk', ['event:b'], user_id=1, action='next_step', now=0.5) == 'debounce'
+    assert dedupe.check('vk', ['event:c'], user_id=1, action='next_step', now=2.0) is None
+    # Другой пользователь и другая платформа не мешают друг другу
+    assert dedupe.check('vk', ['event:d'], user_id=2, action='next_step', now=2.0) is None
+    assert dedupe.check('telegram', ['event:a'], now=5) is None
+
+
+def test_keys_expire_and_are_bounded():
+    keys = ExpiringKeys(ttl=10, max_entries=3)
+    assert keys.add('a', now=0)
+    assert not keys.add('a', now=9)
+    assert keys.add('a', now=11)
+
+    for key in 'bcde':
+        keys.add(key, now=12)
+    assert len(keys) == 3
+
+
+def test_redelivery_after_restart_is_suppressed(session_factory):
+    now = datetime(2026, 3, 1, 12, 0)
+    before_crash = UpdateHighWaterMark('telegram', session_factory)
+    assert not before_crash.is_processed(100, now=now)
+    before_crash.advance(100, now=now)
+    before_crash.advance(99, now=now)  # отметка назад не сдвигается
+
+    restarted = UpdateHighWaterMark('telegram', session_factory)
+    assert restarted.is_processed(100, now=now + timedelta(minutes=1))
+    assert not restarted.is_processed(101, now=now + timedelta(minutes=1))
+    # Старая отметка не применяется: update_id мог начаться заново
+    assert not restarted.is_processed(50, now=now + timedelta(days=2))
+
+
+def test_update_in_flight_at_crash_is_redelivered(session_factory, monkeypatch):
+    """Апдейт, на котором процесс остановился, после перезапуска обрабатывается заново"""
+    import asyncio
+
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+
+    from utils import dedupe
+
+    now = datetime.utcnow()
+    mark = UpdateHighWaterMark('telegram', session_factory)
+    monkeypatch.setattr(dedupe, 'telegram_update_mark', mark)
+    handled = []
+
+    async def handler(update, context):
+        handled.append(update.update_id)
+        if update.update_id == 201:
+            raise asyncio.CancelledError  # процесс остановлен посреди обработки
+
+    app = Application.builder().application_class(dedupe.TelegramDedupeApplication).token("1:test").build()
+    app.add_handler(TypeHandler(Update, dedupe.telegram_dedupe_handler), group=-1)
+    app.add_handler(TypeHandler(Update, handler))
+    monkeypatch.setattr(app, '_check_initialized', lambda: None)  # без сети (getMe)
+
+    async def run():
+        await app.process_update(Update(200))
+        try:
+            await app.process_update(Update(201))
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert handled == [200, 201]
+
+    restarted = UpdateHighWaterMark('telegram', session_factory)
+    assert restarted.is_processed(200, now=now)
+    assert not restarted.is_processed(201, now=now)
+
+
+def test_mark_stops_before_earliest_update_in_flight(session_factory):
+    mark = UpdateHighWaterMark('telegram', session_factory)
+    now = datetime(2026, 3, 1, 12, 0)
+    mark.begin(300)
+    mark.begin(301)
+    mark.finish(301, now=now)  # 300 ещё обрабатывается
+
+    restarted = UpdateHighWaterMark('telegram', session_factory)
+    assert restarted.is_processed(299, now=now)
+    assert not restarted.is_processed(300, now=now)
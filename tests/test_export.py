@@ -0,0 +1,60 @@
+"""
+Тесты для инкрементальной выгрузки (in-memory SQLite)
+"""
+import csv
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from models import User, UserProgress
+from utils.export import load_watermarks, run_export
+
+
+def _read_jsonl(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_second_run_exports_only_changed_rows(session_factory, tmp_path):
+    past = datetime.utcnow() - timedelta(hours=1)
+    db = session_factory()
+    for telegram_id in (1, 2, 3):
+        db.add(User(telegram_id=telegram_id, first_name=f"u{telegram_id}", updated_at=past))
+    db.commit()
+    db.add(UserProgress(user_id=1, user_telegram_id=1, stage_id=1, step_id=1, day=1, completed_at=past))
+    db.commit()
+
+    first = run_export(str(tmp_path), session_factory=session_factory, chunk_size=2, lag=0)
+    assert first['users']['rows'] == 3
+    assert first['user_progress']['rows'] == 1
+    assert [row['telegram_id'] for row in _read_jsonl(first['users']['path'])] == [1, 2, 3]
+    assert load_watermarks(str(tmp_path))['user_progress'] == {'id': 1}
+
+    # Без изменений — ни файлов, ни сдвига отметок
+    again = run_export(str(tmp_path), session_factory=session_factory, lag=0)
+    assert again['users'] == {'path': None, 'rows': 0}
+
+    user = db.query(User).filter_by(telegram_id=2).one()
+    user.first_name = "changed"
+    db.add(UserProgress(user_id=2, user_telegram_id=2, stage_id=1, step_id=1, day=1, completed_at=past))
+    db.commit()
+    db.close()
+
+    delta = run_export(str(tmp_path), fmt='csv', session_factory=session_factory, lag=0)
+    with gzip.open(delta['users']['path'], 'rt', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['first_name'] for row in rows] == ["changed"]
+    assert rows[0]['is_active'] == 't'
+    assert delta['user_progress']['rows'] == 1
+
+
+def test_lag_postpones_fresh_rows(session_factory, tmp_path):
+    db = session_factory()
+    db.add(User(telegram_id=1))
+    db.commit()
+    db.close()
+
+    summary = run_export(str(tmp_path), session_factory=session_factory, lag=600)
+
+    assert summary['users']['rows'] == 0
+    assert 'users' not in load_watermarks(str(tmp_path))
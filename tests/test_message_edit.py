@@ -0,0 +1,59 @@
+"""
+Тесты пропуска повторных правок сообщений
+"""
+
+import asyncio
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from utils.message_edit import content_hash, edit_message_text, rendered_cache
+from utils.metrics import metrics
+
+
+class FakeMessage:
+    def __init__(self, chat_id, message_id):
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+
+class FakeQuery:
+    def __init__(self, chat_id=1, message_id=10, not_modified=False):
+        self.message = FakeMessage(chat_id, message_id)
+        self.inline_message_id = None
+        self.not_modified = not_modified
+        self.edits = []
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None, **kwargs):
+        if self.not_modified:
+            raise BadRequest("Message is not modified: specified new message content and reply markup are exactly the same")
+        self.edits.append(text)
+        return True
+
+
+def _keyboard(label):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data="x")]])
+
+
+def test_identical_edit_is_skipped():
+    query = FakeQuery(chat_id=501)
+    skipped = metrics.counter('telegram.edit.skipped')
+
+    async def run():
+        await edit_message_text(query, "текст", reply_markup=_keyboard("a"))
+        await edit_message_text(query, "текст", reply_markup=_keyboard("a"))
+        await edit_message_text(query, "текст", reply_markup=_keyboard("b"))
+
+    asyncio.run(run())
+    assert query.edits == ["текст", "текст"]
+    assert metrics.counter('telegram.edit.skipped') == skipped + 1
+
+
+def test_not_modified_error_is_swallowed():
+    query = FakeQuery(chat_id=502, not_modified=True)
+
+    async def run():
+        return await edit_message_text(query, "текст")
+
+    assert asyncio.run(run()) is None
+    assert rendered_cache.matches((502, 10), content_hash("текст"))
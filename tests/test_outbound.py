@@ -0,0 +1,66 @@
+"""
+Тесты приоритетной очереди исходящих сообщений
+"""
+
+import asyncio
+
+from utils.outbound import OutboundQueue, Priority, send_priority, current_priority
+
+
+def test_interactive_preempts_reminders():
+    queue = OutboundQueue('test', rate=20, reserve=0)
+    order = []
+
+    async def send(label, priority):
+        await queue.acquire(priority)
+        order.append(label)
+
+    async def run():
+        # Выбрать весь запас токенов, чтобы дальше всё шло через очередь
+        queue._bucket.tokens = 0
+        tasks = [asyncio.create_task(send(f"r{i}", Priority.REMINDER)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(send("click", Priority.INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order[0] == "click"
+    assert order[1:] == ["r0", "r1", "r2"]
+
+
+def test_reserve_is_kept_for_interactive():
+    queue = OutboundQueue('test', rate=10, reserve=0.5)
+
+    async def run():
+        queue._bucket.tokens = 3
+        await asyncio.wait_for(queue.acquire(Priority.INTERACTIVE), timeout=0.05)
+        try:
+            await asyncio.wait_for(queue.acquire(Priority.REMINDER), timeout=0.05)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    # Для напоминания нужно 1 + 5 токенов резерва — сразу не выдаётся
+    assert asyncio.run(run()) is False
+
+
+def test_per_chat_limit_lets_other_chats_through():
+    queue = OutboundQueue('test', rate=100, chat_rate=1, chat_burst=1)
+    order = []
+
+    async def send(label, chat_id):
+        await queue.acquire(Priority.INTERACTIVE, chat_id)
+        order.append(label)
+
+    async def run():
+        await asyncio.gather(send("a1", 1), send("a2", 1), send("b1", 2))
+
+    asyncio.run(run())
+    assert order == ["a1", "b1", "a2"]
+
+
+def test_send_priority_context():
+    assert current_priority() == Priority.INTERACTIVE
+    with send_priority(Priority.REMINDER):
+        assert current_priority() == Priority.REMINDER
+    assert current_priority() == Priority.INTERACTIVE
@@ -0,0 +1,74 @@
+"""
+Тесты для пакетного удаления пользователей (in-memory SQLite)
+"""
+from datetime import datetime, timedelta
+
+from models import ScheduledReminder, User, UserProgress, UserStats
+from utils.db import delete_user_data, get_or_create_user, get_or_create_vk_user, update_user_progress_obj
+from utils.purge import inactive_condition, purge_user, purge_users
+
+
+def _with_history(db, user, steps=3):
+    for step in range(1, steps + 1):
+        update_user_progress_obj(db, user, stage_id=1, step_id=step, day=1)
+    return user
+
+
+def test_purge_vk_user_keeps_telegram_user_with_same_id(db):
+    vk_user_id = _with_history(db, get_or_create_vk_user(db, vk_id=555)).id
+    tg_user_id = _with_history(db, get_or_create_user(db, telegram_id=555)).id
+
+    totals = purge_user(db, 'vk', 555, batch_size=2, pause=0)
+
+    assert totals == {'users': 1, 'progress': 3, 'reminders': 0}
+    assert db.query(User).count() == 1
+    assert {row.user_id for row in db.query(UserProgress)} == {tg_user_id}
+    assert db.get(UserStats, vk_user_id) is None
+
+
+def test_delete_user_data_removes_reminders_and_legacy_rows(db):
+    _with_history(db, get_or_create_user(db, telegram_id=42), steps=2)
+    db.add(UserProgress(user_telegram_id=42, stage_id=1, step_id=1, day=1))  # до backfill user_id
+    db.add(ScheduledReminder(user_telegram_id=42, reminder_type='daily', scheduled_time=datetime.utcnow()))
+    db.commit()
+
+    delete_user_data(db, 42)
+
+    assert db.query(User).count() == 0
+    assert db.query(UserProgress).count() == 0
+    assert db.query(ScheduledReminder).count() == 0
+
+
+def test_purge_inactive_users_in_groups(db):
+    old = datetime.utcnow() - timedelta(days=400)
+    for telegram_id in range(1, 6):
+        _with_history(db, get_or_create_user(db, telegram_id=telegram_id), steps=1)
+    db.query(User).filter(User.telegram_id <= 3).update({'last_interaction': old})
+    db.commit()
+    reports = []
+
+    totals = purge_users(db, inactive_condition(180), user_batch=2, pause=0, progress=reports.append)
+
+    assert totals['users'] == 3
+    assert [report['users'] for report in reports] == [2, 3]
+    assert sorted(user.telegram_id for user in db.query(User)) == [4, 5]
+
+
+def test_purge_removes_archived_history(db, tmp_path):
+    from utils.archive import archive_progress, iter_archive
+
+    old = datetime.utcnow() - timedelta(days=400)
+    _with_history(db, get_or_create_user(db, telegram_id=77), steps=2)
+    kept = _with_history(db, get_or_create_user(db, telegram_id=78), steps=2)
+    db.query(User).update({'is_active': False})
+    db.query(UserProgress).update({'completed_at': old})
+    db.commit()
+    kept_id = kept.id
+    archive_progress(db, archive_dir=str(tmp_path), pause=0)
+
+    totals = purge_user(db, 'telegram', 77, pause=0, archive_dir=str(tmp_path))
+
+    assert totals['progress'] == 2
+    archived = [row for path in tmp_path.glob("user_progress_*.jsonl.gz") for row in iter_archive(path)]
+    assert {row['user_id'] for row in archived} == {kept_id}
+    assert not list(tmp_path.glob("*.purge"))
@@ -0,0 +1,124 @@
+"""
+Тесты хранилища состояния диалогов
+"""
+
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, SessionState, User
+from utils.session_state import DBStateBackend, SessionStateStore
+
+
+def _backend(telegram_ids=(1, 7, 8), vk_ids=(1, 5)):
+    """Бэкенд над in-memory БД; состояние пишется только для существующих users"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add_all([User(platform='telegram', telegram_id=i) for i in telegram_ids]
+               + [User(platform='vk', vk_id=i) for i in vk_ids])
+    db.commit()
+    db.close()
+    return DBStateBackend(factory)
+
+
+def test_memory_store_is_bounded():
+    store = SessionStateStore(max_entries=2)
+    assert store.toggle('telegram', 1, 'opened', 'a') == {'a'}
+    assert store.toggle('telegram', 1, 'opened', 'a') == set()
+    store.set('telegram', 2, 'opened', {'b'})
+    store.set('vk', 2, 'opened', {'c'})
+
+    assert store.stats()['entries'] == 2
+    assert store.evictions == 1
+    assert store.get('vk', 2, 'opened') == ['c']
+    # Без постоянного уровня вытесненное состояние теряется
+    assert store.get('telegram', 1, 'opened') is None
+
+
+def test_evicted_state_is_read_back_from_db():
+    backend = _backend()
+    store = SessionStateStore(backend, max_entries=1)
+    store.toggle('telegram', 1, 'opened', 'a')
+    store.toggle('vk', 1, 'opened', 'b')
+
+    assert store.get('telegram', 1, 'opened') == ['a']
+    assert SessionStateStore(backend).get('vk', 1, 'opened') == ['b']
+
+    store.delete('vk', 1, 'opened')
+    db = backend.session_factory()
+    try:
+        assert db.query(SessionState).filter_by(platform='vk').count() == 0
+    finally:
+        db.close()
+
+
+def test_writes_are_coalesced():
+    backend = _backend()
+    saves = []
+    original = backend.save
+
+    def save(rows, deleted, max_age):
+        saves.append(len(rows))
+        original(rows, deleted, max_age)
+
+    backend.save = save
+    store = SessionStateStore(backend, flush_interval=0.01)
+
+    async def run():
+        for item in 'abcde':
+            store.toggle('telegram', 7, 'opened', item)
+        store.toggle('telegram', 8, 'opened', 'x')
+        await store._task
+
+    asyncio.run(run())
+    assert saves == [2]
+    assert SessionStateStore(backend).get('telegram', 7, 'opened') == list('abcde')
+
+
+def test_other_process_changes_are_seen_after_memory_ttl(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('utils.session_state.time.monotonic', lambda: clock[0])
+    backend = _backend()
+    first = SessionStateStore(backend, memory_ttl=30)
+    second = SessionStateStore(backend, memory_ttl=30)
+
+    first.set('vk', 5, 'opened', ['a'])
+    assert second.get('vk', 5, 'opened') == ['a']
+
+    first.set('vk', 5, 'opened', ['a', 'b'])
+    assert second.get('vk', 5, 'opened') == ['a']  # ещё свежая копия в памяти
+    clock[0] += 31
+    assert second.get('vk', 5, 'opened') == ['a', 'b']
+
+
+def test_flush_does_not_resurrect_purged_user():
+    """Отложенная запись бота после purge не возвращает строку session_state"""
+    from utils.purge import purge_user
+
+    backend = _backend()
+    bot_store = SessionStateStore(backend)
+    bot_store.set('vk', 5, 'opened', ['a'])
+
+    db = backend.session_factory()
+    try:
+        purge_user(db, 'vk', 5, pause=0)
+    finally:
+        db.close()
+
+    # Память бота ещё помнит пользователя, и он успел нажать кнопку
+    bot_store.set('vk', 5, 'opened', ['a', 'b'])
+    bot_store.set('vk', 1, 'opened', ['c'])
+
+    db = backend.session_factory()
+    try:
+        assert [row.user_id for row in db.query(SessionState)] == [1]
+    finally:
+        db.close()
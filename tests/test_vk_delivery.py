@@ -0,0 +1,269 @@
+"""
+Тесты пакетной отправки VK-сообщений через execute
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from utils import scheduler
+from utils.vk_client import call_with_retry, vk_random_id
+from utils.vk_delivery import (
+    DELIVERY_UNKNOWN,
+    EXECUTE_MAX_CALLS,
+    SEND_MAX_PEERS,
+    VKExecuteBatch,
+    build_execute_code,
+    call_params,
+    group_by_content,
+    parse_execute_response,
+)
+
+
+class FakeMessages:
+    def __init__(self, fail_peers=()):
+        self.sent = []
+        self.random_ids = {}
+        self.fail_peers = set(fail_peers)
+
+    async def send(self, **params):
+        if params['peer_id'] in self.fail_peers:
+            error = Exception("blocked")
+            error.code = 901
+            raise error
+        self.sent.append(params['peer_id'])
+        self.random_ids[params['peer_id']] = params.get('random_id')
+        return 1
+
+
+class FakeAPI:
+    """Имитация VK API: execute проваливает вызовы для peer_id из failing"""
+
+    def __init__(self, failing=(), fail_execute=False, fail_single=()):
+        self.failing = set(failing)
+        self.fail_execute = fail_execute
+        self.executes = []
+        self.messages = FakeMessages(fail_single)
+
+    async def request(self, method, data):
+        assert method == "execute"
+        self.executes.append(data["code"])
+        if self.fail_execute:
+            raise Exception("network")
+        calls = [json.loads(part.rstrip(",];").rstrip(")"))
+                 for part in data["code"].split("API.messages.send(")[1:]]
+        response, errors = [], []
+        for call in calls:
+            if "peer_ids" in call:
+                peers = [int(p) for p in call["peer_ids"].split(",")]
+                response.append([
+                    {"peer_id": p, "error": {"code": 901}} if p in self.failing
+                    else {"peer_id": p, "message_id": 100 + p}
+                    for p in peers
+                ])
+            elif call["peer_id"] in self.failing:
+                response.append(False)
+                errors.append({"method": "messages.send", "error_code": 901})
+            else:
+                response.append(100 + call["peer_id"])
+        return {"response": response, "execute_errors": errors}
+
+
+def test_build_execute_code():
+    code = build_execute_code([("messages.send", {"peer_id": 1, "message": "Привет"})])
+    assert code == 'return [API.messages.send({"peer_id": 1, "message": "Привет"})];'
+
+
+def test_parse_execute_response_maps_errors_in_order():
+    response = {"response": [10, False, 12, False],
+                "execute_errors": [{"error_code": 901}, {"error_code": 7}]}
+    assert parse_execute_response(response, 4) == [(10, None), (None, 901), (12, None), (None, 7)]
+
+
+def test_batch_groups_into_execute_calls():
+    api = FakeAPI()
+    batch = VKExecuteBatch(api)
+
+    async def run():
+        for peer in range(1, EXECUTE_MAX_CALLS + 3):
+            await batch.add({"peer_id": peer, "message": f"текст {peer}", "random_id": 0})
+        return await batch.flush()
+
+    asyncio.run(run())
+    assert len(api.executes) == 2
+    assert batch.sent == EXECUTE_MAX_CALLS + 2
+    assert api.messages.sent == []
+
+
+def test_group_by_content_splits_by_peer_limit():
+    pending = [{"peer_id": p, "message": "день 1", "keyboard": "{}"} for p in range(SEND_MAX_PEERS + 5)]
+    pending.append({"peer_id": 999, "message": "день 2", "keyboard": "{}"})
+
+    calls = group_by_content(pending)
+    assert [len(peers) for _, peers in calls] == [SEND_MAX_PEERS, 5, 1]
+
+
+def test_identical_content_uses_one_multi_peer_call():
+    api = FakeAPI(failing={3})
+    batch = VKExecuteBatch(api)
+
+    async def run():
+        for peer in (1, 2, 3):
+            await batch.add({"peer_id": peer, "message": "одинаковый", "random_id": 0})
+        return await batch.flush()
+
+    outcome = asyncio.run(run())
+    assert len(api.executes) == 1
+    assert '"peer_ids": "1,2,3"' in api.executes[0]
+    assert outcome == {1: None, 2: None, 3: 901}
+    assert api.messages.sent == []
+
+
+def test_failed_calls_fall_back_to_single_send():
+    api = FakeAPI(failing={2}, fail_single={2})
+    batch = VKExecuteBatch(api)
+
+    async def run():
+        for peer in (1, 2, 3):
+            await batch.add({"peer_id": peer, "message": f"текст {peer}", "random_id": 0})
+        return await batch.flush()
+
+    outcome = asyncio.run(run())
+    assert outcome == {1: None, 2: 901, 3: None}
+    assert batch.failed == 1
+
+
+def test_execute_failure_is_not_resent_individually():
+    """После сбоя execute доставка неизвестна: повтор с другим random_id дал бы дубли"""
+    api = FakeAPI(fail_execute=True)
+    batch = VKExecuteBatch(api)
+
+    async def run():
+        for peer in (1, 2):
+            await batch.add({"peer_id": peer, "message": "текст", "random_id": 100 + peer})
+        return await batch.flush()
+
+    outcome = asyncio.run(run())
+    assert outcome == {1: DELIVERY_UNKNOWN, 2: DELIVERY_UNKNOWN}
+    assert api.messages.sent == []
+    assert (batch.sent, batch.failed, batch.unknown) == (0, 0, 2)
+    assert batch.errors == {}
+
+
+def test_vk_random_id_is_deterministic():
+    first = vk_random_id('reminder', 1, 'stage4', '2024-05-01')
+    assert first == vk_random_id('reminder', 1, 'stage4', '2024-05-01')
+    assert first != vk_random_id('reminder', 1, 'stage4', '2024-05-02')
+    assert 0 < first < 2 ** 31
+
+
+def test_group_random_id_derived_from_members():
+    params = {"peer_id": 1, "message": "текст", "random_id": 11}
+    call = call_params(params, [1, 2], {1: 11, 2: 22})
+    assert call["random_id"] == vk_random_id('peers', 11, 22)
+    assert call_params(params, [1, 2], {1: 11, 2: 0})["random_id"] == 0
+
+
+def test_fallback_keeps_each_peer_random_id():
+    api = FakeAPI(failing={1, 2})
+    batch = VKExecuteBatch(api)
+
+    async def run():
+        for peer in (1, 2):
+            await batch.add({"peer_id": peer, "message": f"текст {peer}", "random_id": 100 + peer})
+        return await batch.flush()
+
+    asyncio.run(run())
+    assert api.messages.random_ids == {1: 101, 2: 102}
+
+
+def test_call_with_retry_retries_only_retryable_errors(monkeypatch):
+    calls = []
+
+    async def flaky(code):
+        calls.append(code)
+        if len(calls) < 3:
+            error = Exception("flood")
+            error.code = code
+            raise error
+        return "ok"
+
+    monkeypatch.setattr("utils.vk_client.random.uniform", lambda a, b: 0)
+    assert asyncio.run(call_with_retry(flaky, 10, attempts=3)) == "ok"
+    assert len(calls) == 3
+
+    calls.clear()
+    try:
+        asyncio.run(call_with_retry(flaky, 901, attempts=3))
+    except Exception as e:
+        assert e.code == 901
+    assert len(calls) == 1
+
+
+def _vk_user(vk_id):
+    return SimpleNamespace(vk_id=vk_id, timezone='Europe/Moscow')
+
+
+def test_only_the_sweep_task_is_batched(monkeypatch):
+    """Отправки из других задач (админские команды) не попадают в батч рассылки"""
+    api = FakeAPI()
+    monkeypatch.setattr(scheduler, '_get_vk_api', lambda: api)
+
+    async def sweep():
+        batch = VKExecuteBatch(api)
+        token = scheduler._vk_batch.set(batch)
+        try:
+            await scheduler._send_vk_message(_vk_user(1), 'stage4', "напоминание")
+            await asyncio.sleep(0.01)
+        finally:
+            scheduler._vk_batch.reset(token)
+        return batch
+
+    async def admin_command():
+        await asyncio.sleep(0)
+        await scheduler._send_vk_message(_vk_user(2), 'test', "проверка")
+
+    async def run():
+        batch, _ = await asyncio.gather(sweep(), admin_command())
+        return batch
+
+    batch = asyncio.run(run())
+    assert [params['peer_id'] for params in batch._pending] == [1]
+    assert api.messages.sent == [2]
+
+
+def test_sweep_marks_only_confirmed_deliveries(session_factory, monkeypatch):
+    """Отметка «напоминание отправлено» пишется только после подтверждения execute"""
+    from datetime import datetime
+    from models import User
+
+    db = session_factory()
+    db.add_all([User(platform='vk', vk_id=1), User(platform='vk', vk_id=2)])
+    db.commit()
+    users = db.query(User).order_by(User.vk_id).all()
+    sent_at = datetime(2024, 5, 1, 9, 0)
+
+    async def sweep(api):
+        monkeypatch.setattr(scheduler, '_get_vk_api', lambda: api)
+        batch = VKExecuteBatch(api)
+        pending = {}
+        batch_token = scheduler._vk_batch.set(batch)
+        pending_token = scheduler._after_delivery.set(pending)
+        for user in users:
+            await scheduler._send_vk_message(user, 'stage3_day1', f"практика {user.vk_id}")
+            scheduler._set_after_delivery(db, user, last_reminder_sent=sent_at)
+        scheduler._vk_batch.reset(batch_token)
+        scheduler._after_delivery.reset(pending_token)
+        await scheduler._flush_vk_batch(batch)
+        scheduler._apply_delivered(db, pending, batch.delivered)
+
+    # execute не прошёл — доставка неизвестна, состояние не меняется
+    asyncio.run(sweep(FakeAPI(fail_execute=True)))
+    db.expire_all()
+    assert [user.last_reminder_sent for user in users] == [None, None]
+
+    # Второму получателю VK отказал — отмечен только первый
+    asyncio.run(sweep(FakeAPI(failing={2}, fail_single={2})))
+    db.expire_all()
+    assert [user.last_reminder_sent for user in users] == [sent_at, None]
+    db.close()
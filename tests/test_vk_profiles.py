@@ -0,0 +1,82 @@
+"""
+Тесты для кэша профилей VK (фейковый users.get, in-memory SQLite)
+"""
+import asyncio
+from types import SimpleNamespace
+
+from models import User
+from utils import vk_profiles
+from utils.vk_profiles import USERS_GET_MAX_IDS, VKProfileCache
+
+
+class FakeUsersAPI:
+    """Отвечает на users.get выдуманными именами и запоминает вызовы"""
+
+    def __init__(self):
+        self.calls = []
+        self.users = self
+
+    async def get(self, user_ids):
+        self.calls.append(list(user_ids))
+        return [SimpleNamespace(id=vk_id, first_name=f"Имя{vk_id}", last_name=f"Фамилия{vk_id}") for vk_id in user_ids]
+
+
+def test_miss_is_queued_and_ttl_expiry_requeues(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(vk_profiles.time, 'monotonic', lambda: clock[0])
+    cache = VKProfileCache(ttl=60, max_size=10)
+
+    assert cache.get(1) == (None, None)
+    assert cache.stats() == {'size': 0, 'pending': 1}
+
+    cache.put(1, "Аня", "Петрова")
+    assert cache.get(1) == ("Аня", "Петрова")
+    assert cache.stats() == {'size': 1, 'pending': 0}
+
+    # Устаревший профиль отдаётся, но ставится на обновление
+    clock[0] += 61
+    assert cache.get(1) == ("Аня", "Петрова")
+    assert cache.stats()['pending'] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = VKProfileCache(max_size=2)
+    cache.put(1, "А", None)
+    cache.put(2, "Б", None)
+    cache.get(1)  # 1 становится самым свежим
+    cache.put(3, "В", None)
+
+    assert cache.get(2) == (None, None)
+    assert cache.get(1) == ("А", None)
+    assert cache.get(3) == ("В", None)
+
+
+def test_pending_ids_are_fetched_in_batches_and_saved(session_factory, monkeypatch):
+    monkeypatch.setattr(vk_profiles, 'SessionLocal', session_factory)
+    db = session_factory()
+    db.add_all(User(vk_id=vk_id, platform='vk') for vk_id in (1, 2, USERS_GET_MAX_IDS + 5))
+    db.commit()
+
+    api = FakeUsersAPI()
+    cache = VKProfileCache(refresh_interval=0)
+    cache.bind(api)
+
+    async def scenario():
+        for vk_id in range(1, USERS_GET_MAX_IDS + 6):
+            cache.get(vk_id)
+        await cache._task
+
+    asyncio.run(scenario())
+
+    assert sorted(len(call) for call in api.calls) == [5, USERS_GET_MAX_IDS]
+    assert cache.stats() == {'size': USERS_GET_MAX_IDS + 5, 'pending': 0}
+    assert cache.get(2) == ("Имя2", "Фамилия2")
+
+    # Имена записаны в users одним executemany по всем найденным vk_id
+    db.expire_all()
+    names = {user.vk_id: (user.first_name, user.last_name) for user in db.query(User)}
+    # Запись мимо ORM участвует в проверке версий
+    assert {user.version for user in db.query(User)} == {2}
+    assert names[1] == ("Имя1", "Фамилия1")
+    assert names[USERS_GET_MAX_IDS + 5] == (f"Имя{USERS_GET_MAX_IDS + 5}", f"Фамилия{USERS_GET_MAX_IDS + 5}")
+    db.close()
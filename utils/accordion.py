@@ -0,0 +1,150 @@
+"""
+Отрисовка аккордеонов «Примеры желаний» и «Рецепты» с кэшем
+
+Состояний аккордеона немного, и все они задаются practices.json, поэтому
+готовая пара (текст, клавиатура) запоминается по ключу
+(вид, платформа, открытые пункты, вариант кнопки, версия практик).
+Переключение пункта сводится к поиску в кэше. При перезагрузке
+practices.json версия меняется, и старые записи больше не используются.
+
+Текст отрисовывается один раз в Markdown; для VK он очищается от разметки.
+"""
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from utils.formatting import markdown_to_plain
+from utils.practices import practices_manager
+from utils.vk_keyboards import create_vk_callback_keyboard
+
+RENDER_CACHE_SIZE = 1024
+
+
+def render_examples(platform: str, opened) -> tuple:
+    """
+    Меню примеров желаний
+
+    Args:
+        platform: 'telegram' или 'vk'
+        opened: Открытые категории (id)
+
+    Returns:
+        tuple: (text, keyboard) — InlineKeyboardMarkup для Telegram, JSON для VK
+    """
+    version = practices_manager.version
+    return _render('examples', platform, _known(opened, _item_ids('examples', version)), None, version)
+
+
+def render_recipes(platform: str, opened, stage4: bool) -> tuple:
+    """
+    Меню рецептов
+
+    Args:
+        platform: 'telegram' или 'vk'
+        opened: Развёрнутые рецепты (id)
+        stage4: Пользователь на Stage 4 — кнопка «Продолжить» ведёт к следующему шагу
+
+    Returns:
+        tuple: (text, keyboard)
+    """
+    version = practices_manager.version
+    return _render('recipes', platform, _known(opened, _item_ids('recipes', version)), stage4, version)
+
+
+def render_cache_info():
+    """Статистика кэша отрисовки (hits/misses/currsize)"""
+    return _render.cache_info()
+
+
+@lru_cache(maxsize=4)
+def _item_ids(kind: str, version: int) -> frozenset:
+    if kind == 'examples':
+        items = practices_manager.get_examples_menu().get('categories', [])
+    else:
+        items = practices_manager.get_recipes().get('items', [])
+    return frozenset(item.get('id', '') for item in items)
+
+
+def _known(opened, ids) -> frozenset:
+    # Устаревшие id (после перезагрузки практик) не плодят лишних ключей
+    return frozenset(opened or ()) & ids
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(kind: str, platform: str, opened: frozenset, extra, version: int) -> tuple:
+    if kind == 'examples':
+        text, buttons = _examples_markdown(opened)
+    else:
+        text, buttons = _recipes_markdown(opened, extra)
+
+    if platform == 'vk':
+        return markdown_to_plain(text), create_vk_callback_keyboard(buttons)
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, callback_data=action)] for label, action in buttons
+    ])
+    return text, keyboard
+
+
+def _examples_markdown(opened: frozenset) -> tuple:
+    examples = practices_manager.get_examples_menu()
+
+    message = f"**{examples.get('title', 'Примеры желаний')}**\n\n"
+    message += examples.get('message', '') + "\n\n"
+
+    buttons = []
+    for category in examples.get('categories', []):
+        cat_id = category.get('id', '')
+        is_open = cat_id in opened
+
+        # Иконка стрелки: вниз если открыто, вправо если закрыто
+        arrow = "🔽" if is_open else "▶️"
+        buttons.append((f"{arrow} {category.get('title', '')}", f"toggle_category_{cat_id}"))
+
+        # Если категория открыта, добавляем её содержимое в сообщение
+        if is_open:
+            message += f"\n**{category.get('title', '')}**\n"
+            message += f"_{category.get('description', '')}_\n\n"
+            for item in category.get('items', []):
+                message += f"• {item}\n"
+            message += "\n"
+
+    buttons.append(("✅ Продолжить практику", "continue_from_examples"))
+    return message, buttons
+
+
+def _recipes_markdown(opened: frozenset, stage4: bool) -> tuple:
+    recipes = practices_manager.get_recipes()
+
+    message = f"**{recipes.get('title', 'Рецепты')}** 🍽\n\n"
+    message += recipes.get('message', '')
+
+    items = recipes.get('items', [])
+
+    # Развёрнутые рецепты — в текст сообщения
+    for recipe in items:
+        if recipe.get('id', '') in opened:
+            message += f"\n\n**{recipe.get('title', '')}**\n"
+            message += f"_{recipe.get('subtitle', '')}_\n\n"
+            message += f"**Ингредиенты:** {recipe.get('ingredients', '')}\n"
+            message += f"**Как делать:** {recipe.get('instructions', '')}\n"
+            if recipe.get('secret'):
+                message += f"**В чём секрет:** {recipe.get('secret')}\n"
+            if recipe.get('meaning'):
+                message += f"**Смысл:** {recipe.get('meaning')}\n"
+
+    # Кнопка для каждого рецепта: свернуть или развернуть
+    buttons = []
+    for recipe in items:
+        recipe_id = recipe.get('id', '')
+        title = recipe.get('title', '')
+        if recipe_id in opened:
+            buttons.append((f"▼ {title}", f"collapse_recipe_{recipe_id}"))
+        else:
+            buttons.append((title, f"expand_recipe_{recipe_id}"))
+
+    # Stage 4 — переход к следующему шагу, ежедневные практики — к следующему подшагу
+    if stage4:
+        buttons.append(("✅ Продолжить", "next_step"))
+    else:
+        buttons.append(("✅ Завершить практику", "next_daily_substep"))
+    return message, buttons
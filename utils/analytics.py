@@ -0,0 +1,283 @@
+"""
+Когортная аналитика по истории прогресса: воронка этапов, время между
+этапами и удержание по дням
+
+users и user_progress читаются порциями (stream_results, секунды считает
+сама БД) и сразу сворачиваются в столбцы NumPy размером
+«пользователи × этапы» и «пользователи × дни», поэтому память не зависит от длины истории: миллион записей — это
+несколько проходов по порциям без списка объектов ORM.
+
+Разрезы: неделя регистрации ('week'), часовой пояс ('tz'), платформа
+('platform') или без разреза (None).
+
+Запуск из консоли:
+    python -m utils.analytics --by week
+"""
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, func, select
+
+from models import SessionLocal, User, UserProgress
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 50000
+STAGES = 6
+RETENTION_DAYS = (1, 3, 7, 14, 30)
+NOT_REACHED = np.iinfo(np.int64).max
+
+SECONDS_PER_DAY = 24 * 60 * 60
+# 1970-01-01 — четверг: сдвиг, чтобы недели начинались с понедельника
+_WEEK_SHIFT_DAYS = 3
+
+
+@dataclass
+class ProgressColumns:
+    """Свёрнутая история: по строке на пользователя"""
+    user_ids: np.ndarray       # int64, отсортированы
+    signup: np.ndarray         # int64, секунды UTC
+    started: np.ndarray        # int64, секунды UTC (NOT_REACHED — не начинал)
+    current_stage: np.ndarray  # int16
+    platform: np.ndarray       # object, 'telegram' / 'vk'
+    timezone: np.ndarray       # object
+    first_reach: np.ndarray    # int64 [users, STAGES]: первое событие этапа
+    active_days: np.ndarray    # bool [users, max_day + 1]: была активность в день N от старта
+    events: int = 0
+
+
+def _epoch(db, column):
+    """Секунды UTC прямо в SQL: без разбора datetime в Python на каждой строке"""
+    if db.get_bind().dialect.name == 'postgresql':
+        return cast(func.extract('epoch', column), BigInteger)
+    return cast(func.strftime('%s', column), BigInteger)
+
+
+def _int_column(values) -> np.ndarray:
+    """Значения → int64; None → NOT_REACHED"""
+    return np.array([NOT_REACHED if value is None else value for value in values], dtype=np.int64)
+
+
+def load_columns(db, chunk_size: int = CHUNK_SIZE, max_day: int = max(RETENTION_DAYS)) -> ProgressColumns:
+    """
+    Прочитать users и user_progress порциями и свернуть в столбцы
+
+    Args:
+        db: Сессия БД
+        chunk_size: Строк за одну порцию
+        max_day: Последний день удержания, который нужен отчёту
+    """
+    conn = db.connection()
+
+    names = ('id', 'signup', 'started', 'current_stage', 'platform', 'timezone')
+    parts = {name: [] for name in names}
+    users = conn.execution_options(stream_results=True).execute(
+        select(
+            User.id, _epoch(db, User.created_at), _epoch(db, User.started_at),
+            User.current_stage, User.platform, User.timezone
+        ).order_by(User.id)
+    )
+    for chunk in users.partitions(chunk_size):
+        for name, values in zip(names, zip(*chunk)):
+            parts[name].append(np.array(values, dtype=object))
+
+    def column(name):
+        return np.concatenate(parts[name]) if parts[name] else np.array([], dtype=object)
+
+    user_ids = column('id').astype(np.int64)
+    columns = ProgressColumns(
+        user_ids=user_ids,
+        signup=_int_column(column('signup')),
+        started=_int_column(column('started')),
+        current_stage=np.array([stage or 0 for stage in column('current_stage')], dtype=np.int16),
+        platform=column('platform'),
+        timezone=column('timezone'),
+        first_reach=np.full((len(user_ids), STAGES), NOT_REACHED, dtype=np.int64),
+        active_days=np.zeros((len(user_ids), max_day + 1), dtype=bool),
+    )
+
+    progress = conn.execution_options(stream_results=True).execute(
+        select(UserProgress.user_id, UserProgress.stage_id, _epoch(db, UserProgress.completed_at))
+        .where(UserProgress.user_id.isnot(None))
+    )
+    for chunk in progress.partitions(chunk_size):
+        # fromiter по плоскому потоку значений: без разбора Row как последовательностей
+        values = np.fromiter(chain.from_iterable(chunk), dtype=np.int64, count=len(chunk) * 3)
+        _fold_progress(columns, values.reshape(-1, 3))
+    return columns
+
+
+def _fold_progress(columns: ProgressColumns, chunk: np.ndarray):
+    """Добавить порцию событий (user_id, stage_id, секунды) в first_reach и active_days"""
+    if not len(columns.user_ids):
+        return
+    user_id, stage, completed = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+
+    # Строка пользователя по id: user_ids отсортированы
+    rows = np.minimum(np.searchsorted(columns.user_ids, user_id), len(columns.user_ids) - 1)
+    known = (columns.user_ids[rows] == user_id)
+    known &= (stage >= 1) & (stage <= STAGES)
+    rows, stage, completed = rows[known], stage[known], completed[known]
+    columns.events += int(known.sum())
+
+    np.minimum.at(columns.first_reach, (rows, stage - 1), completed)
+
+    started = columns.started[rows]
+    has_start = started != NOT_REACHED
+    day = np.where(has_start, (completed - started) // SECONDS_PER_DAY, -1)
+    in_range = (day >= 0) & (day < columns.active_days.shape[1])
+    columns.active_days[rows[in_range], day[in_range]] = True
+
+
+def _groups(columns: ProgressColumns, by: str):
+    """Метки разреза и индекс группы для каждого пользователя"""
+    if by == 'week':
+        days = columns.signup // SECONDS_PER_DAY
+        week_start = (days + _WEEK_SHIFT_DAYS) // 7 * 7 - _WEEK_SHIFT_DAYS
+        keys, inverse = np.unique(week_start, return_inverse=True)
+        labels = [str(np.datetime64(int(day), 'D')) for day in keys]
+    elif by in ('tz', 'platform'):
+        values = columns.timezone if by == 'tz' else columns.platform
+        keys, inverse = np.unique(np.array([str(v) for v in values]), return_inverse=True)
+        labels = [str(key) for key in keys]
+    else:
+        labels, inverse = ['все'], np.zeros(len(columns.user_ids), dtype=np.int64)
+    return labels, inverse.reshape(-1)
+
+
+def reached_matrix(columns: ProgressColumns) -> np.ndarray:
+    """bool [users, STAGES]: дошёл ли пользователь до этапа (событие или текущий этап)"""
+    by_events = columns.first_reach != NOT_REACHED
+    by_state = columns.current_stage[:, None] >= np.arange(1, STAGES + 1)[None, :]
+    return by_events | by_state
+
+
+def funnel(columns: ProgressColumns, by: str = None) -> dict:
+    """
+    Воронка этапов по группам
+
+    Returns:
+        dict: {группа: [дошли до этапа 1, ..., до этапа STAGES]}
+    """
+    labels, group = _groups(columns, by)
+    reached = reached_matrix(columns)
+    counts = np.zeros((len(labels), STAGES), dtype=np.int64)
+    np.add.at(counts, group, reached.astype(np.int64))
+    return {label: counts[index].tolist() for index, label in enumerate(labels)}
+
+
+def stage_durations(columns: ProgressColumns, percentiles=(25, 50, 90)) -> dict:
+    """
+    Время от первого события этапа до первого события следующего (дни)
+
+    Returns:
+        dict: {(этап, этап + 1): {'count': n, 'p25': ..., 'p50': ..., 'p90': ...}}
+    """
+    result = {}
+    for stage in range(1, STAGES):
+        start, end = columns.first_reach[:, stage - 1], columns.first_reach[:, stage]
+        valid = (start != NOT_REACHED) & (end != NOT_REACHED) & (end >= start)
+        entry = {'count': int(valid.sum())}
+        if entry['count']:
+            days = (end[valid] - start[valid]) / SECONDS_PER_DAY
+            for p, value in zip(percentiles, np.percentile(days, percentiles)):
+                entry[f'p{p}'] = float(value)
+        result[(stage, stage + 1)] = entry
+    return result
+
+
+def retention(columns: ProgressColumns, by: str = None, days=RETENTION_DAYS, now: float = None) -> dict:
+    """
+    Удержание: доля начавших, у кого была активность ровно в день N от старта
+
+    В знаменатель дня N входят только те, кто начал не меньше N дней назад.
+
+    Returns:
+        dict: {группа: {N: доля или None}}
+    """
+    now = time.time() if now is None else now
+    labels, group = _groups(columns, by)
+    started = columns.started != NOT_REACHED
+    age_days = np.where(started, (int(now) - columns.started) // SECONDS_PER_DAY, -1)
+
+    result = {label: {} for label in labels}
+    for day in days:
+        eligible = started & (age_days >= day)
+        active = eligible & columns.active_days[:, day]
+        total = np.bincount(group[eligible], minlength=len(labels))
+        retained = np.bincount(group[active], minlength=len(labels))
+        for index, label in enumerate(labels):
+            result[label][day] = float(retained[index] / total[index]) if total[index] else None
+    return result
+
+
+def build_report(db, by: str = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Загрузить историю и посчитать все разрезы"""
+    started_at = time.monotonic()
+    columns = load_columns(db, chunk_size=chunk_size)
+    return {
+        'by': by,
+        'users': len(columns.user_ids),
+        'events': columns.events,
+        'funnel': funnel(columns, by),
+        'durations': stage_durations(columns),
+        'retention': retention(columns, by),
+        'seconds': time.monotonic() - started_at,
+    }
+
+
+def render_report(report: dict, max_groups: int = 12) -> str:
+    """Текст отчёта для админ-команды и консоли"""
+    lines = [
+        f"📈 Аналитика: {report['users']} пользователей, {report['events']} событий "
+        f"({report['seconds']:.1f} с)",
+    ]
+
+    # Последние группы (свежие недели) интереснее первых
+    groups = list(report['funnel'].items())[-max_groups:]
+    lines += ["", "Воронка (дошли до этапа 1 → 6):"]
+    for label, counts in groups:
+        base = counts[0] or 1
+        steps = " → ".join(f"{count} ({count * 100 // base}%)" for count in counts)
+        lines.append(f"• {label}: {steps}")
+
+    lines += ["", "Дней между этапами (p25 / p50 / p90):"]
+    for (stage, next_stage), entry in report['durations'].items():
+        if entry['count']:
+            lines.append(
+                f"• {stage}→{next_stage}: {entry['p25']:.1f} / {entry['p50']:.1f} / {entry['p90']:.1f} "
+                f"(n={entry['count']})"
+            )
+        else:
+            lines.append(f"• {stage}→{next_stage}: нет данных")
+
+    lines += ["", "Удержание (день " + " / ".join(str(day) for day in RETENTION_DAYS) + "):"]
+    for label, _ in groups:
+        values = report['retention'][label]
+        shares = " / ".join("—" if values[day] is None else f"{values[day] * 100:.0f}%" for day in RETENTION_DAYS)
+        lines.append(f"• {label}: {shares}")
+
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воронка, время между этапами и удержание")
+    parser.add_argument('--by', choices=['week', 'tz', 'platform'], default=None, help="Разрез по группам")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Строк за одну порцию чтения")
+    parser.add_argument('--max-groups', type=int, default=52, help="Сколько последних групп вывести")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = build_report(db, by=args.by, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    print(render_report(report, max_groups=args.max_groups))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Архивация старой истории прогресса
+
+user_progress растёт на строку за каждый шаг. Строки старше горизонта
+(ARCHIVE_HORIZON_DAYS) у пользователей, которые прошли все этапы или
+неактивны, переносятся в сжатые помесячные файлы и удаляются из
+таблицы — рабочая таблица и её индексы остаются небольшими.
+
+- Свёрнутые счётчики (user_stats, progress_counters) обновляются при
+  добавлении истории и при удалении не уменьшаются, так что /stats и
+  /admin_stats архивацию не замечают. Отчёт utils.analytics видит
+  только неархивированную историю.
+- Перенос идёт пачками по ARCHIVE_BATCH_SIZE строк: каждая пачка
+  сначала дописывается в файл, затем удаляется короткой транзакцией,
+  между пачками — пауза. Сбой между записью и удалением может оставить
+  в архиве дубль строки — id в архиве уникален по смыслу.
+- Файлы: archive/user_progress_YYYY-MM.jsonl.gz, каждая пачка —
+  отдельный член gzip, поэтому файл читается zcat / gzip.open целиком.
+- Строки без user_id (до migrate_user_progress_user_id.py) не трогаются.
+- При удалении пользователя (utils.purge) его строки вычищаются и из
+  архива: затронутые файлы переписываются целиком (forget_users).
+
+Запуск из консоли:
+    python -m utils.archive
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select
+
+from models import SessionLocal, User, UserProgress
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+ARCHIVE_HORIZON_DAYS = int(os.getenv('ARCHIVE_HORIZON_DAYS', 180))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+ARCHIVE_BATCH_PAUSE = float(os.getenv('ARCHIVE_BATCH_PAUSE', 0.2))  # секунды
+# Час ежедневной архивации (пусто — не делать)
+ARCHIVE_HOUR = os.getenv('ARCHIVE_HOUR', '4')
+
+# current_stage после завершения всех практик (см. handlers.practices)
+COMPLETED_STAGE = 7
+FILE_PATTERN = 'user_progress_{month}.jsonl.gz'
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _write_batch(archive_dir: str, rows: list) -> dict:
+    """
+    Дописать пачку в помесячные файлы
+
+    Returns:
+        dict: {месяц: строк}
+    """
+    names = [column.name for column in UserProgress.__table__.columns]
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[row.completed_at.strftime('%Y-%m')].append(row)
+
+    for month, month_rows in by_month.items():
+        path = os.path.join(archive_dir, FILE_PATTERN.format(month=month))
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            f.writelines(
+                json.dumps(dict(zip(names, map(_json_value, row))), ensure_ascii=False) + '\n'
+                for row in month_rows
+            )
+            f.flush()
+            os.fsync(f.fileno())
+    return {month: len(month_rows) for month, month_rows in by_month.items()}
+
+
+def archive_progress(db, archive_dir: str = ARCHIVE_DIR, horizon_days: int = ARCHIVE_HORIZON_DAYS,
+                     batch_size: int = ARCHIVE_BATCH_SIZE, pause: float = ARCHIVE_BATCH_PAUSE,
+                     now: datetime = None) -> dict:
+    """
+    Перенести старую историю завершивших и неактивных пользователей в архив
+
+    Returns:
+        dict: {'rows': всего строк, 'months': {месяц: строк}}
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = (now or datetime.utcnow()) - timedelta(days=horizon_days)
+    eligible_users = select(User.id).where(
+        or_(User.current_stage >= COMPLETED_STAGE, User.is_active == False)
+    )
+    table = UserProgress.__table__
+
+    total, months = 0, defaultdict(int)
+    while True:
+        rows = db.execute(
+            select(table)
+            .where(table.c.user_id.in_(eligible_users), table.c.completed_at < cutoff)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        # Сначала файл, потом удаление: при сбое строка окажется в архиве дважды, но не потеряется
+        for month, count in _write_batch(archive_dir, rows).items():
+            months[month] += count
+        db.execute(delete(table).where(table.c.id.in_([row.id for row in rows])))
+        db.commit()
+
+        total += len(rows)
+        metrics.inc('archive.rows', len(rows))
+        logger.info(f"Архив user_progress: +{len(rows)} (всего {total})")
+        if len(rows) < batch_size:
+            break
+        time.sleep(pause)
+
+    return {'rows': total, 'months': dict(months)}
+
+
+def iter_archive(path: str):
+    """Строки архивного файла (dict по строке)"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _rewrite_without(path: str, user_ids: set):
+    """
+    Переписать файл архива без строк пользователей user_ids
+
+    Returns:
+        int | None: Сколько строк убрано (0 — файл не изменён);
+            None — архивация дописала в файл пачку, пока он переписывался
+    """
+    size = os.path.getsize(path)
+    temp_path = path + '.purge'
+    dropped = 0
+    with gzip.open(path, 'rt', encoding='utf-8') as src, gzip.open(temp_path, 'wt', encoding='utf-8') as dst:
+        for line in src:
+            if json.loads(line).get('user_id') in user_ids:
+                dropped += 1
+            else:
+                dst.write(line)
+        dst.flush()
+        os.fsync(dst.fileno())
+    if not dropped:
+        os.remove(temp_path)
+        return 0
+    if os.path.getsize(path) != size:
+        os.remove(temp_path)
+        return None
+    os.replace(temp_path, path)
+    return dropped
+
+
+def forget_users(user_ids, archive_dir: str = ARCHIVE_DIR, attempts: int = 3) -> int:
+    """
+    Удалить из архива строки истории пользователей (для utils.purge)
+
+    Затронутые помесячные файлы переписываются во временный файл и
+    подменяются. Если архивация успела дописать в файл пачку, файл
+    переписывается заново — иначе пачка потерялась бы.
+
+    Returns:
+        int: Сколько строк убрано
+    """
+    user_ids = set(user_ids)
+    if not user_ids or not os.path.isdir(archive_dir):
+        return 0
+    prefix, suffix = FILE_PATTERN.split('{month}')
+    total = 0
+    for name in sorted(os.listdir(archive_dir)):
+        if not (name.startswith(prefix) and name.endswith(suffix)):
+            continue
+        for _ in range(attempts):
+            dropped = _rewrite_without(os.path.join(archive_dir, name), user_ids)
+            if dropped is not None:
+                total += dropped
+                break
+        else:
+            raise RuntimeError(f"Архив {name} меняется во время удаления пользователей")
+    if total:
+        metrics.inc('archive.forgotten_rows', total)
+    return total
+
+
+def _archive_with_session() -> dict:
+    db = SessionLocal()
+    try:
+        return archive_progress(db)
+    finally:
+        db.close()
+
+
+async def scheduled_archive():
+    """Задача планировщика: пачки идут в отдельном потоке, ошибка не роняет планировщик"""
+    try:
+        result = await asyncio.to_thread(_archive_with_session)
+        logger.info(f"🗄 Архивация истории: {result['rows']} строк")
+    except Exception as e:
+        logger.error(f"Ошибка архивации истории: {e}", exc_info=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = _archive_with_session()
+    print(f"✅ В архиве {result['rows']} строк")
+    for month, count in sorted(result['months'].items()):
+        print(f"• {month}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Резервные копии базы без остановки бота
+
+- SQLite: VACUUM INTO во временный файл. Снимок читается в одной
+  транзакции чтения; в режиме WAL бот пишет параллельно, и копия не
+  начинается заново от каждой записи (как пошаговый backup API, который
+  перезапускается при любом изменении базы другим соединением). Снимок
+  делается в отдельном потоке, event loop не блокируется, затем
+  сжимается потоково.
+- PostgreSQL: pg_dump (обычный SQL, снимок на одной транзакции без
+  блокировок записи) читается из pipe и сжимается на лету — дамп
+  целиком в памяти или на диске без сжатия не лежит. Пароль передаётся
+  через PGPASSWORD, а не в аргументах (их видно в ps).
+
+Копия, не уложившаяся в BACKUP_TIMEOUT секунд, прерывается.
+
+Сжатие — gzip или zstd (BACKUP_COMPRESSION=zstd, нужен пакет zstandard).
+Длительность и размер каждой копии пишутся в метрики (backup.*) и
+в history.jsonl в каталоге копий; хранятся последние BACKUP_KEEP копий.
+
+Восстановление:
+    SQLite:      gunzip -c backups/sogreto_db_....db.gz > sogreto_bot.db
+    PostgreSQL:  gunzip -c backups/sogreto_db_....sql.gz | psql "$DATABASE_URL"
+
+Запуск из консоли:
+    python -m utils.backup
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from sqlalchemy.engine import URL, make_url
+
+from models import DATABASE_URL
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 7))
+BACKUP_COMPRESSION = os.getenv('BACKUP_COMPRESSION', 'gzip')  # 'gzip' или 'zstd'
+# Предел длительности снимка (секунды): зависшая копия не держит блокировку копий
+BACKUP_TIMEOUT = float(os.getenv('BACKUP_TIMEOUT', 600))
+# Сколько SQLite ждёт занятую базу при открытии снимка (секунды)
+BACKUP_BUSY_TIMEOUT = float(os.getenv('BACKUP_BUSY_TIMEOUT', 30))
+# Час ежедневной плановой копии (пусто — не делать); минута 30 — мимо
+# ежечасного прохода напоминаний в 00
+BACKUP_HOUR = os.getenv('BACKUP_HOUR', '3')
+
+HISTORY_FILE = 'history.jsonl'
+FILE_PREFIX = 'sogreto_db_'
+READ_CHUNK = 1024 * 1024
+
+# Одна копия за раз: плановая и ручная (/admin_backup) не пересекаются
+_lock = asyncio.Lock()
+
+
+def _compressor(kind: str):
+    """
+    Потоковый компрессор и расширение файла
+
+    Returns:
+        tuple: (объект с compress()/flush(), расширение)
+    """
+    if kind == 'zstd':
+        try:
+            import zstandard
+            return zstandard.ZstdCompressor(level=3).compressobj(), '.zst'
+        except ImportError:
+            logger.warning("BACKUP_COMPRESSION=zstd, но пакет zstandard не установлен — используем gzip")
+    # wbits=31 — контейнер gzip, читается gunzip
+    return zlib.compressobj(6, zlib.DEFLATED, 31), '.gz'
+
+
+def _sqlite_backup(source_path: str, snapshot_path: str, target_path: str, compression,
+                   timeout: float = BACKUP_TIMEOUT):
+    """Снимок через VACUUM INTO и потоковое сжатие (выполняется в отдельном потоке)"""
+    try:
+        source = sqlite3.connect(source_path, timeout=BACKUP_BUSY_TIMEOUT)
+        # По истечении timeout прервать VACUUM из другого потока
+        timer = threading.Timer(timeout, source.interrupt)
+        timer.start()
+        try:
+            source.execute("VACUUM INTO ?", (snapshot_path,))
+        except sqlite3.OperationalError as e:
+            if 'interrupt' in str(e).lower():
+                raise TimeoutError(f"Снимок SQLite не уложился в {timeout} с") from e
+            raise
+        finally:
+            timer.cancel()
+            source.close()
+
+        with open(snapshot_path, 'rb') as src, open(target_path, 'wb') as dst:
+            while chunk := src.read(READ_CHUNK):
+                dst.write(compression.compress(chunk))
+            dst.write(compression.flush())
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+
+def _pg_dump_args(url: str) -> tuple:
+    """
+    DSN без пароля и окружение для pg_dump
+
+    Returns:
+        tuple: (dsn, env) — пароль только в PGPASSWORD окружения
+    """
+    parsed = make_url(url).set(drivername='postgresql')
+    env = dict(os.environ)
+    if parsed.password is not None:
+        env['PGPASSWORD'] = str(parsed.password)
+    # URL.set() пропускает None, поэтому URL без пароля собирается заново
+    dsn = URL.create(
+        parsed.drivername, username=parsed.username, host=parsed.host,
+        port=parsed.port, database=parsed.database, query=parsed.query
+    ).render_as_string(hide_password=False)
+    return dsn, env
+
+
+async def _postgres_backup(url: str, target_path: str, compression, timeout: float = BACKUP_TIMEOUT):
+    """pg_dump в pipe → сжатие → файл"""
+    dsn, env = _pg_dump_args(url)
+    process = await asyncio.create_subprocess_exec(
+        'pg_dump', '--no-owner', '--no-privileges', '--dbname', dsn,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env
+    )
+    # stderr читаем параллельно, чтобы pg_dump не встал на заполненном pipe
+    errors = asyncio.create_task(process.stderr.read())
+
+    async def stream():
+        with open(target_path, 'wb') as f:
+            while chunk := await process.stdout.read(READ_CHUNK):
+                f.write(await asyncio.to_thread(compression.compress, chunk))
+            f.write(compression.flush())
+
+    try:
+        await asyncio.wait_for(stream(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        errors.cancel()
+        raise TimeoutError(f"pg_dump не уложился в {timeout} с")
+
+    code = await process.wait()
+    stderr = (await errors).decode(errors='replace').strip()
+    if code != 0:
+        raise RuntimeError(f"pg_dump завершился с кодом {code}: {stderr[-500:]}")
+
+
+def _rotate(backup_dir: str, keep: int):
+    """Удалить копии сверх последних keep"""
+    names = sorted(name for name in os.listdir(backup_dir) if name.startswith(FILE_PREFIX))
+    for name in names[:-keep] if keep > 0 else []:
+        os.remove(os.path.join(backup_dir, name))
+        logger.info(f"Удалена старая копия {name}")
+
+
+def read_history(backup_dir: str = BACKUP_DIR, limit: int = 5) -> list:
+    """Последние записи истории копий"""
+    path = os.path.join(backup_dir, HISTORY_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f.readlines()[-limit:]]
+
+
+async def run_backup(database_url: str = DATABASE_URL, backup_dir: str = BACKUP_DIR,
+                     keep: int = BACKUP_KEEP, compression: str = BACKUP_COMPRESSION) -> dict:
+    """
+    Сделать копию базы
+
+    Returns:
+        dict: {'path', 'bytes', 'seconds', 'dialect', 'finished_at'}
+    """
+    async with _lock:
+        os.makedirs(backup_dir, exist_ok=True)
+        url = make_url(database_url)
+        dialect = url.get_backend_name()
+        compressor, extension = _compressor(compression)
+        stamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        suffix = '.db' if dialect == 'sqlite' else '.sql'
+        path = os.path.join(backup_dir, f"{FILE_PREFIX}{stamp}{suffix}{extension}")
+
+        started = time.monotonic()
+        try:
+            if dialect == 'sqlite':
+                await asyncio.to_thread(
+                    _sqlite_backup, url.database, path + '.snapshot', path + '.part', compressor
+                )
+            else:
+                await _postgres_backup(database_url, path + '.part', compressor)
+        except Exception:
+            metrics.inc('backup.failed')
+            if os.path.exists(path + '.part'):
+                os.remove(path + '.part')
+            raise
+        os.replace(path + '.part', path)
+
+        record = {
+            'path': path,
+            'bytes': os.path.getsize(path),
+            'seconds': round(time.monotonic() - started, 2),
+            'dialect': dialect,
+            'finished_at': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+        metrics.inc('backup.ok')
+        metrics.observe('backup.duration', record['seconds'])
+        metrics.set_gauge('backup.last_bytes', record['bytes'])
+        metrics.set_gauge('backup.last_finished_at', record['finished_at'])
+        with open(os.path.join(backup_dir, HISTORY_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        _rotate(backup_dir, keep)
+        logger.info(f"💾 Копия БД: {path} ({record['bytes']} байт, {record['seconds']} с)")
+        return record
+
+
+async def scheduled_backup():
+    """Задача планировщика: ошибка копии не должна ронять планировщик"""
+    try:
+        await run_backup()
+    except Exception as e:
+        logger.error(f"Ошибка резервного копирования: {e}", exc_info=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    record = asyncio.run(run_backup())
+    print(f"✅ {record['path']}: {record['bytes']} байт за {record['seconds']} с")
+
+
+if __name__ == "__main__":
+    main()
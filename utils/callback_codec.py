@@ -0,0 +1,116 @@
+"""
+Компактный формат callback-данных кнопок навигации по шагам
+
+Кнопки «Далее», «Назад» и «Завершить этап» несут не только действие,
+но и контекст, в котором их показали:
+
+    next_step|1.3|a1b2c3|sgk2t0
+    действие | этап.шаг | версия practices.json | время выдачи (base36)
+
+Устаревшее нажатие (кнопка из прошлой версии практик или старше
+CALLBACK_TTL) отклоняется по самим данным кнопки, без обращения к БД.
+Нажатие на кнопку чужого шага отклоняется после загрузки пользователя и
+не сдвигает его прогресс.
+
+Строка укладывается в 64 байта Telegram и в payload VK (255 символов).
+Старые кнопки без контекста («next_step») по-прежнему разбираются и
+обрабатываются как раньше.
+"""
+import os
+import time
+from typing import NamedTuple, Optional
+
+from utils.practices import practices_manager
+
+SEPARATOR = '|'
+# Сколько живёт кнопка навигации (секунды)
+CALLBACK_TTL = int(os.getenv('CALLBACK_TTL', 3 * 24 * 60 * 60))
+# Действия, которые сдвигают прогресс и поэтому несут контекст шага
+STEP_ACTIONS = {'next_step', 'prev_step', 'complete_stage'}
+
+STALE_BUTTON_TEXT = "Эта кнопка устарела. Продолжи с последнего сообщения или открой /menu"
+
+
+class CallbackData(NamedTuple):
+    action: str
+    stage: Optional[int] = None
+    step: Optional[int] = None
+    version: Optional[str] = None
+    issued: Optional[int] = None
+
+    @property
+    def has_context(self) -> bool:
+        return self.stage is not None
+
+
+def encode(action: str, stage: Optional[int] = None, step: Optional[int] = None,
+           now: Optional[float] = None) -> str:
+    """
+    Упаковать действие кнопки
+
+    Контекст добавляется только к STEP_ACTIONS и только если известен шаг;
+    остальные действия возвращаются как есть.
+    """
+    if action not in STEP_ACTIONS or stage is None or step is None:
+        return action
+    issued = int(time.time() if now is None else now)
+    return SEPARATOR.join((
+        action, f"{stage}.{step}", practices_manager.content_tag, _to_base36(issued)
+    ))
+
+
+def encode_buttons(buttons_data: list, stage: int, step: int) -> list:
+    """Кнопки из practices.json с упакованными действиями (для VK-клавиатур)"""
+    return [
+        {**button, 'action': encode(button.get('action', ''), stage, step)}
+        for button in buttons_data
+    ]
+
+
+def decode(data: str) -> CallbackData:
+    """Разобрать callback-данные (новый формат или старое голое действие)"""
+    parts = (data or '').split(SEPARATOR)
+    if len(parts) != 4:
+        return CallbackData(parts[0])
+    action, position, version, issued = parts
+    try:
+        stage, step = (int(value) for value in position.split('.'))
+        return CallbackData(action, stage, step, version, int(issued, 36))
+    except ValueError:
+        return CallbackData(action)
+
+
+def stale_reason(callback: CallbackData, now: Optional[float] = None) -> Optional[str]:
+    """
+    Проверить кнопку по её собственным данным
+
+    Returns:
+        'version' — практики изменились после выдачи кнопки,
+        'expired' — кнопка старше CALLBACK_TTL,
+        None — кнопка актуальна (или выдана в старом формате)
+    """
+    if not callback.has_context:
+        return None
+    if callback.version != practices_manager.content_tag:
+        return 'version'
+    now = time.time() if now is None else now
+    if now - callback.issued > CALLBACK_TTL:
+        return 'expired'
+    return None
+
+
+def matches_progress(callback: CallbackData, stage: int, step: int) -> bool:
+    """Кнопка выдана на том шаге, где пользователь находится сейчас"""
+    if not callback.has_context:
+        return True
+    return (callback.stage, callback.step) == (stage, step)
+
+
+def _to_base36(value: int) -> str:
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    result = ''
+    while True:
+        value, remainder = divmod(value, 36)
+        result = digits[remainder] + result
+        if not value:
+            return result
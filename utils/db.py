@@ -1,13 +1,79 @@
 """
 Утилиты для работы с базой данных
 """
+from sqlalchemy import String, case, func, or_, select, update
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-from models import User, UserProgress, ScheduledReminder
+from sqlalchemy.orm.exc import StaleDataError
+from models import User, UserProgress, UserStats, ProgressCounter
+from utils.metrics import metrics
 from datetime import datetime
 import logging
+import os
+import pytz
 
 logger = logging.getLogger(__name__)
 
+# Сколько раз перечитать пользователя и повторить запись при конфликте версий
+USER_UPDATE_ATTEMPTS = int(os.getenv('USER_UPDATE_ATTEMPTS', 3))
+
+
+# Пользователь снова написал боту — отправки до него опять доходят
+_REACTIVATE = dict(is_active=True, deactivated_at=None, deactivation_reason=None)
+
+
+def _dialect_insert(db: Session):
+    """insert() с поддержкой ON CONFLICT для текущей БД (или None)"""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _upsert_user(db: Session, key: str, values: dict, update_fields: dict) -> User:
+    """
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING по уникальному ключу пользователя
+
+    Один запрос вместо SELECT + INSERT + refresh, без гонки на уникальном
+    индексе при одновременных первых сообщениях от нового пользователя.
+
+    Args:
+        db: Сессия БД
+        key: Имя уникальной колонки ('telegram_id' или 'vk_id')
+        values: Значения для вставки новой строки
+        update_fields: Поля, обновляемые при конфликте
+
+    Returns:
+        User: Актуальная строка пользователя
+    """
+    insert = _dialect_insert(db)
+    if insert is None:
+        return None
+
+    stmt = insert(User).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[getattr(User, key)],
+        set_={**update_fields, 'version': User.version + 1}
+    ).returning(User)
+    user = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+    created = user.created_at == values.get('created_at')
+
+    # Значения только что пришли из RETURNING — не нужно перечитывать строку после commit
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
+
+    if created:
+        logger.info(f"Создан новый пользователь: {user.platform}:{user.platform_id}")
+    return user
+
 
 def get_or_create_user(db: Session, telegram_id: int, username: str = None,
                        first_name: str = None, last_name: str = None) -> User:
@@ -24,6 +90,31 @@ def get_or_create_user(db: Session, telegram_id: int, username: str = None,
     Returns:
         User: Объект пользователя
     """
+    now = datetime.utcnow()
+    user = _upsert_user(
+        db, 'telegram_id',
+        values=dict(
+            platform='telegram',
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            created_at=now,
+            last_interaction=now
+        ),
+        update_fields=dict(
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            last_interaction=now,
+            updated_at=now,
+            **_REACTIVATE
+        )
+    )
+    if user is not None:
+        return user
+
+    # Fallback для СУБД без ON CONFLICT
     user = db.query(User).filter(User.telegram_id == telegram_id).first()
 
     if not user:
@@ -42,7 +133,9 @@ def get_or_create_user(db: Session, telegram_id: int, username: str = None,
         user.username = username
         user.first_name = first_name
         user.last_name = last_name
-        user.last_interaction = datetime.utcnow()
+        user.last_interaction = now
+        for field, value in _REACTIVATE.items():
+            setattr(user, field, value)
         db.commit()
 
     return user
@@ -62,6 +155,30 @@ def get_or_create_vk_user(db: Session, vk_id: int,
     Returns:
         User: Объект пользователя
     """
+    now = datetime.utcnow()
+    # Имя может быть ещё не известно (кэш профилей VK) — не затирать сохранённое
+    update_fields = dict(last_interaction=now, updated_at=now, **_REACTIVATE)
+    if first_name is not None:
+        update_fields['first_name'] = first_name
+    if last_name is not None:
+        update_fields['last_name'] = last_name
+
+    user = _upsert_user(
+        db, 'vk_id',
+        values=dict(
+            platform='vk',
+            vk_id=vk_id,
+            first_name=first_name,
+            last_name=last_name,
+            created_at=now,
+            last_interaction=now
+        ),
+        update_fields=update_fields
+    )
+    if user is not None:
+        return user
+
+    # Fallback для СУБД без ON CONFLICT
     user = db.query(User).filter(User.vk_id == vk_id).first()
 
     if not user:
@@ -76,14 +193,130 @@ def get_or_create_vk_user(db: Session, vk_id: int,
         db.refresh(user)
         logger.info(f"Создан новый VK-пользователь: {vk_id}")
     else:
-        user.first_name = first_name
-        user.last_name = last_name
-        user.last_interaction = datetime.utcnow()
+        if first_name is not None:
+            user.first_name = first_name
+        if last_name is not None:
+            user.last_name = last_name
+        user.last_interaction = now
+        for field, value in _REACTIVATE.items():
+            setattr(user, field, value)
         db.commit()
 
     return user
 
 
+def mark_users_inactive(db: Session, platform: str, platform_ids, reason: str) -> int:
+    """
+    Пометить пользователей неактивными одним UPDATE (бот заблокирован и т.п.)
+
+    Args:
+        db: Сессия БД
+        platform: 'telegram' или 'vk'
+        platform_ids: ID пользователей на платформе
+        reason: Причина ('blocked', 'vk_901', ...)
+
+    Returns:
+        int: Сколько пользователей деактивировано
+    """
+    platform_ids = list(platform_ids)
+    if not platform_ids:
+        return 0
+    column = User.telegram_id if platform == 'telegram' else User.vk_id
+    now = datetime.utcnow()
+    result = db.execute(
+        update(User)
+        .where(column.in_(platform_ids), User.is_active == True)
+        .values(is_active=False, deactivated_at=now, deactivation_reason=reason, updated_at=now,
+                version=User.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        logger.info(f"Деактивировано {result.rowcount} пользователей {platform} (причина: {reason})")
+    return result.rowcount
+
+
+def reactivate_user(db: Session, platform: str, platform_id: int) -> bool:
+    """
+    Снова пометить пользователя активным (например, разблокировал бота)
+
+    Returns:
+        bool: True, если пользователь был неактивен
+    """
+    column = User.telegram_id if platform == 'telegram' else User.vk_id
+    result = db.execute(
+        update(User)
+        .where(column == platform_id, User.is_active == False)
+        .values(updated_at=datetime.utcnow(), version=User.version + 1, **_REACTIVATE)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount:
+        logger.info(f"Пользователь {platform}:{platform_id} снова активен")
+    return bool(result.rowcount)
+
+
+def update_user_cas(db: Session, user: User, mutate, attempts: int = USER_UPDATE_ATTEMPTS) -> bool:
+    """
+    Изменить пользователя и закоммитить с проверкой версии (compare-and-swap)
+
+    Если строку успел изменить другой процесс (бот, VK-бот, планировщик),
+    изменения откатываются, пользователь перечитывается и mutate
+    применяется заново — уже к свежему состоянию. Поэтому mutate должен
+    сам проверять свои условия и вернуть False, если менять уже нечего.
+
+    Args:
+        db: Сессия БД
+        user: Объект User из этой сессии
+        mutate: Функция mutate(user) -> None | False
+        attempts: Сколько раз попробовать
+
+    Returns:
+        bool: True — записано, False — mutate отказался от изменения
+
+    Raises:
+        StaleDataError: Конфликт не разрешился за attempts попыток
+    """
+    # Повторять можно, только если вся запись — это mutate: несохранённые
+    # изменения вызывающего кода откат бы потерял
+    if db.new or db.dirty or db.deleted:
+        attempts = 1
+
+    for attempt in range(1, attempts + 1):
+        if mutate(user) is False:
+            db.rollback()
+            return False
+        try:
+            db.commit()
+            return True
+        except StaleDataError:
+            db.rollback()
+            metrics.inc('db.user_version_conflict')
+            if attempt == attempts:
+                logger.error(f"Не удалось записать {user.platform}:{user.platform_id}: конфликт версий")
+                raise
+            logger.info(f"Конфликт версий {user.platform}:{user.platform_id}, повтор {attempt}")
+            db.refresh(user)
+        except OperationalError as e:
+            # SQLite: запись не дождалась блокировки (или снимок чтения устарел,
+            # тогда busy_timeout не помогает) — повторить всю короткую транзакцию
+            if not _is_sqlite_busy(e):
+                raise
+            db.rollback()
+            metrics.inc('db.sqlite_busy')
+            if attempt == attempts:
+                logger.error(f"Не удалось записать {user.platform}:{user.platform_id}: БД занята")
+                raise
+            logger.info(f"БД занята при записи {user.platform}:{user.platform_id}, повтор {attempt}")
+            db.refresh(user)
+
+
+def _is_sqlite_busy(error: OperationalError) -> bool:
+    """Ошибка SQLITE_BUSY: 'database is locked' / 'database is busy'"""
+    message = str(error.orig).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
 def update_user_progress(db: Session, telegram_id: int, stage_id: int,
                         step_id: int, day: int, user_response: str = None):
     """
@@ -100,31 +333,19 @@ def update_user_progress(db: Session, telegram_id: int, stage_id: int,
     user = db.query(User).filter(User.telegram_id == telegram_id).first()
 
     if user:
-        user.current_stage = stage_id
-        user.current_step = step_id
-        user.current_day = day
-        user.last_interaction = datetime.utcnow()
-
-        # Записать в историю
-        progress = UserProgress(
-            user_telegram_id=telegram_id,
-            stage_id=stage_id,
-            step_id=step_id,
-            day=day,
-            user_response=user_response
-        )
-        db.add(progress)
-        db.commit()
-        logger.info(f"Обновлён прогресс пользователя {telegram_id}: stage={stage_id}, step={step_id}, day={day}")
+        return update_user_progress_obj(db, user, stage_id, step_id, day, user_response)
+    return False
 
 
 def pause_user(db: Session, telegram_id: int):
     """Поставить практики на паузу"""
     user = db.query(User).filter(User.telegram_id == telegram_id).first()
     if user:
-        user.is_paused = True
-        user.paused_at = datetime.utcnow()
-        db.commit()
+        def mutate(user):
+            user.is_paused = True
+            user.paused_at = datetime.utcnow()
+
+        update_user_cas(db, user, mutate)
         logger.info(f"Пользователь {telegram_id} поставил практики на паузу")
 
 
@@ -132,9 +353,11 @@ def resume_user(db: Session, telegram_id: int):
     """Возобновить практики"""
     user = db.query(User).filter(User.telegram_id == telegram_id).first()
     if user:
-        user.is_paused = False
-        user.resumed_at = datetime.utcnow()
-        db.commit()
+        def mutate(user):
+            user.is_paused = False
+            user.resumed_at = datetime.utcnow()
+
+        update_user_cas(db, user, mutate)
         logger.info(f"Пользователь {telegram_id} возобновил практики")
 
 
@@ -142,12 +365,14 @@ def reset_user_progress(db: Session, telegram_id: int):
     """Сбросить прогресс пользователя (начать сначала)"""
     user = db.query(User).filter(User.telegram_id == telegram_id).first()
     if user:
-        user.current_stage = 1
-        user.current_step = 1
-        user.current_day = 1
-        user.is_paused = False
-        user.paused_at = None
-        db.commit()
+        def mutate(user):
+            user.current_stage = 1
+            user.current_step = 1
+            user.current_day = 1
+            user.is_paused = False
+            user.paused_at = None
+
+        update_user_cas(db, user, mutate)
         logger.info(f"Прогресс пользователя {telegram_id} сброшен")
 
 
@@ -162,9 +387,8 @@ def get_user_stats(db: Session, telegram_id: int) -> dict:
     if not user:
         return None
 
-    completed_steps = db.query(UserProgress).filter(
-        UserProgress.user_telegram_id == telegram_id
-    ).count()
+    # Свёрнутые счётчики: одна строка по первичному ключу, независимо от длины истории
+    counters = db.get(UserStats, user.id)
 
     return {
         'telegram_id': user.telegram_id,
@@ -173,67 +397,236 @@ def get_user_stats(db: Session, telegram_id: int) -> dict:
         'current_step': user.current_step,
         'current_day': user.current_day,
         'is_paused': user.is_paused,
-        'completed_steps': completed_steps,
+        'completed_steps': counters.completed_steps if counters else 0,
+        'days_practiced': counters.days_practiced if counters else 0,
+        'last_completed_at': counters.last_completed_at if counters else None,
         'created_at': user.created_at,
         'last_interaction': user.last_interaction
     }
 
 
+def _local_date(user, moment: datetime) -> str:
+    """Дата события по часовому поясу пользователя (YYYY-MM-DD)"""
+    try:
+        tz = pytz.timezone(user.timezone or 'UTC')
+    except pytz.UnknownTimeZoneError:
+        tz = pytz.utc
+    return moment.replace(tzinfo=pytz.utc).astimezone(tz).strftime('%Y-%m-%d')
+
+
+def _count_progress(db: Session, user, stage_id: int, day: int, now: datetime):
+    """
+    Увеличить счётчики пользователя и глобальные счётчики этапа/дня
+
+    Выполняется в транзакции, которая добавляет запись истории, поэтому
+    счётчики всегда совпадают с user_progress.
+    """
+    today = _local_date(user, now)
+    insert = _dialect_insert(db)
+    if insert is None:
+        stats = db.get(UserStats, user.id) or UserStats(user_id=user.id, completed_steps=0, days_practiced=0)
+        stats.completed_steps += 1
+        if stats.last_completed_date != today:
+            stats.days_practiced += 1
+        stats.last_completed_at = now
+        stats.last_completed_date = today
+        db.add(stats)
+        for kind, key in (('stage', stage_id), ('day', day)):
+            counter = db.get(ProgressCounter, (kind, key)) or ProgressCounter(kind=kind, key=key, count=0)
+            counter.count += 1
+            db.add(counter)
+        return
+
+    stmt = insert(UserStats).values(
+        user_id=user.id, completed_steps=1, days_practiced=1,
+        last_completed_at=now, last_completed_date=today
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            'completed_steps': UserStats.completed_steps + 1,
+            'days_practiced': UserStats.days_practiced + case(
+                (UserStats.last_completed_date == stmt.excluded.last_completed_date, 0), else_=1
+            ),
+            'last_completed_at': stmt.excluded.last_completed_at,
+            'last_completed_date': stmt.excluded.last_completed_date,
+        }
+    ))
+
+    # Строки всегда в одном порядке (этап, затем день) — без взаимных блокировок
+    stmt = insert(ProgressCounter).values([
+        {'kind': 'stage', 'key': stage_id, 'count': 1},
+        {'kind': 'day', 'key': day, 'count': 1},
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[ProgressCounter.kind, ProgressCounter.key],
+        set_={'count': ProgressCounter.count + 1}
+    ))
+
+
+def get_progress_counters(db: Session) -> dict:
+    """
+    Глобальные счётчики событий прогресса
+
+    Returns:
+        dict: {'stage': {номер: событий}, 'day': {номер: событий}}
+    """
+    result = {'stage': {}, 'day': {}}
+    for counter in db.scalars(select(ProgressCounter)):
+        result.setdefault(counter.kind, {})[counter.key] = counter.count
+    return result
+
+
+def list_users_page(db: Session, platform: str = None, stage: int = None, paused: bool = None,
+                    search: str = None, after_id: int = None, before_id: int = None,
+                    limit: int = 10):
+    """
+    Страница пользователей для админки: keyset-пагинация по id
+
+    Один запрос на страницу: лишняя (limit + 1)-я строка говорит,
+    есть ли страница дальше в направлении листания.
+
+    Args:
+        db: Сессия БД
+        platform: 'telegram' / 'vk' (None — все)
+        stage: Текущий этап (None — любой)
+        paused: Только на паузе / только активные (None — все)
+        search: Начало username или имени (без учёта регистра)
+        after_id: Страница после этого id (листание вперёд)
+        before_id: Страница перед этим id (листание назад)
+        limit: Размер страницы
+
+    Returns:
+        tuple: (rows, has_prev, has_next), rows упорядочены по id
+    """
+    query = select(
+        User.id, User.platform, User.telegram_id, User.vk_id, User.username,
+        User.first_name, User.current_stage, User.is_paused, User.is_active
+    )
+    if platform:
+        query = query.where(User.platform == platform)
+    if stage is not None:
+        query = query.where(User.current_stage == stage)
+    if paused is not None:
+        query = query.where(User.is_paused == paused)
+    if search:
+        # Совпадает с выражением индексов ix_users_*_lower
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = func.lower(escaped, type_=String) + '%'
+        query = query.where(or_(
+            func.lower(User.username).like(pattern, escape='\\'),
+            func.lower(User.first_name).like(pattern, escape='\\'),
+        ))
+
+    backwards = before_id is not None
+    if backwards:
+        query = query.where(User.id < before_id).order_by(User.id.desc())
+    else:
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        query = query.order_by(User.id)
+
+    rows = db.execute(query.limit(limit + 1)).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        return list(reversed(rows)), more, True
+    return rows, after_id is not None, more
+
+
+def get_user_history(db: Session, user, limit: int = 20, since: datetime = None) -> list:
+    """
+    Последние записи истории пользователя (новые первыми)
+
+    Args:
+        db: Сессия БД
+        user: Объект User
+        limit: Сколько записей вернуть
+        since: Только записи не раньше этого момента (UTC)
+    """
+    query = select(UserProgress).where(UserProgress.user_id == user.id)
+    if since is not None:
+        query = query.where(UserProgress.completed_at >= since)
+    query = query.order_by(UserProgress.completed_at.desc(), UserProgress.id.desc()).limit(limit)
+    return list(db.scalars(query))
+
+
 def update_user_progress_obj(db: Session, user, stage_id: int,
                              step_id: int, day: int, user_response: str = None):
     """
     Обновить прогресс пользователя (platform-agnostic, принимает объект User)
+
+    Новый шаг вычислен обработчиком по прочитанной строке. Если другой
+    процесс успел сдвинуть этап или шаг, запись не делается — иначе
+    повтор вернул бы пользователя на устаревший шаг и записал шаг в
+    историю и счётчики второй раз.
+
+    Returns:
+        bool: True — записано, False — прогресс уже изменился
     """
-    user.current_stage = stage_id
-    user.current_step = step_id
-    user.current_day = day
-    user.last_interaction = datetime.utcnow()
-
-    progress = UserProgress(
-        user_telegram_id=user.platform_id,
-        stage_id=stage_id,
-        step_id=step_id,
-        day=day,
-        user_response=user_response
-    )
-    db.add(progress)
-    db.commit()
+    expected = (user.current_stage, user.current_step)
+
+    def mutate(user):
+        if (user.current_stage, user.current_step) != expected:
+            return False
+        user.current_stage = stage_id
+        user.current_step = step_id
+        user.current_day = day
+        user.last_interaction = datetime.utcnow()
+
+        # После отката запись истории и счётчики добавляются заново
+        now = datetime.utcnow()
+        db.add(UserProgress(
+            user_id=user.id,
+            user_telegram_id=user.platform_id,
+            stage_id=stage_id,
+            step_id=step_id,
+            day=day,
+            user_response=user_response,
+            completed_at=now
+        ))
+        _count_progress(db, user, stage_id, day, now)
+
+    if not update_user_cas(db, user, mutate):
+        logger.info(
+            f"Прогресс {user.platform}:{user.platform_id} уже изменён другим процессом "
+            f"(ожидался {expected}), шаг {stage_id}/{step_id} не записан"
+        )
+        return False
     logger.info(f"Обновлён прогресс {user.platform}:{user.platform_id}: stage={stage_id}, step={step_id}, day={day}")
+    return True
 
 
 def reset_user_progress_obj(db: Session, user):
     """Сбросить прогресс пользователя (platform-agnostic)"""
-    user.current_stage = 1
-    user.current_step = 1
-    user.current_day = 1
-    user.is_paused = False
-    user.paused_at = None
-    user.daily_practice_day = 0
-    user.daily_practice_substep = ""
-    user.last_practice_date = None
-    user.reminder_postponed = False
-    user.postponed_until = None
-    user.awaiting_sprouts = False
-    db.commit()
+    def mutate(user):
+        user.current_stage = 1
+        user.current_step = 1
+        user.current_day = 1
+        user.is_paused = False
+        user.paused_at = None
+        user.daily_practice_day = 0
+        user.daily_practice_substep = ""
+        user.last_practice_date = None
+        user.reminder_postponed = False
+        user.postponed_until = None
+        user.awaiting_sprouts = False
+
+    update_user_cas(db, user, mutate)
     logger.info(f"Прогресс {user.platform}:{user.platform_id} сброшен")
 
 
 def delete_user_data(db: Session, telegram_id: int):
     """
-    Удалить все данные пользователя (GDPR)
+    Удалить все данные пользователя Telegram (GDPR)
+
+    Удаление идёт пачками через utils.purge; для VK — purge_user(db, 'vk', vk_id).
 
     Args:
         db: Сессия БД
         telegram_id: ID пользователя
     """
-    # Удалить историю прогресса
-    db.query(UserProgress).filter(UserProgress.user_telegram_id == telegram_id).delete()
-
-    # Удалить напоминания
-    db.query(ScheduledReminder).filter(ScheduledReminder.user_telegram_id == telegram_id).delete()
+    from utils.purge import purge_user
 
-    # Удалить пользователя
-    db.query(User).filter(User.telegram_id == telegram_id).delete()
-
-    db.commit()
-    logger.info(f"Данные пользователя {telegram_id} удалены (GDPR)")
+    totals = purge_user(db, 'telegram', telegram_id)
+    logger.info(f"Данные пользователя {telegram_id} удалены (GDPR): {totals}")
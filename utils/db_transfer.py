@@ -0,0 +1,224 @@
+"""
+Перенос данных между базами: SQLite ⇄ PostgreSQL (или снимок прода в staging)
+
+Таблицы users, user_progress и scheduled_reminders копируются по порядку
+id упорядоченными порциями: в памяти всегда не больше одной порции.
+Каждая порция записывается в своей транзакции — в PostgreSQL через
+COPY FROM STDIN, в SQLite пачкой INSERT. Точка продолжения — max(id)
+уже перенесённых строк в целевой базе, поэтому прерванный перенос
+достаточно запустить ещё раз: он продолжит с последней записанной порции.
+
+После переноса в PostgreSQL счётчики id (sequence) выставляются по
+данным, а обе стороны сверяются по числу строк и контрольной сумме.
+Счётчики user_stats / progress_counters в целевой базе пересобираются
+отдельно: DATABASE_URL=<цель> python migrate_rebuild_progress_counters.py
+
+Запуск из консоли (боты на обеих базах лучше остановить):
+    python -m utils.db_transfer sqlite:///sogreto_bot.db postgresql://...
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import logging
+import sys
+from datetime import datetime
+
+from sqlalchemy import create_engine, delete, func, insert, select, text
+
+from models import Base, ScheduledReminder, User, UserProgress
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+# Порядок важен: user_progress ссылается на users
+TABLES = {
+    'users': User.__table__,
+    'user_progress': UserProgress.__table__,
+    'scheduled_reminders': ScheduledReminder.__table__,
+}
+
+COPY_NULL = '\\N'
+
+
+def make_engine(url: str):
+    """Движок по URL (Railway отдаёт postgres://)"""
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    connect_args = {"check_same_thread": False} if url.startswith('sqlite') else {}
+    return create_engine(url, connect_args=connect_args)
+
+
+def _read_chunk(conn, table, after_id: int, chunk_size: int) -> list:
+    return conn.execute(
+        select(table).where(table.c.id > after_id).order_by(table.c.id).limit(chunk_size)
+    ).all()
+
+
+def _copy_value(value):
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def _write_chunk(conn, table, rows: list):
+    """Записать порцию в целевую базу (в текущей транзакции conn)"""
+    if conn.dialect.name != 'postgresql':
+        conn.execute(insert(table), [row._asdict() for row in rows])
+        return
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_copy_value(value) for value in row] for row in rows)
+    buffer.seek(0)
+
+    quote = conn.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(column.name) for column in table.columns)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {quote(table.name)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _reset_sequence(conn, table):
+    """Следующий id в PostgreSQL — после перенесённых строк"""
+    if conn.dialect.name != 'postgresql':
+        return
+    name = conn.dialect.identifier_preparer.quote(table.name)
+    conn.execute(
+        text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), max(id)) FROM {name} HAVING max(id) IS NOT NULL"),
+        {'table': table.name}
+    )
+
+
+def transfer_table(source, target, table, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Скопировать таблицу порциями, продолжая с max(id) в целевой базе
+
+    Returns:
+        int: Сколько строк перенесено в этом запуске
+    """
+    with target.connect() as conn:
+        last_id = conn.execute(select(func.max(table.c.id))).scalar() or 0
+    if last_id:
+        logger.info(f"{table.name}: продолжаем после id={last_id}")
+
+    copied = 0
+    with source.connect() as source_conn:
+        while True:
+            rows = _read_chunk(source_conn, table, last_id, chunk_size)
+            if not rows:
+                break
+            with target.begin() as conn:
+                _write_chunk(conn, table, rows)
+            last_id = rows[-1].id
+            copied += len(rows)
+            logger.info(f"{table.name}: +{len(rows)} (всего {copied}, id ≤ {last_id})")
+
+    with target.begin() as conn:
+        _reset_sequence(conn, table)
+    return copied
+
+
+def _normalize(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def table_checksum(engine, table, chunk_size: int = CHUNK_SIZE):
+    """
+    Число строк и SHA-256 по строкам в порядке id
+
+    Значения приводятся к общему виду, так что суммы SQLite и PostgreSQL
+    совпадают для одинаковых данных.
+
+    Returns:
+        tuple: (число строк, hex-дайджест)
+    """
+    digest = hashlib.sha256()
+    count, last_id = 0, 0
+    with engine.connect() as conn:
+        while True:
+            rows = _read_chunk(conn, table, last_id, chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                digest.update(json.dumps([_normalize(value) for value in row], ensure_ascii=False).encode())
+                digest.update(b'\n')
+            count += len(rows)
+            last_id = rows[-1].id
+    return count, digest.hexdigest()
+
+
+def transfer(source, target, tables=tuple(TABLES), chunk_size: int = CHUNK_SIZE, fresh: bool = False) -> dict:
+    """
+    Перенести таблицы и сверить результат
+
+    Args:
+        source, target: Движки SQLAlchemy
+        tables: Имена таблиц из TABLES
+        chunk_size: Строк в одной порции
+        fresh: Сначала очистить эти таблицы в целевой базе
+
+    Returns:
+        dict: {таблица: {'copied', 'source', 'target', 'ok'}}
+    """
+    Base.metadata.create_all(bind=target)
+    if fresh:
+        with target.begin() as conn:
+            for name in reversed(tables):
+                conn.execute(delete(TABLES[name]))
+
+    report = {}
+    for name in tables:
+        table = TABLES[name]
+        copied = transfer_table(source, target, table, chunk_size)
+        source_sum = table_checksum(source, table, chunk_size)
+        target_sum = table_checksum(target, table, chunk_size)
+        report[name] = {
+            'copied': copied,
+            'source': source_sum,
+            'target': target_sum,
+            'ok': source_sum == target_sum,
+        }
+    return report
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Перенос users, user_progress и scheduled_reminders между базами")
+    parser.add_argument('source', help="URL исходной базы")
+    parser.add_argument('target', help="URL целевой базы")
+    parser.add_argument('--table', action='append', choices=list(TABLES), help="Только эти таблицы")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Строк в одной порции")
+    parser.add_argument('--fresh', action='store_true', help="Очистить таблицы в целевой базе перед переносом")
+    args = parser.parse_args()
+
+    tables = [name for name in TABLES if not args.table or name in args.table]
+    report = transfer(
+        make_engine(args.source), make_engine(args.target),
+        tables=tables, chunk_size=args.chunk_size, fresh=args.fresh
+    )
+
+    for name, entry in report.items():
+        status = "✅" if entry['ok'] else "❌"
+        print(
+            f"{status} {name}: перенесено {entry['copied']}, "
+            f"строк {entry['source'][0]} → {entry['target'][0]}, "
+            f"сумма {entry['source'][1][:12]} / {entry['target'][1][:12]}"
+        )
+    if not all(entry['ok'] for entry in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
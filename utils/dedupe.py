@@ -0,0 +1,295 @@
+"""
+Защита от повторной обработки одного и того же нажатия
+
+Повторы бывают двух видов:
+- та же доставка ещё раз: Telegram после падения бота, long-poll VK после
+  переподключения — ключ апдейта (update_id, id callback-запроса,
+  event_id VK, сообщение VK) уже встречался;
+- двойное нажатие: пользователь дважды жмёт ту же кнопку, и каждый раз
+  приходит новый апдейт с тем же действием — отсекается коротким окном
+  на (платформа, пользователь, действие).
+
+Ключи хранятся в ограниченном кэше с TTL; отсеянные повторы считаются
+в метриках {platform}.dedupe.update и {platform}.dedupe.debounce.
+
+Кэш живёт в памяти процесса, поэтому повторную доставку после падения
+Telegram-бота ловит отдельная отметка: наибольший обработанный
+update_id хранится в таблице update_watermarks. Отметка сдвигается,
+когда обработчики апдейта завершились (TelegramDedupeApplication), и
+не дальше самого раннего ещё обрабатываемого апдейта: апдейт, на
+котором процесс упал, после перезапуска обрабатывается заново. Пачки
+идущих подряд апдейтов пишутся одной записью. После перезапуска
+апдейты с update_id не больше отметки пропускаются.
+Telegram выбирает update_id случайно после недели без апдейтов,
+поэтому отметка старше WATERMARK_MAX_AGE не применяется. У VK
+повторной доставки после перезапуска нет: long-poll начинается
+с нового ts.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes
+
+from models import SessionLocal, UpdateWatermark
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_TTL = float(os.getenv('DEDUPE_TTL', 10 * 60))  # секунды
+DEDUPE_MAX_ENTRIES = int(os.getenv('DEDUPE_MAX_ENTRIES', 50000))
+DEBOUNCE_WINDOW = float(os.getenv('DEBOUNCE_WINDOW', 1.5))  # секунды
+# Отметка update_id старше этого не применяется (Telegram хранит апдейты сутки)
+WATERMARK_MAX_AGE = timedelta(hours=int(os.getenv('DEDUPE_WATERMARK_MAX_AGE_HOURS', 24)))
+
+
+class ExpiringKeys:
+    """Множество ключей с TTL и ограничением размера (старые вытесняются первыми)"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._expires = OrderedDict()
+
+    def add(self, key, now: float) -> bool:
+        """
+        Запомнить ключ
+
+        Returns:
+            bool: False, если ключ уже есть и ещё не истёк
+        """
+        self._evict(now)
+        if key in self._expires:
+            return False
+        self._expires[key] = now + self.ttl
+        if len(self._expires) > self.max_entries:
+            self._expires.popitem(last=False)
+        return True
+
+    def _evict(self, now: float):
+        # Ключи добавляются с одинаковым TTL, поэтому истёкшие всегда в начале
+        while self._expires:
+            key, expires_at = next(iter(self._expires.items()))
+            if expires_at > now:
+                break
+            del self._expires[key]
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class UpdateDeduplicator:
+    """Кэш увиденных апдейтов и окно антидребезга для одинаковых действий"""
+
+    def __init__(self, ttl: float = DEDUPE_TTL, debounce: float = DEBOUNCE_WINDOW,
+                 max_entries: int = DEDUPE_MAX_ENTRIES):
+        self._updates = ExpiringKeys(ttl, max_entries)
+        self._actions = ExpiringKeys(debounce, max_entries)
+
+    def check(self, platform: str, update_keys, user_id=None, action: str = None,
+              now: Optional[float] = None) -> Optional[str]:
+        """
+        Проверить апдейт и запомнить его
+
+        Args:
+            platform: 'telegram' или 'vk'
+            update_keys: Ключи доставки (update_id, id запроса, event_id...)
+            user_id, action: Для антидребезга; без них окно не применяется
+
+        Returns:
+            'update' — эта доставка уже обрабатывалась,
+            'debounce' — то же действие пользователя только что было,
+            None — апдейт нужно обработать
+        """
+        now = time.monotonic() if now is None else now
+        fresh = [self._updates.add((platform, key), now) for key in update_keys if key is not None]
+        if not all(fresh):
+            reason = 'update'
+        elif user_id is not None and action and not self._actions.add((platform, user_id, action), now):
+            reason = 'debounce'
+        else:
+            return None
+        metrics.inc(f'{platform}.dedupe.{reason}')
+        return reason
+
+    def __len__(self):
+        return len(self._updates)
+
+
+class UpdateHighWaterMark:
+    """Наибольший принятый update_id платформы в памяти и в таблице update_watermarks"""
+
+    def __init__(self, platform: str, session_factory=SessionLocal, max_age: timedelta = WATERMARK_MAX_AGE):
+        self.platform = platform
+        self.session_factory = session_factory
+        self.max_age = max_age
+        self._mark = None  # (update_id, datetime UTC) или None
+        self._in_flight = set()  # update_id, обработка которых ещё идёт
+        self._completed = None  # наибольший обработанный update_id процесса
+        self._previous = None  # отметка прошлого процесса из БД
+        self._loaded = False
+        self._saved = None
+        self._task = None
+
+    def is_processed(self, update_id: int, now: datetime = None) -> bool:
+        """Апдейт не новее отметки прошлого процесса (если она достаточно свежая)"""
+        if not self._loaded:
+            self._load()
+        if self._previous is None:
+            return False
+        previous_id, saved_at = self._previous
+        return update_id <= previous_id and (now or datetime.utcnow()) - saved_at < self.max_age
+
+    def begin(self, update_id: int):
+        """Апдейт принят в обработку"""
+        self._in_flight.add(update_id)
+
+    def finish(self, update_id: int, now: datetime = None):
+        """Обработка апдейта завершена: сдвинуть отметку до последнего полностью обработанного"""
+        self._in_flight.discard(update_id)
+        if self._completed is None or update_id > self._completed:
+            self._completed = update_id
+        safe = self._completed
+        if self._in_flight:
+            safe = min(safe, min(self._in_flight) - 1)
+        self.advance(safe, now)
+
+    def advance(self, update_id: int, now: datetime = None):
+        """Сдвинуть отметку вперёд; в БД она уйдёт фоновой записью"""
+        now = now or datetime.utcnow()
+        if self._mark is None or update_id > self._mark[0] or now - self._mark[1] >= self.max_age:
+            self._mark = (update_id, now)
+            self._ensure_writer()
+
+    def save(self):
+        """Записать текущую отметку в БД (синхронно)"""
+        mark = self._mark
+        if mark is None or mark == self._saved:
+            return
+        db = self.session_factory()
+        try:
+            row = db.get(UpdateWatermark, self.platform)
+            if row is None:
+                db.add(UpdateWatermark(platform=self.platform, update_id=mark[0], updated_at=mark[1]))
+            else:
+                row.update_id, row.updated_at = mark
+            db.commit()
+            self._saved = mark
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _load(self):
+        self._loaded = True
+        db = self.session_factory()
+        try:
+            row = db.execute(
+                select(UpdateWatermark.update_id, UpdateWatermark.updated_at)
+                .where(UpdateWatermark.platform == self.platform)
+            ).first()
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать отметку апдейтов {self.platform}: {e}")
+            row = None
+        finally:
+            db.close()
+        if row is not None:
+            self._previous = (row.update_id, row.updated_at)
+            if self._mark is None:
+                self._mark = self._saved = self._previous
+
+    def _ensure_writer(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        self._task = loop.create_task(self._write())
+
+    async def _write(self):
+        """Писать, пока отметка уходит вперёд: апдейты, пришедшие во время записи, — одной записью"""
+        while self._mark != self._saved:
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception as e:
+                logger.error(f"Ошибка записи отметки апдейтов {self.platform}: {e}")
+                return
+
+
+# Общий дедупликатор процесса
+update_deduplicator = UpdateDeduplicator()
+
+# Отметка обработанных апдейтов Telegram (переживает перезапуск)
+telegram_update_mark = UpdateHighWaterMark('telegram')
+
+
+async def telegram_dedupe_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    TypeHandler в группе -1: остановить обработку повторного апдейта
+
+    Антидребезг применяется только к нажатиям кнопок — повторный текст
+    (например, ответ на вопрос) может быть осознанным.
+    """
+    # Повторная доставка после перезапуска: апдейт уже принимался прошлым процессом
+    if telegram_update_mark.is_processed(update.update_id):
+        metrics.inc('telegram.dedupe.restart')
+        logger.info(f"Апдейт {update.update_id} уже обработан до перезапуска — пропущен")
+        raise ApplicationHandlerStop
+
+    query = update.callback_query
+    keys = [f"update:{update.update_id}"]
+    if query is not None:
+        keys.append(f"query:{query.id}")
+    user = update.effective_user
+
+    reason = update_deduplicator.check(
+        'telegram',
+        keys,
+        user_id=user.id if user else None,
+        action=query.data if query is not None else None,
+    )
+    if reason is None:
+        return
+
+    logger.info(f"Повторный апдейт {update.update_id} пропущен ({reason})")
+    if query is not None and reason == 'debounce':
+        # Новый callback-запрос всё равно нужно подтвердить, иначе кнопка «крутится»
+        try:
+            await query.answer()
+        except TelegramError:
+            pass
+    raise ApplicationHandlerStop
+
+
+class TelegramDedupeApplication(Application):
+    """
+    Application, которое сдвигает отметку telegram_update_mark после обработки апдейта
+
+    Отметка ставится, когда отработали все группы обработчиков (в том
+    числе с ошибкой — её уже получил обработчик ошибок). Если процесс
+    упал или остановлен посреди апдейта, отметка на нём не стоит, и
+    Telegram доставит его снова.
+    """
+
+    async def process_update(self, update: object) -> None:
+        if not isinstance(update, Update):
+            await super().process_update(update)
+            return
+        telegram_update_mark.begin(update.update_id)
+        try:
+            await super().process_update(update)
+        except Exception:
+            telegram_update_mark.finish(update.update_id)
+            raise
+        # Отмена (остановка процесса посреди апдейта) сюда не доходит — апдейт придёт снова
+        telegram_update_mark.finish(update.update_id)
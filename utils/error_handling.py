@@ -62,8 +62,8 @@ def error_handler(func):
         except Forbidden:
             # Пользователь заблокировал бота
             logger.warning(f"User {update.effective_user.id} blocked the bot")
-            # Помечаем пользователя как неактивного в БД
-            # TODO: db.mark_user_inactive(update.effective_user.id)
+            # Помечаем пользователя как неактивного в БД (вернётся активным при /start)
+            mark_user_blocked(update.effective_user.id)
 
         except BadRequest as e:
             # Неверный запрос к Telegram API
@@ -152,6 +152,20 @@ def error_handler(func):
     return wrapper
 
 
+def mark_user_blocked(telegram_id: int, reason: str = 'blocked'):
+    """Пометить Telegram-пользователя неактивным, чтобы рассылка его пропускала"""
+    from models import SessionLocal
+    from utils.db import mark_users_inactive
+    db = SessionLocal()
+    try:
+        mark_users_inactive(db, 'telegram', [telegram_id], reason)
+    except Exception as e:
+        logger.error(f"Не удалось деактивировать пользователя {telegram_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
 def safe_execute(func, *args, **kwargs):
     """
     Безопасное выполнение функции с логированием ошибок
@@ -173,6 +187,13 @@ async def global_error_handler(update: object, context: ContextTypes.DEFAULT_TYP
     Регистрация:
         application.add_error_handler(global_error_handler)
     """
+    if isinstance(context.error, Forbidden):
+        # Ответ не доставлен: пользователь заблокировал бота
+        if isinstance(update, Update) and update.effective_user:
+            logger.warning(f"User {update.effective_user.id} blocked the bot")
+            mark_user_blocked(update.effective_user.id)
+        return
+
     error_text = f"{type(context.error).__name__}: {context.error}"
     logger.error(f"Exception while handling an update: {context.error}")
 
@@ -0,0 +1,262 @@
+"""
+Инкрементальная выгрузка users и user_progress для офлайн-анализа
+
+Каждый запуск выгружает только новые и изменённые строки:
+- users — по водяному знаку (updated_at, id);
+- user_progress — по id (история только дописывается).
+
+Отметки хранятся в watermarks.json в каталоге выгрузки и сдвигаются
+только после того, как файл целиком записан. Строки читаются курсором
+на стороне сервера (stream_results) порциями по индексу водяного знака,
+поэтому время и память зависят от объёма изменений, а не от размера
+таблиц. Для CSV на PostgreSQL используется COPY ... TO STDOUT.
+
+Удаления (сброс прогресса, удаление данных) в выгрузку не попадают.
+
+Запуск из консоли:
+    python -m utils.export --format jsonl
+    python -m utils.export --format csv --out exports --full
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, select, tuple_
+
+from models import SessionLocal, User, UserProgress
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 10000))
+# Свежие строки откладываются до следующего запуска: транзакция, начатая
+# раньше, может закоммитить более старую отметку уже после выгрузки (секунды)
+EXPORT_LAG = int(os.getenv('EXPORT_LAG', 60))
+
+WATERMARK_FILE = 'watermarks.json'
+FORMATS = ('jsonl', 'csv')
+
+# Таблица → (колонки водяного знака по порядку, колонка времени для задержки)
+TABLES = {
+    'users': (User.__table__, ('updated_at', 'id'), 'updated_at'),
+    'user_progress': (UserProgress.__table__, ('id',), 'completed_at'),
+}
+
+
+def load_watermarks(out_dir: str) -> dict:
+    """Отметки прошлых запусков: {таблица: {колонка: значение}}"""
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_watermarks(out_dir: str, watermarks: dict):
+    """Записать отметки атомарно (через временный файл)"""
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _encode_mark(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode_mark(table, column: str, value):
+    if value is not None and isinstance(table.c[column].type, DateTime):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _delta_filter(table, keys, time_column: str, watermark: dict, cutoff: datetime):
+    """Строки после отметки и не новее cutoff"""
+    conditions = [table.c[time_column] <= cutoff]
+    if watermark:
+        marks = [_decode_mark(table, key, watermark[key]) for key in keys]
+        if len(keys) == 1:
+            conditions.append(table.c[keys[0]] > marks[0])
+        else:
+            conditions.append(tuple_(*(table.c[key] for key in keys)) > tuple_(*marks))
+    return conditions
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_value(value):
+    # Как в COPY ... CSV: пустое поле для NULL, t/f для булевых
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def _stream_rows(conn, stmt, fmt: str, names: list, f, chunk_size: int):
+    """
+    Записать результат запроса порциями
+
+    Returns:
+        tuple: (число строк, последняя строка или None)
+    """
+    text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+    writer = csv.writer(text) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(names)
+
+    count, last = 0, None
+    result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+    for chunk in result.partitions():
+        if writer:
+            writer.writerows([_csv_value(value) for value in row] for row in chunk)
+        else:
+            text.writelines(
+                json.dumps(dict(zip(names, map(_json_value, row))), ensure_ascii=False) + '\n'
+                for row in chunk
+            )
+        count += len(chunk)
+        last = chunk[-1]
+    text.flush()
+    text.detach()
+    return count, last
+
+
+def _copy_rows(conn, stmt, keys, f):
+    """
+    CSV через COPY (PostgreSQL): границу выгрузки фиксируем заранее,
+    потому что сами строки COPY в Python не проходят
+
+    Returns:
+        tuple: (число строк, последняя строка или None)
+    """
+    table_keys = [stmt.selected_columns[key] for key in keys]
+    last = conn.execute(
+        stmt.with_only_columns(*table_keys).order_by(None).order_by(*(key.desc() for key in table_keys)).limit(1)
+    ).first()
+    if last is None:
+        return 0, None
+
+    if len(keys) == 1:
+        bounded = stmt.where(table_keys[0] <= last[0])
+    else:
+        bounded = stmt.where(tuple_(*table_keys) <= tuple_(*last))
+    compiled = bounded.compile(dialect=conn.dialect)
+
+    cursor = conn.connection.cursor()
+    try:
+        query = cursor.mogrify(str(compiled), compiled.params).decode()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        count = cursor.rowcount
+    finally:
+        cursor.close()
+    return count, dict(zip(keys, last))
+
+
+def export_table(db, name: str, out_dir: str, fmt: str = 'jsonl', watermark: dict = None,
+                 chunk_size: int = EXPORT_CHUNK_SIZE, lag: int = EXPORT_LAG):
+    """
+    Выгрузить изменения одной таблицы в сжатый файл
+
+    Args:
+        db: Сессия БД
+        name: 'users' или 'user_progress'
+        out_dir: Каталог выгрузки
+        fmt: 'jsonl' или 'csv'
+        watermark: Отметка прошлого запуска (None — выгрузить всё)
+        chunk_size: Строк за одну порцию чтения
+        lag: Не выгружать строки новее lag секунд
+
+    Returns:
+        tuple: (путь к файлу или None, число строк, новая отметка)
+    """
+    table, keys, time_column = TABLES[name]
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+    stmt = (
+        select(table)
+        .where(*_delta_filter(table, keys, time_column, watermark, cutoff))
+        .order_by(*(table.c[key] for key in keys))
+    )
+    names = [column.name for column in table.columns]
+
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(out_dir, f"{name}_{stamp}.{fmt}.gz")
+    conn = db.connection()
+    with gzip.open(path + '.part', 'wb') as f:
+        if fmt == 'csv' and conn.dialect.name == 'postgresql':
+            count, last = _copy_rows(conn, stmt, keys, f)
+        else:
+            count, last = _stream_rows(conn, stmt, fmt, names, f, chunk_size)
+
+    if not count:
+        os.remove(path + '.part')
+        return None, 0, watermark
+    os.replace(path + '.part', path)
+    last = last if isinstance(last, dict) else last._mapping
+    return path, count, {key: _encode_mark(last[key]) for key in keys}
+
+
+def run_export(out_dir: str = EXPORT_DIR, fmt: str = 'jsonl', tables=tuple(TABLES), full: bool = False,
+               session_factory=SessionLocal, chunk_size: int = EXPORT_CHUNK_SIZE, lag: int = EXPORT_LAG) -> dict:
+    """
+    Выгрузить изменения всех таблиц и сдвинуть отметки
+
+    Returns:
+        dict: {таблица: {'path': ..., 'rows': ...}}
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    watermarks = load_watermarks(out_dir)
+
+    summary = {}
+    db = session_factory()
+    try:
+        for name in tables:
+            path, rows, mark = export_table(
+                db, name, out_dir, fmt,
+                watermark=None if full else watermarks.get(name),
+                chunk_size=chunk_size, lag=lag
+            )
+            if mark is not None:
+                watermarks[name] = mark
+                # Отметка сдвигается сразу после своего файла: сбой на следующей
+                # таблице не заставит выгружать эту заново
+                save_watermarks(out_dir, watermarks)
+            summary[name] = {'path': path, 'rows': rows}
+            logger.info(f"Выгрузка {name}: {rows} строк → {path or '(нет изменений)'}")
+    finally:
+        db.rollback()
+        db.close()
+    return summary
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Инкрементальная выгрузка users и user_progress")
+    parser.add_argument('--format', choices=FORMATS, default='jsonl', help="Формат файлов (сжатые gzip)")
+    parser.add_argument('--out', default=EXPORT_DIR, help="Каталог выгрузки и отметок")
+    parser.add_argument('--table', action='append', choices=list(TABLES), help="Только эти таблицы")
+    parser.add_argument('--full', action='store_true', help="Игнорировать отметки и выгрузить всё")
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help="Строк за одну порцию чтения")
+    args = parser.parse_args()
+
+    summary = run_export(
+        out_dir=args.out, fmt=args.format, tables=args.table or tuple(TABLES),
+        full=args.full, chunk_size=args.chunk_size
+    )
+    for name, entry in summary.items():
+        print(f"{name}: {entry['rows']} строк → {entry['path'] or '(нет изменений)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Редактирование сообщений Telegram без лишних запросов
+
+Для каждого сообщения (chat_id, message_id) хранится хэш последнего
+отрисованного содержимого: текст, клавиатура и parse_mode. Если новое
+содержимое совпадает с тем, что уже на экране, запрос к Telegram не
+отправляется. Ошибка «message is not modified» тоже считается успехом,
+а не поводом показать пользователю «Произошла ошибка».
+"""
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from telegram.error import BadRequest
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EDIT_CACHE_SIZE = int(os.getenv('EDIT_CACHE_SIZE', 20000))
+
+
+def content_hash(text: str, reply_markup=None, parse_mode=None) -> bytes:
+    """Хэш отрисованного содержимого сообщения"""
+    markup = reply_markup.to_dict() if reply_markup is not None else None
+    payload = json.dumps([text, markup, parse_mode], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).digest()
+
+
+class RenderedContentCache:
+    """LRU: (chat_id, message_id) -> хэш содержимого на экране"""
+
+    def __init__(self, max_size: int = EDIT_CACHE_SIZE):
+        self.max_size = max_size
+        self._hashes = OrderedDict()
+
+    def matches(self, key, digest: bytes) -> bool:
+        current = self._hashes.get(key)
+        if current is None:
+            return False
+        self._hashes.move_to_end(key)
+        return current == digest
+
+    def remember(self, key, digest: bytes):
+        self._hashes[key] = digest
+        self._hashes.move_to_end(key)
+        while len(self._hashes) > self.max_size:
+            self._hashes.popitem(last=False)
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+# Кэш отрисованных сообщений процесса
+rendered_cache = RenderedContentCache()
+
+
+def _message_key(query):
+    message = query.message
+    if message is None:
+        # Сообщение из inline-режима — ключ по inline_message_id
+        return ('inline', query.inline_message_id)
+    return (message.chat_id, message.message_id)
+
+
+async def edit_message_text(query, text: str, reply_markup=None, parse_mode=None, **kwargs):
+    """
+    Отредактировать сообщение callback-запроса, если содержимое изменилось
+
+    Принимает те же аргументы, что и CallbackQuery.edit_message_text.
+
+    Returns:
+        Результат edit_message_text или None, если правка не понадобилась
+    """
+    key = _message_key(query)
+    digest = content_hash(text, reply_markup, parse_mode)
+    if rendered_cache.matches(key, digest):
+        metrics.inc('telegram.edit.skipped')
+        return None
+
+    try:
+        result = await query.edit_message_text(
+            text, reply_markup=reply_markup, parse_mode=parse_mode, **kwargs
+        )
+    except BadRequest as e:
+        if 'message is not modified' not in str(e).lower():
+            raise
+        metrics.inc('telegram.edit.not_modified')
+        rendered_cache.remember(key, digest)
+        return None
+
+    metrics.inc('telegram.edit.sent')
+    rendered_cache.remember(key, digest)
+    metrics.set_gauge('telegram.edit.cache_size', len(rendered_cache))
+    return result
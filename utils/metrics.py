@@ -0,0 +1,87 @@
+"""
+Метрики процесса в памяти: счётчики, значения и задержки
+
+Лёгкая замена внешней системе мониторинга: модули пишут сюда,
+а /admin_metrics показывает снимок. Для задержек хранится скользящее
+окно последних замеров, по которому считаются p50/p99.
+"""
+import threading
+from collections import deque
+
+# Сколько последних замеров задержки хранить на метрику
+LATENCY_WINDOW = 2000
+
+
+class Metrics:
+    """Потокобезопасный реестр метрик процесса"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._latencies = {}
+
+    def inc(self, name: str, value: int = 1):
+        """Увеличить счётчик"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value):
+        """Записать текущее значение (размер очереди, пула и т.п.)"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """Записать замер задержки в секундах"""
+        with self._lock:
+            samples = self._latencies.get(name)
+            if samples is None:
+                samples = self._latencies[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def percentile(self, name: str, q: float):
+        """Перцентиль задержки (q от 0 до 100) или None, если замеров нет"""
+        with self._lock:
+            samples = sorted(self._latencies.get(name) or ())
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> dict:
+        """
+        Снимок всех метрик
+
+        Returns:
+            dict: {'counters': {...}, 'gauges': {...}, 'latency': {name: {count, p50, p99}}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            names = list(self._latencies)
+        latency = {}
+        for name in names:
+            with self._lock:
+                count = len(self._latencies[name])
+            latency[name] = {
+                'count': count,
+                'p50': self.percentile(name, 50),
+                'p99': self.percentile(name, 99),
+            }
+        return {'counters': counters, 'gauges': gauges, 'latency': latency}
+
+    def reset(self):
+        """Сбросить все метрики"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._latencies.clear()
+
+
+# Глобальный реестр метрик
+metrics = Metrics()
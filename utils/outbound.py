@@ -0,0 +1,247 @@
+"""
+Приоритетная очередь исходящих сообщений (одна на платформу в процессе)
+
+Ответы на нажатия кнопок и рассылка напоминаний делят один лимит
+платформы. Очередь выдаёт разрешения на отправку по приоритету:
+INTERACTIVE > REMINDER > BROADCAST. Соблюдаются:
+- общий лимит запросов (token bucket, часть ёмкости зарезервирована
+  под интерактивные ответы, чтобы рассылка не выбирала её до нуля);
+- лимит на чат для Telegram (~1 сообщение/с с небольшим всплеском).
+
+Приоритет задаётся контекстом (send_priority) — планировщик помечает
+свою рассылку, а обработчики по умолчанию считаются интерактивными.
+Очереди живут в памяти процесса, поэтому все отправки платформы идут из
+одного процесса: Telegram — из bot.py, VK (ответы и рассылка) — из
+vk_bot.py. Отправлять сообщения VK из другого процесса значит делить
+лимит сообщества на двоих без общей очереди.
+Для Telegram очередь подключается как rate limiter PTB.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TG_GLOBAL_RATE = float(os.getenv('TG_GLOBAL_RATE', 25))  # сообщений/с на бота
+TG_CHAT_RATE = float(os.getenv('TG_CHAT_RATE', 1))  # сообщений/с на чат
+TG_CHAT_BURST = float(os.getenv('TG_CHAT_BURST', 3))
+VK_GLOBAL_RATE = float(os.getenv('VK_GLOBAL_RATE', 18))  # запросов/с (лимит сообщества — 20)
+
+# Доля общего лимита, которую фоновые отправки не трогают
+INTERACTIVE_RESERVE = float(os.getenv('OUTBOUND_INTERACTIVE_RESERVE', 0.2))
+
+
+class Priority(IntEnum):
+    """Классы приоритета: меньше — важнее"""
+    INTERACTIVE = 0
+    REMINDER = 1
+    BROADCAST = 2
+
+
+_priority = contextvars.ContextVar('outbound_priority', default=Priority.INTERACTIVE)
+
+
+def current_priority() -> Priority:
+    """Приоритет отправок в текущем контексте"""
+    return _priority.get()
+
+
+@contextmanager
+def send_priority(priority: Priority):
+    """Отправки внутри блока получают указанный приоритет"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, need: float) -> float:
+        """Сколько секунд ждать, пока накопится need токенов"""
+        return max(0.0, (need - self.tokens) / self.rate)
+
+
+class OutboundQueue:
+    """Очередь разрешений на отправку с приоритетами и лимитами"""
+
+    def __init__(self, name: str, rate: float, chat_rate: float = None,
+                 chat_burst: float = 1, reserve: float = INTERACTIVE_RESERVE):
+        self.name = name
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._bucket = TokenBucket(rate, max(1.0, rate))
+        self._reserve = rate * reserve
+        self._chats = {}  # chat_id -> TokenBucket
+        self._waiters = []  # [priority, seq, chat_id, future]
+        self._seq = 0
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._task = None
+
+    async def acquire(self, priority: Priority = None, chat_id=None):
+        """Дождаться своей очереди на отправку"""
+        priority = current_priority() if priority is None else Priority(priority)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._seq += 1
+        self._waiters.append([priority, self._seq, chat_id, future])
+        self._ensure_dispatcher(loop)
+        self._wakeup.set()
+
+        started = time.monotonic()
+        await future
+        metrics.observe(f"{self.name}.queue_wait.{priority.name.lower()}", time.monotonic() - started)
+        metrics.inc(f"{self.name}.sent.{priority.name.lower()}")
+
+    async def run(self, func, *args, priority: Priority = None, chat_id=None, **kwargs):
+        """Выполнить запрос после получения разрешения"""
+        await self.acquire(priority, chat_id)
+        return await func(*args, **kwargs)
+
+    def pause(self, seconds: float):
+        """Остановить выдачу разрешений (например, после 429 / RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        """Длина очереди по приоритетам"""
+        pending = {p.name.lower(): 0 for p in Priority}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                pending[priority.name.lower()] += 1
+        return pending
+
+    def _ensure_dispatcher(self, loop):
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._dispatch())
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Полные ведра ничего не ограничивают — их можно забыть
+                for key in [k for k, b in self._chats.items()
+                            if b.tokens + (now - b.updated) * b.rate >= b.capacity]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        bucket.refill(now)
+        return bucket
+
+    def _next_ready(self, now: float):
+        """
+        Выбрать ожидающего, которому можно отправлять сейчас
+
+        Returns:
+            tuple: (waiter или None, через сколько секунд проверить снова)
+        """
+        self._waiters = [w for w in self._waiters if not w[3].done()]
+        self._waiters.sort(key=lambda w: (w[0], w[1]))
+        self._bucket.refill(now)
+
+        retry_in = None
+        for waiter in self._waiters:
+            priority, _, chat_id, _ = waiter
+            need = 1.0 if priority == Priority.INTERACTIVE else 1.0 + self._reserve
+            if self._bucket.tokens < need:
+                wait = self._bucket.wait_time(need)
+                retry_in = wait if retry_in is None else min(retry_in, wait)
+                # Менее важным тем более не хватит — дальше не смотрим
+                break
+            if chat_id is not None and self.chat_rate:
+                chat = self._chat_bucket(chat_id, now)
+                if chat.tokens < 1.0:
+                    wait = chat.wait_time(1.0)
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                chat.tokens -= 1.0
+            self._bucket.tokens -= 1.0
+            return waiter, 0.0
+        return None, retry_in
+
+    async def _dispatch(self):
+        """Фоновая задача: выдавать разрешения по приоритету"""
+        while True:
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            waiter, retry_in = self._next_ready(now)
+            if waiter is not None:
+                self._waiters.remove(waiter)
+                waiter[3].set_result(None)
+                metrics.set_gauge(f"{self.name}.queue_length", len(self._waiters))
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=retry_in)
+            except asyncio.TimeoutError:
+                pass
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """
+    Rate limiter PTB поверх OutboundQueue
+
+    Ограничиваются только запросы с chat_id (отправка и редактирование
+    сообщений); answerCallbackQuery и служебные методы идут сразу.
+    Приоритет берётся из rate_limit_args или из контекста (send_priority).
+    """
+
+    def __init__(self, queue: OutboundQueue, max_retries: int = 2):
+        self.queue = queue
+        self.max_retries = max_retries
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        priority = current_priority() if rate_limit_args is None else Priority(rate_limit_args)
+        for attempt in range(self.max_retries + 1):
+            await self.queue.acquire(priority, chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                metrics.inc(f"{self.queue.name}.retry_after")
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Telegram RetryAfter {e.retry_after}с ({endpoint}), пауза очереди")
+                self.queue.pause(float(e.retry_after))
+
+
+# Очереди исходящих сообщений процесса
+telegram_outbound = OutboundQueue('telegram', TG_GLOBAL_RATE, chat_rate=TG_CHAT_RATE, chat_burst=TG_CHAT_BURST)
+vk_outbound = OutboundQueue('vk', VK_GLOBAL_RATE)
@@ -1,6 +1,7 @@
 """
 Утилиты для работы с practices.json
 """
+import hashlib
 import json
 import os
 import logging
@@ -17,13 +18,18 @@ class PracticesManager:
     def __init__(self, practices_file: str = PRACTICES_FILE):
         self.practices_file = practices_file
         self.data = None
+        self.version = 0  # Растёт при каждой загрузке — ключ для кэшей отрисовки
+        self.content_tag = ''  # Короткий хэш содержимого — одинаков во всех процессах
         self.load_practices()
 
     def load_practices(self):
         """Загрузить practices.json"""
         try:
-            with open(self.practices_file, 'r', encoding='utf-8') as f:
-                self.data = json.load(f)
+            with open(self.practices_file, 'rb') as f:
+                raw = f.read()
+            self.data = json.loads(raw.decode('utf-8'))
+            self.content_tag = hashlib.blake2b(raw, digest_size=3).hexdigest()
+            self.version += 1
             logger.info(f"Практики загружены из {self.practices_file}")
         except FileNotFoundError:
             logger.error(f"Файл {self.practices_file} не найден!")
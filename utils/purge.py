@@ -0,0 +1,241 @@
+"""
+Удаление пользователей пачками: GDPR-запросы и чистка давно неактивных
+
+Работает для обеих платформ. Пользователи обрабатываются группами по
+PURGE_USER_BATCH, а их история — пачками по PURGE_BATCH_SIZE строк;
+каждая пачка — своя короткая транзакция, между пачками пауза. Строки
+users удаляются последними и небольшими группами, поэтому проход
+планировщика напоминаний не ждёт блокировок.
+
+Что удаляется вместе с пользователем:
+- user_progress (по user_id, а старые строки без user_id — по ID на
+  платформе, если этот ID не принадлежит другому пользователю);
+- user_stats, session_state;
+- scheduled_reminders (ключ — telegram_id, у VK их нет);
+- архивная история (archive/user_progress_*.jsonl.gz, см. utils.archive):
+  затронутые помесячные файлы переписываются без строк пользователей.
+
+Глобальные счётчики progress_counters обезличены и не уменьшаются.
+
+Бот во время чистки можно не останавливать: отложенная запись
+session_state пропускает пользователей без строки users, так что
+состояние удалённого пользователя из памяти бота в БД не вернётся.
+
+Резервные копии (utils.backup) не переписываются: данные удалённого
+пользователя остаются в копиях, пока те не уйдут из ротации — до
+BACKUP_KEEP ежедневных копий, то есть до BACKUP_KEEP дней. После
+восстановления из копии чистку нужно повторить.
+
+Запуск из консоли:
+    python -m utils.purge --user vk:12345
+    python -m utils.purge --inactive-days 180 --dry-run
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select
+
+from models import SessionLocal, ScheduledReminder, SessionState, User, UserProgress, UserStats
+from utils.archive import ARCHIVE_DIR, forget_users
+from utils.metrics import metrics
+from utils.session_state import session_state
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 1000))  # строк истории за транзакцию
+PURGE_USER_BATCH = int(os.getenv('PURGE_USER_BATCH', 100))  # пользователей за группу
+PURGE_PAUSE = float(os.getenv('PURGE_PAUSE', 0.1))  # секунды между транзакциями
+PURGE_INACTIVE_DAYS = int(os.getenv('PURGE_INACTIVE_DAYS', 180))
+
+PLATFORM_COLUMNS = {'telegram': User.telegram_id, 'vk': User.vk_id}
+
+
+def _delete_in_batches(db, table, condition, batch_size: int, pause: float) -> int:
+    """Удалять строки по условию пачками по id, каждая пачка — отдельная транзакция"""
+    deleted = 0
+    while True:
+        ids = db.scalars(select(table.c.id).where(condition).order_by(table.c.id).limit(batch_size)).all()
+        if not ids:
+            return deleted
+        db.execute(delete(table).where(table.c.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+def _unambiguous_ids(db, platform_ids: set, purged_user_ids) -> set:
+    """ID на платформе, которые не встречаются у оставшихся пользователей (для строк без user_id)"""
+    if not platform_ids:
+        return set()
+    taken = db.execute(
+        select(User.telegram_id, User.vk_id).where(
+            User.id.notin_(purged_user_ids),
+            or_(User.telegram_id.in_(platform_ids), User.vk_id.in_(platform_ids))
+        )
+    ).all()
+    return platform_ids - {value for row in taken for value in row}
+
+
+def _purge_group(db, users: list, batch_size: int, pause: float, archive_dir: str) -> dict:
+    """Удалить данные группы пользователей; users — строки (id, platform, telegram_id, vk_id)"""
+    counts = {'progress': 0, 'reminders': 0, 'users': 0}
+    user_ids = [user.id for user in users]
+    platform_ids = {
+        'telegram': {user.telegram_id for user in users if user.platform == 'telegram'},
+        'vk': {user.vk_id for user in users if user.platform == 'vk'},
+    }
+    progress = UserProgress.__table__
+
+    counts['progress'] += _delete_in_batches(db, progress, progress.c.user_id.in_(user_ids), batch_size, pause)
+    legacy_ids = _unambiguous_ids(db, platform_ids['telegram'] | platform_ids['vk'], user_ids)
+    if legacy_ids:
+        counts['progress'] += _delete_in_batches(
+            db, progress, progress.c.user_id.is_(None) & progress.c.user_telegram_id.in_(legacy_ids),
+            batch_size, pause
+        )
+    if platform_ids['telegram']:
+        reminders = ScheduledReminder.__table__
+        counts['reminders'] += _delete_in_batches(
+            db, reminders, reminders.c.user_telegram_id.in_(platform_ids['telegram']), batch_size, pause
+        )
+
+    db.execute(delete(UserStats).where(UserStats.user_id.in_(user_ids)))
+    for platform, ids in platform_ids.items():
+        if ids:
+            db.execute(delete(SessionState).where(SessionState.platform == platform, SessionState.user_id.in_(ids)))
+    counts['users'] = db.execute(delete(User).where(User.id.in_(user_ids))).rowcount
+    db.commit()
+
+    # В архив попадают только строки с user_id, поэтому ID на платформе не нужны
+    counts['progress'] += forget_users(user_ids, archive_dir)
+
+    # Убрать и из памяти процесса, иначе отложенная запись вернёт строку состояния
+    for platform, ids in platform_ids.items():
+        for platform_id in ids:
+            session_state.forget(platform, platform_id)
+    return counts
+
+
+def purge_users(db, where, batch_size: int = PURGE_BATCH_SIZE, user_batch: int = PURGE_USER_BATCH,
+                pause: float = PURGE_PAUSE, progress=None, archive_dir: str = ARCHIVE_DIR) -> dict:
+    """
+    Удалить всех пользователей, подходящих под условие
+
+    Условие перепроверяется для каждой группы, так что пользователь,
+    вернувшийся во время чистки, не удаляется.
+
+    Args:
+        db: Сессия БД
+        where: Список условий на User
+        progress: callback(totals) после каждой группы
+        archive_dir: Каталог архива истории (строки удаляются и оттуда)
+
+    Returns:
+        dict: {'users', 'progress', 'reminders'} — сколько строк удалено
+            (progress — вместе с архивными)
+    """
+    totals = {'users': 0, 'progress': 0, 'reminders': 0}
+    after_id = 0
+    while True:
+        users = db.execute(
+            select(User.id, User.platform, User.telegram_id, User.vk_id)
+            .where(User.id > after_id, *where)
+            .order_by(User.id)
+            .limit(user_batch)
+        ).all()
+        db.commit()
+        if not users:
+            break
+        after_id = users[-1].id
+
+        for key, count in _purge_group(db, users, batch_size, pause, archive_dir).items():
+            totals[key] += count
+        metrics.inc('purge.users', len(users))
+        logger.info(
+            f"Удалено пользователей: {totals['users']} (истории {totals['progress']}, "
+            f"напоминаний {totals['reminders']})"
+        )
+        if progress is not None:
+            progress(dict(totals))
+        if len(users) < user_batch:
+            break
+        time.sleep(pause)
+    return totals
+
+
+def purge_user(db, platform: str, platform_id: int, **kwargs) -> dict:
+    """Удалить одного пользователя по ID на платформе ('telegram' или 'vk')"""
+    totals = purge_users(db, [PLATFORM_COLUMNS[platform] == platform_id], **kwargs)
+
+    if totals['users']:
+        return totals
+
+    # Данные без строки users (пользователь уже удалён или не создавался)
+    batch_size, pause = kwargs.get('batch_size', PURGE_BATCH_SIZE), kwargs.get('pause', PURGE_PAUSE)
+    progress = UserProgress.__table__
+    if _unambiguous_ids(db, {platform_id}, []):
+        totals['progress'] += _delete_in_batches(
+            db, progress, progress.c.user_id.is_(None) & (progress.c.user_telegram_id == platform_id),
+            batch_size, pause
+        )
+    if platform == 'telegram':
+        reminders = ScheduledReminder.__table__
+        totals['reminders'] += _delete_in_batches(
+            db, reminders, reminders.c.user_telegram_id == platform_id, batch_size, pause
+        )
+    db.execute(delete(SessionState).where(SessionState.platform == platform, SessionState.user_id == platform_id))
+    db.commit()
+    session_state.forget(platform, platform_id)
+    return totals
+
+
+def inactive_condition(days: int = PURGE_INACTIVE_DAYS, deactivated_only: bool = False, now: datetime = None) -> list:
+    """Условие «неактивен больше days дней» (по последнему взаимодействию)"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    where = [User.last_interaction < cutoff]
+    if deactivated_only:
+        where.append(User.is_active == False)
+    return where
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Удаление пользователей и их данных пачками")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--user', help="Один пользователь: telegram:<id> или vk:<id>")
+    target.add_argument('--inactive-days', type=int, help="Все, кто не заходил больше N дней")
+    parser.add_argument('--deactivated-only', action='store_true', help="Только недоступные (is_active = false)")
+    parser.add_argument('--dry-run', action='store_true', help="Только посчитать, ничего не удалять")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.user:
+            platform, _, platform_id = args.user.partition(':')
+            if platform not in PLATFORM_COLUMNS or not platform_id.isdigit():
+                parser.error("--user: ожидается telegram:<id> или vk:<id>")
+            where = [PLATFORM_COLUMNS[platform] == int(platform_id)]
+        else:
+            where = inactive_condition(args.inactive_days, args.deactivated_only)
+
+        if args.dry_run:
+            count = db.query(User).filter(*where).count()
+            print(f"Будет удалено пользователей: {count}")
+            return
+
+        if args.user:
+            totals = purge_user(db, platform, int(platform_id))
+        else:
+            totals = purge_users(db, where)
+        print(f"✅ Удалено: пользователей {totals['users']}, истории {totals['progress']}, напоминаний {totals['reminders']}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
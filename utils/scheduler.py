@@ -2,47 +2,192 @@
 Утилиты для работы с планировщиком (APScheduler)
 Автоматическая отправка практик пользователям
 """
+import contextvars
 import logging
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from models import SessionLocal, User
+from telegram.error import Forbidden
+from sqlalchemy.orm import load_only
+from models import SessionLocal, User, REMINDER_SWEEP_COLUMNS
+from utils.archive import ARCHIVE_HOUR, scheduled_archive
+from utils.backup import BACKUP_HOUR, scheduled_backup
+from utils.db import update_user_cas
 from utils.practices import practices_manager
 import pytz
 
-import os
-
 logger = logging.getLogger(__name__)
 
 # Глобальный планировщик
 scheduler = AsyncIOScheduler()
 
-# VK API (lazy init)
-VK_BOT_TOKEN = os.getenv('VK_BOT_TOKEN')
-_vk_api = None
+# Батч execute, активный на время рассылки (None — отправка сразу).
+# ContextVar, а не глобальная переменная: в батч попадают только отправки
+# из задачи рассылки, а не параллельные (например, админские команды)
+_vk_batch = contextvars.ContextVar('vk_reminder_batch', default=None)
+
+# Недоступные получатели за время рассылки: (platform, id) -> причина
+# (None — деактивировать сразу)
+_blocked = contextvars.ContextVar('reminder_blocked', default=None)
+
+# Изменения состояния VK-пользователей, ждущие доставки напоминания из батча:
+# vk_id -> (user, [action(db, user)]) (None — применять сразу)
+_after_delivery = contextvars.ContextVar('reminder_after_delivery', default=None)
+
+# Коды ошибок VK, после которых писать пользователю бессмысленно:
+# 18 — страница удалена/заблокирована, 900 — бот в чёрном списке,
+# 901 — нет разрешения на сообщения, 902 — запрещено настройками приватности
+VK_UNREACHABLE_CODES = {18: 'vk_deleted', 900: 'vk_blacklist', 901: 'vk_901', 902: 'vk_privacy'}
 
 
 def _get_vk_api():
-    """Получить VK API инстанс (lazy init, синглтон)"""
-    global _vk_api
-    if _vk_api is None and VK_BOT_TOKEN:
-        from vkbottle import API
-        _vk_api = API(token=VK_BOT_TOKEN)
-    return _vk_api
+    """Получить VK API инстанс (общий для процесса, см. utils.vk_client)"""
+    from utils.vk_client import get_vk_api
+    return get_vk_api()
+
+
+def _report_unreachable(platform: str, platform_id: int, reason: str):
+    """Запомнить получателя, до которого отправка больше не доходит"""
+    blocked = _blocked.get()
+    if blocked is not None:
+        blocked[(platform, platform_id)] = reason
+        return
+    _deactivate_unreachable({(platform, platform_id): reason})
+
+
+def _deactivate_unreachable(blocked: dict):
+    """Пометить недоступных получателей неактивными (по UPDATE на платформу и причину)"""
+    from utils.db import mark_users_inactive
+    groups = {}
+    for (platform, platform_id), reason in blocked.items():
+        groups.setdefault((platform, reason), []).append(platform_id)
+
+    db = SessionLocal()
+    try:
+        for (platform, reason), ids in groups.items():
+            mark_users_inactive(db, platform, ids, reason)
+    except Exception as e:
+        logger.error(f"Ошибка деактивации недоступных пользователей: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _set_user_fields(db, user, **fields):
+    """Записать поля пользователя с проверкой версии (при конфликте — перечитать и повторить)"""
+    def mutate(user):
+        for name, value in fields.items():
+            setattr(user, name, value)
+
+    update_user_cas(db, user, mutate)
 
 
-async def _send_vk_message(vk_id: int, text: str, keyboard_json: str = None):
-    """Отправить сообщение VK-пользователю через standalone API"""
+def _on_delivery(db, user, action):
+    """
+    Выполнить action(db, user), когда напоминание пользователю доставлено
+
+    В батче рассылки VK сообщение уходит только в конце прохода, поэтому
+    отметки «отправлено» (last_reminder_sent, сброс даты напоминания)
+    откладываются до ответа execute. Если доставка не подтверждена
+    (ошибка или DELIVERY_UNKNOWN), состояние не меняется и напоминание
+    уйдёт в следующий подходящий проход.
+    """
+    pending = _after_delivery.get()
+    if pending is not None and user.platform == 'vk':
+        pending.setdefault(user.vk_id, (user, []))[1].append(action)
+        return
+    action(db, user)
+
+
+def _set_after_delivery(db, user, **fields):
+    """Записать поля пользователя после доставки напоминания (см. _on_delivery)"""
+    _on_delivery(db, user, lambda db, user: _set_user_fields(db, user, **fields))
+
+
+def _apply_delivered(db, pending: dict, delivered: set):
+    """Применить отложенные изменения тех, кому батч доставил напоминание"""
+    skipped = 0
+    for vk_id, (user, actions) in pending.items():
+        if vk_id not in delivered:
+            skipped += 1
+            continue
+        try:
+            for action in actions:
+                action(db, user)
+        except Exception as e:
+            logger.error(f"[VK] Не удалось отметить напоминание vk:{vk_id}: {e}")
+            db.rollback()
+    if skipped:
+        logger.info(f"[VK] Доставка не подтверждена для {skipped} пользователей — состояние не изменено")
+
+
+def _start_daily_practices(db, user) -> bool:
+    """Перевести ожидающего пользователя на первый день практик (если он ещё ждёт)"""
+    def mutate(user):
+        if user.daily_practice_day != 0:
+            return False
+        user.daily_practice_day = 1
+
+    return update_user_cas(db, user, mutate)
+
+
+async def _send_telegram_message(bot: Bot, **kwargs):
+    """Отправить сообщение Telegram; заблокировавших бота — деактивировать"""
+    try:
+        return await bot.send_message(**kwargs)
+    except Forbidden:
+        _report_unreachable('telegram', kwargs['chat_id'], 'blocked')
+        raise
+
+
+async def _send_vk_message(user, reminder_type: str, text: str, keyboard_json: str = None):
+    """
+    Отправить напоминание VK-пользователю через standalone API
+
+    random_id выводится из (пользователь, тип напоминания, локальная дата),
+    поэтому повторная отправка того же напоминания в тот же день не создаст дубль.
+    """
     from utils.formatting import markdown_to_plain
+    from utils.vk_client import reminder_random_id, send_message
     vk_api = _get_vk_api()
     if not vk_api:
-        logger.warning(f"[VK] API не настроен, пропуск vk:{vk_id}")
+        logger.warning(f"[VK] API не настроен, пропуск vk:{user.vk_id}")
+        return
+    random_id = reminder_random_id(user, reminder_type)
+    text = markdown_to_plain(text)
+    batch = _vk_batch.get()
+    if batch is not None:
+        kwargs = {"peer_id": user.vk_id, "message": text, "random_id": random_id}
+        if keyboard_json:
+            kwargs["keyboard"] = keyboard_json
+        await batch.add(kwargs)
         return
-    kwargs = {"peer_id": vk_id, "message": markdown_to_plain(text), "random_id": 0}
-    if keyboard_json:
-        kwargs["keyboard"] = keyboard_json
-    await vk_api.messages.send(**kwargs)
+    try:
+        await send_message(vk_api, user.vk_id, text, keyboard_json, random_id=random_id)
+    except Exception as e:
+        code = getattr(e, 'code', None)
+        if code in VK_UNREACHABLE_CODES:
+            _report_unreachable('vk', user.vk_id, VK_UNREACHABLE_CODES[code])
+        raise
+
+
+async def _flush_vk_batch(batch):
+    """Отправить накопленные VK-сообщения батча"""
+    if batch is None:
+        return
+    try:
+        await batch.flush()
+    except Exception as e:
+        logger.error(f"[VK] Ошибка отправки батча напоминаний: {e}")
+    for peer, code in batch.errors.items():
+        if code in VK_UNREACHABLE_CODES:
+            _report_unreachable('vk', peer, VK_UNREACHABLE_CODES[code])
+    if batch.sent or batch.failed or batch.unknown:
+        logger.info(
+            f"[VK] Батч напоминаний: доставлено {batch.sent}, ошибок {batch.failed}, "
+            f"неизвестно {batch.unknown}, HTTP-запросов {batch.requests}"
+        )
 
 
 def init_scheduler():
@@ -293,7 +438,8 @@ async def send_practice_reminder(bot: Bot, user_id: int):
                     [InlineKeyboardButton("🎉 Приступить к финалу", callback_data="start_stage6_finale")]
                 ])
 
-            await bot.send_message(
+            await _send_telegram_message(
+                bot,
                 chat_id=user_id,
                 text=message,
                 parse_mode='Markdown',
@@ -338,9 +484,7 @@ async def send_stage4_reminder(bot: Bot, user, db):
         update_user_progress(db, user.telegram_id, stage_id=4, step_id=12, day=user.current_day)
 
         # Сбросить daily_practice_day и substep, так как переходим к новому этапу
-        user.daily_practice_day = 0
-        user.daily_practice_substep = ""
-        db.commit()
+        _set_user_fields(db, user, daily_practice_day=0, daily_practice_substep="")
 
         logger.info(f"Пользователь {user.telegram_id} переведен на Stage 4, Step 12")
 
@@ -365,7 +509,8 @@ async def send_stage4_reminder(bot: Bot, user, db):
         keyboard = InlineKeyboardMarkup(keyboard_buttons)
 
         # Отправить напоминание
-        await bot.send_message(
+        await _send_telegram_message(
+            bot,
             chat_id=user.telegram_id,
             text=message,
             parse_mode='Markdown',
@@ -432,7 +577,8 @@ async def send_stage2_sprouts_reminder(bot: Bot, user, db, day: int):
         ])
 
     try:
-        await bot.send_message(
+        await _send_telegram_message(
+            bot,
             chat_id=user.telegram_id,
             text=message,
             parse_mode='Markdown',
@@ -480,7 +626,8 @@ async def send_stage6_reminder(bot: Bot, user, db):
     ])
 
     try:
-        await bot.send_message(
+        await _send_telegram_message(
+            bot,
             chat_id=user.telegram_id,
             text=message,
             reply_markup=keyboard,
@@ -488,8 +635,7 @@ async def send_stage6_reminder(bot: Bot, user, db):
         )
 
         # Очистить stage6_reminder_date после отправки
-        user.stage6_reminder_date = None
-        db.commit()
+        _set_user_fields(db, user, stage6_reminder_date=None)
 
         logger.info(f"Отправлено напоминание Stage 6 (финал) пользователю {user.telegram_id}")
 
@@ -551,7 +697,8 @@ async def send_daily_practice_reminder(bot: Bot, user, db):
         keyboard = InlineKeyboardMarkup(keyboard_buttons) if keyboard_buttons else None
 
         # Отправить короткое напоминание
-        await bot.send_message(
+        await _send_telegram_message(
+            bot,
             chat_id=user.telegram_id,
             text=message,
             parse_mode='Markdown',
@@ -608,7 +755,8 @@ async def send_stage5_daily_reminder(bot: Bot, user, db):
         ])
 
         # Отправить напоминание
-        await bot.send_message(
+        await _send_telegram_message(
+            bot,
             chat_id=user.telegram_id,
             text=message,
             parse_mode='Markdown',
@@ -661,7 +809,7 @@ async def send_stage2_sprouts_reminder_vk(user, db, day: int):
             ("🍄 Плесень / проблема", "mold_start"),
         ], cols=2)
     try:
-        await _send_vk_message(user.vk_id, message, keyboard)
+        await _send_vk_message(user, f'sprouts_day{day}', message, keyboard)
         logger.info(f"[VK] Отправлено напоминание о всходах (день {day}) vk:{user.vk_id}")
     except Exception as e:
         logger.error(f"[VK] Ошибка напоминания о всходах vk:{user.vk_id}: {e}")
@@ -688,7 +836,7 @@ async def send_daily_practice_reminder_vk(user, db):
         buttons = [(b['text'], b['action']) for b in buttons_data if b.get('text') and b.get('action')]
         buttons.append(("🍄 Плесень / проблема", "mold_sprouts_start"))
         keyboard = create_vk_callback_keyboard(buttons)
-        await _send_vk_message(user.vk_id, message, keyboard)
+        await _send_vk_message(user, f'stage3_day{current_day}', message, keyboard)
         logger.info(f"[VK] Отправлено напоминание Stage 3 (день {current_day}) vk:{user.vk_id}")
     except Exception as e:
         logger.error(f"[VK] Ошибка напоминания Stage 3 vk:{user.vk_id}: {e}")
@@ -707,10 +855,9 @@ async def send_stage4_reminder_vk(user, db):
             return
         first_step = steps[0]
 
-        update_user_progress_obj(db, user, stage_id=4, step_id=12, day=user.current_day)
-        user.daily_practice_day = 0
-        user.daily_practice_substep = ""
-        db.commit()
+        def start_stage4(db, user):
+            update_user_progress_obj(db, user, stage_id=4, step_id=12, day=user.current_day)
+            _set_user_fields(db, user, daily_practice_day=0, daily_practice_substep="")
 
         message = (
             "🌱 Пора собирать первый урожай!\n\n"
@@ -725,7 +872,8 @@ async def send_stage4_reminder_vk(user, db):
             buttons = [("Начать практику", "next_step")]
         buttons.append(("🍄 Плесень / проблема", "mold_sprouts_start"))
         keyboard = create_vk_callback_keyboard(buttons)
-        await _send_vk_message(user.vk_id, message, keyboard)
+        await _send_vk_message(user, 'stage4', message, keyboard)
+        _on_delivery(db, user, start_stage4)
         logger.info(f"[VK] Отправлено напоминание Stage 4 vk:{user.vk_id}")
     except Exception as e:
         logger.error(f"[VK] Ошибка напоминания Stage 4 vk:{user.vk_id}: {e}")
@@ -755,7 +903,7 @@ async def send_stage5_daily_reminder_vk(user, db):
             ("Напомнить позже", "postpone_reminder"),
             ("🍄 Плесень / проблема", "mold_sprouts_start"),
         ])
-        await _send_vk_message(user.vk_id, message, keyboard)
+        await _send_vk_message(user, f'stage5_day{current_day}', message, keyboard)
         logger.info(f"[VK] Отправлено напоминание Stage 5 (день {current_day}) vk:{user.vk_id}")
     except Exception as e:
         logger.error(f"[VK] Ошибка напоминания Stage 5 vk:{user.vk_id}: {e}")
@@ -781,20 +929,45 @@ async def send_stage6_reminder_vk(user, db):
         keyboard = create_vk_callback_keyboard([
             ("Приступить к финалу", "start_stage6_finale"),
         ])
-        await _send_vk_message(user.vk_id, message, keyboard)
-        user.stage6_reminder_date = None
-        db.commit()
+        await _send_vk_message(user, 'stage6', message, keyboard)
+        _set_after_delivery(db, user, stage6_reminder_date=None)
         logger.info(f"[VK] Отправлено напоминание Stage 6 vk:{user.vk_id}")
     except Exception as e:
         logger.error(f"[VK] Ошибка напоминания Stage 6 vk:{user.vk_id}: {e}")
 
 
-async def check_and_send_reminders(bot: Bot):
+async def check_and_send_reminders(bot: Bot = None, platforms: tuple = ('telegram', 'vk')):
     """
     Проверить всех пользователей и отправить напоминания тем, кому нужно
     Эта функция вызывается планировщиком каждый час
+
+    Отправки рассылки идут с приоритетом REMINDER и уступают ответам
+    на нажатия кнопок в очереди исходящих сообщений.
+
+    Args:
+        bot: Telegram Bot (не нужен, если в platforms нет 'telegram')
+        platforms: Платформы пользователей, которым слать напоминания
     """
+    from utils.outbound import Priority, send_priority
+    with send_priority(Priority.REMINDER):
+        await _check_and_send_reminders(bot, platforms)
+
+
+async def _check_and_send_reminders(bot: Bot, platforms: tuple):
+    """Проход по пользователям для check_and_send_reminders"""
     from datetime import date as date_class
+    from utils.vk_delivery import VKExecuteBatch
+
+    # VK-напоминания копятся в батч и уходят через execute
+    vk_api = _get_vk_api() if 'vk' in platforms else None
+    batch = VKExecuteBatch(vk_api) if vk_api else None
+    batch_token = _vk_batch.set(batch)
+    # Недоступные получатели деактивируются пачкой в конце рассылки
+    blocked = {}
+    blocked_token = _blocked.set(blocked)
+    # Отметки об отправке VK-напоминаний — после подтверждения доставки батчем
+    pending = {} if batch is not None else None
+    pending_token = _after_delivery.set(pending)
 
     db = SessionLocal()
     try:
@@ -802,10 +975,15 @@ async def check_and_send_reminders(bot: Bot):
         now_utc = datetime.utcnow()
 
         # Найти всех активных пользователей, которые начали практики
-        users = db.query(User).filter(
+        # (только нужные проходу колонки; условие совпадает с частичным ix_users_reminder_sweep,
+        # который отбирает строки, но не покрывает их)
+        users = db.query(User).options(
+            load_only(*(getattr(User, name) for name in REMINDER_SWEEP_COLUMNS))
+        ).filter(
             User.is_active == True,
             User.is_paused == False,
-            User.started_at.isnot(None)
+            User.started_at.isnot(None),
+            User.platform.in_(platforms)
         ).all()
 
         logger.info(f"Проверка напоминаний для {len(users)} пользователей")
@@ -847,8 +1025,7 @@ async def check_and_send_reminders(bot: Bot):
                                     await send_stage2_sprouts_reminder(bot, user, db, day=days_since_start)
 
                                 # Обновить время последнего напоминания
-                                user.last_reminder_sent = now_utc
-                                db.commit()
+                                _set_after_delivery(db, user, last_reminder_sent=now_utc)
 
                                 logger.info(f"Отправлено напоминание о всходах (день {days_since_start}) пользователю {user.platform_id}")
                                 continue
@@ -864,8 +1041,9 @@ async def check_and_send_reminders(bot: Bot):
                                     continue
 
                             # Пользователь в режиме ожидания, нужно начать первую практику
-                            user.daily_practice_day = 1
-                            db.commit()
+                            # (если обработчик успел сдвинуть состояние — ничего не делать)
+                            if not _start_daily_practices(db, user):
+                                continue
 
                             # Отправить первую ежедневную практику
                             if user.platform == 'vk':
@@ -874,8 +1052,7 @@ async def check_and_send_reminders(bot: Bot):
                                 await send_daily_practice_reminder(bot, user, db)
 
                             # Обновить время последнего напоминания
-                            user.last_reminder_sent = now_utc
-                            db.commit()
+                            _set_after_delivery(db, user, last_reminder_sent=now_utc)
                             continue
 
                         if user.current_stage == 3 and user.daily_practice_day >= 1:
@@ -907,28 +1084,24 @@ async def check_and_send_reminders(bot: Bot):
                                 await send_daily_practice_reminder(bot, user, db)
 
                             # Обновить время последнего напоминания
-                            user.last_reminder_sent = now_utc
-                            db.commit()
+                            _set_after_delivery(db, user, last_reminder_sent=now_utc)
                             continue
 
                         # СПЕЦИАЛЬНАЯ ЛОГИКА ДЛЯ НАПОМИНАНИЯ О STAGE 4 (практика "Якорь")
                         if user.stage4_reminder_date:
                             today_str = now_user_tz.date().strftime('%Y-%m-%d')
 
-                            # Если сегодня день напоминания о Stage 4
-                            if user.stage4_reminder_date == today_str:
+                            # Если сегодня день напоминания о Stage 4 (или оно прошло, но не
+                            # было доставлено — дата сбрасывается только после доставки)
+                            if user.stage4_reminder_date <= today_str:
                                 # Отправить напоминание о Stage 4
                                 if user.platform == 'vk':
                                     await send_stage4_reminder_vk(user, db)
                                 else:
                                     await send_stage4_reminder(bot, user, db)
 
-                                # Сбросить флаг напоминания
-                                user.stage4_reminder_date = None
-
-                                # Обновить время последнего напоминания
-                                user.last_reminder_sent = now_utc
-                                db.commit()
+                                # Сбросить флаг напоминания и обновить время последнего напоминания
+                                _set_after_delivery(db, user, stage4_reminder_date=None, last_reminder_sent=now_utc)
 
                                 logger.info(f"Отправлено напоминание о Stage 4 пользователю {user.platform_id}")
                                 continue
@@ -937,8 +1110,8 @@ async def check_and_send_reminders(bot: Bot):
                         if user.stage6_reminder_date:
                             today_str = now_user_tz.date().strftime('%Y-%m-%d')
 
-                            # Если сегодня день напоминания о Stage 6
-                            if user.stage6_reminder_date == today_str:
+                            # Если сегодня день напоминания о Stage 6 (или недоставленное прошедшее)
+                            if user.stage6_reminder_date <= today_str:
                                 # Отправить напоминание о Stage 6
                                 if user.platform == 'vk':
                                     await send_stage6_reminder_vk(user, db)
@@ -946,8 +1119,7 @@ async def check_and_send_reminders(bot: Bot):
                                     await send_stage6_reminder(bot, user, db)
 
                                 # Обновить время последнего напоминания
-                                user.last_reminder_sent = now_utc
-                                db.commit()
+                                _set_after_delivery(db, user, last_reminder_sent=now_utc)
 
                                 logger.info(f"Отправлено напоминание о Stage 6 пользователю {user.platform_id}")
                                 continue
@@ -955,8 +1127,9 @@ async def check_and_send_reminders(bot: Bot):
                         # СПЕЦИАЛЬНАЯ ЛОГИКА ДЛЯ ЕЖЕДНЕВНЫХ ПРАКТИК STAGE 5 (До беби-лифа)
                         if user.current_stage == 5 and user.daily_practice_day == 0:
                             # Пользователь в режиме ожидания, нужно начать первую практику
-                            user.daily_practice_day = 1
-                            db.commit()
+                            # (если обработчик успел сдвинуть состояние — ничего не делать)
+                            if not _start_daily_practices(db, user):
+                                continue
 
                             # Отправить первую практику Stage 5
                             if user.platform == 'vk':
@@ -965,8 +1138,7 @@ async def check_and_send_reminders(bot: Bot):
                                 await send_stage5_daily_reminder(bot, user, db)
 
                             # Обновить время последнего напоминания
-                            user.last_reminder_sent = now_utc
-                            db.commit()
+                            _set_after_delivery(db, user, last_reminder_sent=now_utc)
                             continue
 
                         if user.current_stage == 5 and user.daily_practice_day >= 1:
@@ -998,8 +1170,7 @@ async def check_and_send_reminders(bot: Bot):
                                 await send_stage5_daily_reminder(bot, user, db)
 
                             # Обновить время последнего напоминания
-                            user.last_reminder_sent = now_utc
-                            db.commit()
+                            _set_after_delivery(db, user, last_reminder_sent=now_utc)
                             continue
 
                         # Проверить, не отправляли ли уже сегодня (для обычных напоминаний)
@@ -1023,37 +1194,81 @@ async def check_and_send_reminders(bot: Bot):
                                 await send_practice_reminder(bot, user.telegram_id)
 
                             # Обновить время последнего напоминания
-                            user.last_reminder_sent = now_utc
-                            db.commit()
+                            _set_after_delivery(db, user, last_reminder_sent=now_utc)
                         else:
                             logger.debug(f"Триггер не сработал для пользователя {user.platform_id} (день {days}, этап {user.current_stage})")
 
             except Exception as e:
                 logger.error(f"Ошибка при обработке пользователя {user.platform_id}: {e}")
+                # Сессия не должна остаться в состоянии неудачного flush для следующих пользователей
+                db.rollback()
                 continue
 
     except Exception as e:
         logger.error(f"Ошибка в check_and_send_reminders: {e}")
     finally:
+        _vk_batch.reset(batch_token)
+        await _flush_vk_batch(batch)
+        _after_delivery.reset(pending_token)
+        if pending:
+            _apply_delivered(db, pending, batch.delivered)
+        _blocked.reset(blocked_token)
+        if blocked:
+            _deactivate_unreachable(blocked)
         db.close()
 
 
-def schedule_user_reminders(bot: Bot):
+def schedule_user_reminders(bot: Bot = None, platforms: tuple = ('telegram',)):
     """
     Настроить планировщик для проверки напоминаний каждый час
 
+    Каждая платформа рассылается из процесса своего бота: Telegram — из
+    bot.py, VK — из vk_bot.py. Так напоминания VK делят с ответами
+    пользователям одну очередь vk_outbound: один лимит сообщества
+    (VK_GLOBAL_RATE) и приоритет ответов над рассылкой.
+
     Args:
-        bot: Telegram Bot instance
+        bot: Telegram Bot instance (для рассылки Telegram)
+        platforms: Платформы, которые рассылает этот процесс
     """
     # Запускать проверку каждый час (в начале часа)
     scheduler.add_job(
         check_and_send_reminders,
         CronTrigger(minute=0),  # Каждый час в 00 минут
-        args=[bot],
+        args=[bot, tuple(platforms)],
         id='check_reminders',
         replace_existing=True
     )
-    logger.info("✅ Планировщик настроен: проверка каждый час в 00 минут")
+    logger.info(f"✅ Планировщик настроен: проверка каждый час в 00 минут ({', '.join(platforms)})")
+
+
+def schedule_backups():
+    """Настроить ежедневную резервную копию БД (BACKUP_HOUR, пусто — выключено)"""
+    if not BACKUP_HOUR:
+        logger.info("Плановые копии БД выключены (BACKUP_HOUR пуст)")
+        return
+    # В середине часа, чтобы копия не совпадала с проходом напоминаний
+    scheduler.add_job(
+        scheduled_backup,
+        CronTrigger(hour=int(BACKUP_HOUR), minute=30),
+        id='db_backup',
+        replace_existing=True
+    )
+    logger.info(f"✅ Планировщик настроен: копия БД каждый день в {int(BACKUP_HOUR):02d}:30")
+
+
+def schedule_archival():
+    """Настроить ежедневную архивацию старой истории (ARCHIVE_HOUR, пусто — выключено)"""
+    if not ARCHIVE_HOUR:
+        logger.info("Архивация истории выключена (ARCHIVE_HOUR пуст)")
+        return
+    scheduler.add_job(
+        scheduled_archive,
+        CronTrigger(hour=int(ARCHIVE_HOUR), minute=30),
+        id='progress_archive',
+        replace_existing=True
+    )
+    logger.info(f"✅ Планировщик настроен: архивация истории каждый день в {int(ARCHIVE_HOUR):02d}:30")
 
 
 def schedule_daily_stage5_practices(bot: Bot):
@@ -0,0 +1,287 @@
+"""
+Хранилище состояния диалога для обоих ботов
+
+Небольшие поля состояния (открытые пункты аккордеонов и т.п.) хранятся
+по ключу (platform, user_id) в двух уровнях:
+- в памяти процесса: LRU с TTL и ограничением числа записей;
+- в таблице session_state (по желанию): промахи памяти читаются из БД,
+  а изменения копятся и записываются пачкой раз в несколько секунд,
+  поэтому серия нажатий превращается в одну запись.
+
+С БД источником правды считается таблица: запись в памяти живёт
+SESSION_STATE_MEMORY_TTL секунд и затем перечитывается, так что реплики
+и процессы видят изменения друг друга не позже чем через этот срок плюс
+интервал записи. Параллельные изменения одного ключа в разных процессах
+не сливаются — побеждает последняя запись. SESSION_STATE_TTL — сколько
+состояние хранится в таблице. Перед остановкой бот вызывает flush(),
+иначе изменения последних секунд теряются.
+
+Состояние пишется только для пользователей, у которых есть строка users:
+после utils.purge отложенная запись другого процесса (бота, чья память
+ещё помнит пользователя) не вернёт удалённую строку session_state.
+
+Значения должны сериализоваться в JSON; множества хранятся
+отсортированными списками.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from models import SessionLocal, SessionState, User
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SESSION_STATE_MAX_ENTRIES = int(os.getenv('SESSION_STATE_MAX_ENTRIES', 20000))
+SESSION_STATE_TTL = int(os.getenv('SESSION_STATE_TTL', 7 * 24 * 60 * 60))  # секунды
+SESSION_STATE_FLUSH_INTERVAL = float(os.getenv('SESSION_STATE_FLUSH_INTERVAL', 5.0))  # секунды
+# Сколько запись в памяти считается свежей, если есть БД (дальше — перечитать)
+SESSION_STATE_MEMORY_TTL = int(os.getenv('SESSION_STATE_MEMORY_TTL', 30))  # секунды
+# 'db' — постоянный уровень в таблице session_state, 'memory' — только память процесса
+SESSION_STATE_BACKEND = os.getenv('SESSION_STATE_BACKEND', 'db')
+
+
+class DBStateBackend:
+    """Постоянный уровень: таблица session_state, запись пачкой через upsert"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def load(self, platform: str, user_id: int, max_age: int):
+        db = self.session_factory()
+        try:
+            row = db.execute(
+                select(SessionState.data, SessionState.updated_at).where(
+                    SessionState.platform == platform,
+                    SessionState.user_id == user_id
+                )
+            ).first()
+        finally:
+            db.close()
+        if row is None or row.updated_at < datetime.utcnow() - timedelta(seconds=max_age):
+            return None
+        return json.loads(row.data)
+
+    def save(self, rows: list, deleted: list, max_age: int):
+        """
+        Записать изменённые состояния и удалить очищенные
+
+        Args:
+            rows: [{'platform', 'user_id', 'data', 'updated_at'}]
+            deleted: [(platform, user_id)]
+            max_age: Заодно удалить записи старше TTL
+        """
+        db = self.session_factory()
+        try:
+            rows = self._existing_users_only(db, rows)
+            if rows:
+                db.execute(self._upsert(db), rows)
+            for platform, user_id in deleted:
+                db.execute(delete(SessionState).where(
+                    SessionState.platform == platform, SessionState.user_id == user_id
+                ))
+            db.execute(delete(SessionState).where(
+                SessionState.updated_at < datetime.utcnow() - timedelta(seconds=max_age)
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _existing_users_only(db, rows: list) -> list:
+        """Отбросить состояния пользователей, удалённых из users (utils.purge)"""
+        columns = {'telegram': User.telegram_id, 'vk': User.vk_id}
+        existing = set()
+        for platform, column in columns.items():
+            ids = {row['user_id'] for row in rows if row['platform'] == platform}
+            if ids:
+                existing.update(
+                    (platform, user_id) for user_id in db.scalars(select(column).where(column.in_(ids)))
+                )
+        kept = [row for row in rows if (row['platform'], row['user_id']) in existing]
+        if len(kept) < len(rows):
+            metrics.inc('session_state.dropped_purged', len(rows) - len(kept))
+        return kept
+
+    @staticmethod
+    def _upsert(db):
+        dialect = db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(SessionState)
+        return stmt.on_conflict_do_update(
+            index_elements=[SessionState.platform, SessionState.user_id],
+            set_={'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+        )
+
+
+class SessionStateStore:
+    """Состояние диалога: LRU+TTL в памяти и (опционально) БД с отложенной записью"""
+
+    def __init__(self, backend=None, max_entries: int = SESSION_STATE_MAX_ENTRIES,
+                 ttl: int = SESSION_STATE_TTL, flush_interval: float = SESSION_STATE_FLUSH_INTERVAL,
+                 memory_ttl: int = SESSION_STATE_MEMORY_TTL):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # Без БД память — единственный уровень и живёт весь TTL
+        self.memory_ttl = min(memory_ttl, ttl) if backend is not None else ttl
+        self._entries = OrderedDict()  # (platform, user_id) -> (state, expires_at)
+        self._pending = {}  # (platform, user_id) -> JSON для записи в БД (None — удалить)
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, platform: str, user_id: int, field: str, default=None):
+        """Прочитать поле состояния"""
+        return self._state(platform, user_id).get(field, default)
+
+    def set(self, platform: str, user_id: int, field: str, value):
+        """Записать поле состояния (в БД уйдёт при следующем сбросе)"""
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        state = self._state(platform, user_id)
+        state[field] = value
+        self._touch((platform, user_id), state)
+
+    def delete(self, platform: str, user_id: int, field: str):
+        """Удалить поле состояния"""
+        state = self._state(platform, user_id)
+        if state.pop(field, None) is not None:
+            self._touch((platform, user_id), state)
+
+    def forget(self, platform: str, user_id: int):
+        """Забыть состояние пользователя целиком (после удаления его данных из БД)"""
+        key = (platform, user_id)
+        self._entries.pop(key, None)
+        self._pending.pop(key, None)
+
+    def toggle(self, platform: str, user_id: int, field: str, item) -> set:
+        """
+        Добавить item в множество-поле или убрать его оттуда
+
+        Returns:
+            set: Новое содержимое множества
+        """
+        members = set(self.get(platform, user_id, field, ()))
+        members.symmetric_difference_update({item})
+        self.set(platform, user_id, field, members)
+        return members
+
+    def stats(self) -> dict:
+        """Размер и эффективность уровня в памяти"""
+        approx_bytes = sum(
+            len(json.dumps(state, ensure_ascii=False)) for state, _ in self._entries.values()
+        )
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'approx_bytes': approx_bytes,
+            'pending_writes': len(self._pending),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def flush(self):
+        """Записать накопленные изменения в БД (синхронно)"""
+        pending = self._take_pending()
+        if self.backend is not None and pending:
+            self.backend.save(*self._split(pending), self.ttl)
+
+    def _state(self, platform: str, user_id: int) -> dict:
+        key = (platform, user_id)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+        state = None
+        if key in self._pending:
+            # Вытеснено из памяти, но ещё не записано в БД
+            state = json.loads(self._pending[key] or '{}')
+        elif self.backend is not None:
+            try:
+                state = self.backend.load(platform, user_id, self.ttl)
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать состояние {platform}:{user_id}: {e}")
+                # БД недоступна — лучше устаревшая копия из памяти, чем пустое состояние
+                state = entry[0] if entry is not None else None
+        state = state or {}
+        self._store(key, state)
+        return state
+
+    def _store(self, key, state: dict):
+        self._entries[key] = (state, time.monotonic() + self.memory_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        metrics.set_gauge('session_state.entries', len(self._entries))
+
+    def _touch(self, key, state: dict):
+        self._store(key, state)
+        if self.backend is not None:
+            self._pending[key] = json.dumps(state, ensure_ascii=False) if state else None
+            self._ensure_flusher()
+
+    def _take_pending(self) -> dict:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    @staticmethod
+    def _split(pending: dict):
+        now = datetime.utcnow()
+        rows = [
+            {'platform': key[0], 'user_id': key[1], 'data': data, 'updated_at': now}
+            for key, data in pending.items() if data is not None
+        ]
+        deleted = [key for key, data in pending.items() if data is None]
+        return rows, deleted
+
+    def _ensure_flusher(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты, тесты) — писать сразу
+            self.flush()
+            return
+        self._task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        """Отложенная запись: все изменения за интервал уходят одной пачкой"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            pending = self._take_pending()
+            if not pending:
+                return
+            try:
+                await asyncio.to_thread(self.backend.save, *self._split(pending), self.ttl)
+                metrics.inc('session_state.flushes')
+            except Exception as e:
+                logger.error(f"Ошибка записи состояния диалогов ({len(pending)} записей): {e}")
+                # Вернуть в очередь то, что не успело измениться заново
+                for key, data in pending.items():
+                    self._pending.setdefault(key, data)
+
+
+# Общее хранилище состояния диалогов процесса
+session_state = SessionStateStore(DBStateBackend() if SESSION_STATE_BACKEND == 'db' else None)
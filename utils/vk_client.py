@@ -0,0 +1,149 @@
+"""
+Клиент отправки сообщений VK: идемпотентность и безопасные повторы
+
+VK отбрасывает повторное сообщение с тем же random_id, поэтому
+random_id выводится детерминированно:
+- для напоминаний — из (пользователь, тип напоминания, локальная дата);
+- для ответов в обработчиках — из (id апдейта, номер отправки в апдейте).
+
+С таким random_id повтор после таймаута не создаёт дубль, и запросы
+можно повторять с экспоненциальной задержкой и джиттером. Один
+экземпляр API на процесс переиспользует HTTP-сессию (keep-alive).
+Каждая попытка проходит через очередь vk_outbound (лимит и приоритеты).
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import random
+
+from utils.outbound import vk_outbound
+
+logger = logging.getLogger(__name__)
+
+VK_BOT_TOKEN = os.getenv('VK_BOT_TOKEN')
+
+# Коды ошибок VK, после которых запрос можно повторить
+# 1 — неизвестная ошибка, 6 — слишком много запросов в секунду, 10 — внутренняя ошибка
+RETRYABLE_VK_CODES = {1, 6, 10}
+
+SEND_ATTEMPTS = int(os.getenv('VK_SEND_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('VK_RETRY_BASE_DELAY', 0.5))  # секунды
+RETRY_MAX_DELAY = float(os.getenv('VK_RETRY_MAX_DELAY', 8.0))  # секунды
+
+# random_id — int32, 0 отключает дедупликацию на стороне VK
+_RANDOM_ID_MAX = 2 ** 31 - 1
+
+_vk_api = None
+
+# (id апдейта, счётчик отправок) для текущего обрабатываемого апдейта
+_current_update = contextvars.ContextVar('vk_current_update', default=None)
+
+
+def get_vk_api():
+    """Получить VK API инстанс (lazy init, синглтон — общая HTTP-сессия)"""
+    global _vk_api
+    if _vk_api is None and VK_BOT_TOKEN:
+        from vkbottle import API
+        _vk_api = API(token=VK_BOT_TOKEN)
+    return _vk_api
+
+
+def vk_random_id(*parts) -> int:
+    """
+    Детерминированный random_id из произвольных частей ключа
+
+    Returns:
+        int: Число в диапазоне 1..2^31-1
+    """
+    key = "|".join(str(p) for p in parts).encode('utf-8')
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % _RANDOM_ID_MAX + 1
+
+
+def reminder_random_id(user, reminder_type: str) -> int:
+    """random_id напоминания: (пользователь, тип напоминания, локальная дата)"""
+    import pytz
+    from datetime import datetime
+    try:
+        user_tz = pytz.timezone(user.timezone or 'Europe/Moscow')
+    except pytz.UnknownTimeZoneError:
+        user_tz = pytz.utc
+    local_date = datetime.now(user_tz).date().isoformat()
+    return vk_random_id('reminder', user.vk_id, reminder_type, local_date)
+
+
+def begin_update(update_id: str):
+    """Отметить начало обработки апдейта (event_id или id сообщения)"""
+    _current_update.set([update_id, 0])
+
+
+def next_update_random_id(peer_id: int) -> int:
+    """
+    random_id для очередной отправки в рамках текущего апдейта
+
+    Повторная обработка того же апдейта даёт те же random_id, и VK
+    не продублирует сообщения. Вне апдейта возвращает 0 (без дедупликации).
+    """
+    current = _current_update.get()
+    if current is None:
+        return 0
+    current[1] += 1
+    return vk_random_id('update', current[0], peer_id, current[1])
+
+
+def is_retryable(error: Exception) -> bool:
+    """Можно ли безопасно повторить запрос после этой ошибки"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_VK_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError)) or \
+        type(error).__module__.startswith('aiohttp')
+
+
+async def call_with_retry(func, *args, attempts: int = SEND_ATTEMPTS, **kwargs):
+    """
+    Вызвать запрос VK с повторами: экспоненциальная задержка с полным джиттером
+
+    Перед каждой попыткой запрос ждёт своей очереди в vk_outbound.
+    Повторять можно только идемпотентные запросы (messages.send с ненулевым
+    random_id, messages.edit, execute из таких вызовов).
+    """
+    for attempt in range(attempts):
+        try:
+            await vk_outbound.acquire()
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            if getattr(e, 'code', None) == 6:
+                # Too many requests — притормозить всю очередь процесса
+                vk_outbound.pause(1.0)
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            logger.warning(f"[VK] Повтор запроса через {delay:.2f}с после ошибки: {e}")
+            await asyncio.sleep(delay)
+
+
+async def send_message(api, peer_id: int, message: str, keyboard: str = None, random_id: int = None):
+    """
+    Отправить сообщение VK с идемпотентным random_id и повторами
+
+    Если random_id не передан, он выводится из текущего апдейта.
+    Без random_id (0) повторы отключены — VK не сможет отбросить дубль.
+    """
+    if random_id is None:
+        random_id = next_update_random_id(peer_id)
+    kwargs = {"peer_id": peer_id, "message": message, "random_id": random_id}
+    if keyboard:
+        kwargs["keyboard"] = keyboard
+    attempts = SEND_ATTEMPTS if random_id else 1
+    return await call_with_retry(api.messages.send, attempts=attempts, **kwargs)
+
+
+async def edit_message(api, peer_id: int, cmid: int, message: str, keyboard: str = None):
+    """Редактировать сообщение VK (идемпотентно, с повторами)"""
+    kwargs = {"peer_id": peer_id, "conversation_message_id": cmid, "message": message}
+    if keyboard:
+        kwargs["keyboard"] = keyboard
+    return await call_with_retry(api.messages.edit, **kwargs)
@@ -0,0 +1,235 @@
+"""
+Пакетная отправка сообщений VK через метод execute
+
+execute выполняет до 25 вызовов API за один HTTP-запрос. Рассылка
+напоминаний складывает messages.send в батч, группирует получателей
+с одинаковым содержимым (текст + клавиатура) в один вызов с peer_ids
+(до 100 получателей), отправляет вызовы пачками через execute и
+сопоставляет результаты с пользователями.
+
+- Если отдельный вызов вернул ошибку внутри ответа execute, сообщение
+  точно не ушло, и получателям оно отправляется обычным messages.send
+  с собственным random_id каждого.
+- Если сам execute не прошёл (таймаут, обрыв соединения, ошибка после
+  всех повторов с тем же random_id), VK мог уже доставить сообщения.
+  Повтор с другим random_id VK дублем не распознает, поэтому такие
+  получатели помечаются DELIVERY_UNKNOWN и пропускаются.
+"""
+import json
+import logging
+
+from utils.vk_client import SEND_ATTEMPTS, call_with_retry, vk_random_id
+
+logger = logging.getLogger(__name__)
+
+# Лимит вызовов API внутри одного execute
+EXECUTE_MAX_CALLS = 25
+
+# Лимит получателей в messages.send с peer_ids
+SEND_MAX_PEERS = 100
+
+# Сколько сообщений держать в батче до принудительной отправки
+BATCH_MAX_PENDING = EXECUTE_MAX_CALLS * SEND_MAX_PEERS
+
+# Код в результате flush: execute не прошёл, доставлено ли сообщение — неизвестно
+DELIVERY_UNKNOWN = -1
+
+
+def content_key(params: dict) -> str:
+    """Ключ группировки: все параметры messages.send, кроме получателя"""
+    content = {k: v for k, v in params.items() if k not in ('peer_id', 'random_id')}
+    return json.dumps(content, ensure_ascii=False, sort_keys=True)
+
+
+def group_by_content(pending: list) -> list:
+    """
+    Сгруппировать сообщения с одинаковым содержимым
+
+    Returns:
+        list: [(params, [peer_id, ...])], не больше SEND_MAX_PEERS получателей в группе
+    """
+    groups = {}
+    for params in pending:
+        key = content_key(params)
+        if key not in groups:
+            groups[key] = (params, [])
+        groups[key][1].append(params['peer_id'])
+
+    calls = []
+    for params, peers in groups.values():
+        for i in range(0, len(peers), SEND_MAX_PEERS):
+            calls.append((params, peers[i:i + SEND_MAX_PEERS]))
+    return calls
+
+
+def call_params(params: dict, peers: list, random_ids: dict = None) -> dict:
+    """
+    Параметры messages.send для одного или нескольких получателей
+
+    Args:
+        random_ids: peer_id -> random_id получателя. Для группы random_id
+            выводится из random_id участников, поэтому повтор той же
+            группы VK отбросит как дубль.
+    """
+    call = {k: v for k, v in params.items() if k != 'peer_id'}
+    random_ids = random_ids or {}
+    if len(peers) == 1:
+        call['peer_id'] = peers[0]
+        call['random_id'] = random_ids.get(peers[0], params.get('random_id', 0))
+    else:
+        call['peer_ids'] = ",".join(str(p) for p in peers)
+        member_ids = [random_ids.get(p, 0) for p in peers]
+        call['random_id'] = vk_random_id('peers', *member_ids) if all(member_ids) else 0
+    return call
+
+
+def parse_multi_send_result(result, peers: list) -> dict:
+    """
+    Разобрать результат messages.send для получателей
+
+    С peer_ids VK возвращает список {peer_id, message_id} или
+    {peer_id, error}; с одним peer_id — просто id сообщения.
+
+    Returns:
+        dict: peer_id -> error_code (None при успехе)
+    """
+    if not isinstance(result, list):
+        return {peer: None for peer in peers}
+    outcome = {peer: 0 for peer in peers}
+    for item in result:
+        peer = item.get('peer_id')
+        error = item.get('error')
+        outcome[peer] = (error.get('code') or error.get('error_code') or 0) if error else None
+    return outcome
+
+
+def build_execute_code(calls: list) -> str:
+    """
+    Собрать VKScript для execute
+
+    Args:
+        calls: Список (method, params), например ("messages.send", {...})
+
+    Returns:
+        str: Код вида return [API.messages.send({...}), ...];
+    """
+    parts = [
+        f"API.{method}({json.dumps(params, ensure_ascii=False)})"
+        for method, params in calls
+    ]
+    return "return [" + ",".join(parts) + "];"
+
+
+def parse_execute_response(response: dict, count: int) -> list:
+    """
+    Разобрать ответ execute в список результатов по вызовам
+
+    Ошибочные вызовы возвращаются в response как false, а их коды лежат
+    в execute_errors в том же порядке.
+
+    Returns:
+        list: [(result, error_code)] длиной count; error_code=None при успехе
+    """
+    results = (response or {}).get('response') or []
+    errors = iter((response or {}).get('execute_errors') or [])
+    parsed = []
+    for i in range(count):
+        result = results[i] if i < len(results) else False
+        if result is False or result is None:
+            error = next(errors, {})
+            parsed.append((None, error.get('error_code', 0)))
+        else:
+            parsed.append((result, None))
+    return parsed
+
+
+class VKExecuteBatch:
+    """Батч messages.send: группировка по содержимому и отправка через execute"""
+
+    def __init__(self, api):
+        self.api = api
+        self._pending = []  # params для messages.send (по одному получателю)
+        self._random_ids = {}  # (content_key, peer_id) -> random_id
+        self.sent = 0
+        self.failed = 0
+        self.unknown = 0
+        self.requests = 0
+        self.delivered = set()  # peer_id, которым сообщение точно доставлено
+        self.errors = {}  # peer_id -> error_code за все отправки батча
+
+    async def add(self, params: dict):
+        """Добавить messages.send в батч (отправка при переполнении батча)"""
+        self._pending.append(params)
+        self._random_ids[(content_key(params), params['peer_id'])] = params.get('random_id', 0)
+        if len(self._pending) >= BATCH_MAX_PENDING:
+            await self.flush()
+
+    async def flush(self) -> dict:
+        """
+        Отправить накопленные сообщения
+
+        Returns:
+            dict: peer_id -> error_code (None если сообщение доставлено,
+                DELIVERY_UNKNOWN если execute не прошёл)
+        """
+        calls = group_by_content(self._pending)
+        random_ids, self._random_ids = self._random_ids, {}
+        self._pending = []
+
+        outcome = {}
+        for i in range(0, len(calls), EXECUTE_MAX_CALLS):
+            outcome.update(await self._send_chunk(calls[i:i + EXECUTE_MAX_CALLS], random_ids))
+
+        failed = {peer: code for peer, code in outcome.items() if code not in (None, DELIVERY_UNKNOWN)}
+        self.sent += sum(1 for code in outcome.values() if code is None)
+        self.delivered.update(peer for peer, code in outcome.items() if code is None)
+        self.unknown += sum(1 for code in outcome.values() if code == DELIVERY_UNKNOWN)
+        self.failed += len(failed)
+        self.errors.update(failed)
+        return outcome
+
+    async def _send_chunk(self, chunk: list, random_ids: dict) -> dict:
+        peer_ids = [
+            {peer: random_ids.get((content_key(params), peer), 0) for peer in peers}
+            for params, peers in chunk
+        ]
+        calls = [
+            ("messages.send", call_params(params, peers, ids))
+            for (params, peers), ids in zip(chunk, peer_ids)
+        ]
+        # execute можно повторять, только если все вызовы идемпотентны
+        attempts = SEND_ATTEMPTS if all(call['random_id'] for _, call in calls) else 1
+        try:
+            self.requests += 1
+            response = await call_with_retry(self.api.request, "execute",
+                                             {"code": build_execute_code(calls)}, attempts=attempts)
+            results = parse_execute_response(response, len(chunk))
+        except Exception as e:
+            # Запрос мог дойти до VK: повтор с random_id отдельных получателей создал бы дубли
+            skipped = sum(len(peers) for _, peers in chunk)
+            logger.warning(
+                f"[VK] execute не выполнен ({len(chunk)} вызовов), доставка {skipped} сообщений "
+                f"неизвестна — пропускаем: {e}"
+            )
+            return {peer: DELIVERY_UNKNOWN for _, peers in chunk for peer in peers}
+
+        outcome = {}
+        for (params, peers), ids, (result, code) in zip(chunk, peer_ids, results):
+            if code is None:
+                outcome.update(parse_multi_send_result(result, peers))
+                continue
+            # VK вернул ошибку вызова — сообщение не ушло, отправить каждому получателю отдельно
+            for peer in peers:
+                outcome[peer] = await self._send_single({**params, 'peer_id': peer, 'random_id': ids[peer]})
+        return outcome
+
+    async def _send_single(self, params: dict):
+        """Отправить одно сообщение напрямую; вернуть код ошибки или None"""
+        try:
+            self.requests += 1
+            attempts = SEND_ATTEMPTS if params.get('random_id') else 1
+            await call_with_retry(self.api.messages.send, attempts=attempts, **params)
+            return None
+        except Exception as e:
+            logger.error(f"[VK] Ошибка отправки vk:{params.get('peer_id')}: {e}")
+            return getattr(e, 'code', 0) or 0
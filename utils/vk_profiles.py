@@ -0,0 +1,169 @@
+"""
+Кэш профилей VK-пользователей (имя и фамилия)
+
+Интерактивные обработчики берут имя только из кэша и никогда не ждут
+users.get: неизвестные или устаревшие id ставятся в очередь, а фоновая
+задача обновляет их пачками (users.get принимает до 1000 id за вызов).
+Кэш заполняется из таблицы users при старте VK-бота.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import bindparam, update
+
+from models import SessionLocal, User
+
+logger = logging.getLogger(__name__)
+
+# users.get принимает не больше 1000 id за вызов
+USERS_GET_MAX_IDS = 1000
+
+PROFILE_TTL = int(os.getenv('VK_PROFILE_TTL', 24 * 60 * 60))  # секунды
+PROFILE_CACHE_SIZE = int(os.getenv('VK_PROFILE_CACHE_SIZE', 50000))
+REFRESH_INTERVAL = float(os.getenv('VK_PROFILE_REFRESH_INTERVAL', 2.0))  # секунды
+
+
+class VKProfileCache:
+    """LRU-кэш имён VK-пользователей с TTL и фоновым пакетным обновлением"""
+
+    def __init__(self, ttl: int = PROFILE_TTL, max_size: int = PROFILE_CACHE_SIZE,
+                 refresh_interval: float = REFRESH_INTERVAL):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self._profiles = OrderedDict()  # vk_id -> (first_name, last_name, expires_at)
+        self._pending = set()
+        self._api = None
+        self._task = None
+
+    def bind(self, api):
+        """Привязать VK API, через который фоновая задача вызывает users.get"""
+        self._api = api
+
+    def seed_from_db(self) -> int:
+        """
+        Заполнить кэш именами из таблицы users
+
+        Returns:
+            int: Количество загруженных профилей
+        """
+        db = SessionLocal()
+        try:
+            rows = db.query(User.vk_id, User.first_name, User.last_name).filter(
+                User.platform == 'vk',
+                User.vk_id.isnot(None),
+                User.first_name.isnot(None)
+            ).order_by(User.last_interaction.desc()).limit(self.max_size).all()
+        finally:
+            db.close()
+
+        # Самые активные — в конец LRU, чтобы вытеснялись последними
+        for vk_id, first_name, last_name in reversed(rows):
+            self._store(vk_id, first_name, last_name)
+        logger.info(f"[VK] Кэш профилей: загружено {len(rows)} профилей из БД")
+        return len(rows)
+
+    def get(self, vk_id: int) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Получить (first_name, last_name) без обращения к VK API
+
+        Если профиля нет или он устарел, id ставится в очередь на фоновое
+        обновление, а вызывающий получает то, что есть в кэше (или None, None).
+        """
+        entry = self._profiles.get(vk_id)
+        if entry is None:
+            self._schedule(vk_id)
+            return None, None
+
+        self._profiles.move_to_end(vk_id)
+        first_name, last_name, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._schedule(vk_id)
+        return first_name, last_name
+
+    def put(self, vk_id: int, first_name: Optional[str], last_name: Optional[str]):
+        """Положить профиль в кэш (например, после ответа users.get)"""
+        self._store(vk_id, first_name, last_name)
+        self._pending.discard(vk_id)
+
+    def stats(self) -> dict:
+        """Размер кэша и очереди обновления"""
+        return {'size': len(self._profiles), 'pending': len(self._pending)}
+
+    def _store(self, vk_id, first_name, last_name):
+        self._profiles[vk_id] = (first_name, last_name, time.monotonic() + self.ttl)
+        self._profiles.move_to_end(vk_id)
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+
+    def _schedule(self, vk_id: int):
+        self._pending.add(vk_id)
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._api is None or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Фоновая задача: забирать id из очереди пачками и обновлять профили"""
+        while self._pending:
+            await asyncio.sleep(self.refresh_interval)
+            batch = []
+            while self._pending and len(batch) < USERS_GET_MAX_IDS:
+                batch.append(self._pending.pop())
+            try:
+                await self.refresh(batch)
+            except Exception as e:
+                logger.warning(f"[VK] Не удалось обновить профили ({len(batch)} id): {e}")
+
+    async def refresh(self, vk_ids: list):
+        """Загрузить профили через users.get (до 1000 id) и сохранить в кэш и БД"""
+        if not vk_ids or self._api is None:
+            return
+        users = await self._api.users.get(user_ids=vk_ids[:USERS_GET_MAX_IDS])
+        profiles = [
+            {'b_vk_id': u.id, 'b_first_name': u.first_name, 'b_last_name': u.last_name}
+            for u in users or []
+        ]
+        for p in profiles:
+            self.put(p['b_vk_id'], p['b_first_name'], p['b_last_name'])
+
+        if profiles:
+            await asyncio.to_thread(_save_profiles, profiles)
+        logger.debug(f"[VK] Обновлено профилей: {len(profiles)}")
+
+
+def _save_profiles(profiles: list):
+    """
+    Записать имена VK-пользователей в users одним executemany
+
+    version увеличивается, как при любой записи users мимо ORM: обработчик
+    с копией строки до обновления получит конфликт версий, а не затрёт имена.
+    """
+    users = User.__table__
+    stmt = update(users).where(
+        users.c.vk_id == bindparam('b_vk_id')
+    ).values(
+        first_name=bindparam('b_first_name'),
+        last_name=bindparam('b_last_name'),
+        version=users.c.version + 1
+    )
+    db = SessionLocal()
+    try:
+        db.execute(stmt, profiles)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Глобальный кэш профилей VK
+vk_profile_cache = VKProfileCache()
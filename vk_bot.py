@@ -9,11 +9,15 @@ from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 
 from vkbottle.bot import Bot, Message
-from vkbottle import GroupEventType, GroupTypes
+from vkbottle import BaseMiddleware, GroupEventType, GroupTypes
 
 from models import init_db
 from utils import practices_manager
 from utils.vk_keyboards import create_vk_menu_keyboard
+from utils.vk_client import begin_update
+from utils.dedupe import update_deduplicator
+from utils import callback_codec
+from utils.metrics import metrics
 
 load_dotenv()
 
@@ -50,6 +54,23 @@ if not VK_TOKEN:
 bot = Bot(token=VK_TOKEN)
 
 
+class UpdateContextMiddleware(BaseMiddleware[Message]):
+    """
+    Привязать отправки к входящему сообщению: random_id = (апдейт, шаг).
+    Повторную доставку того же сообщения после переподключения — пропустить.
+    """
+
+    async def pre(self):
+        update_key = f"msg:{self.event.peer_id}:{self.event.conversation_message_id}"
+        if update_deduplicator.check('vk', [update_key]):
+            logger.info(f"[VK] Повторное сообщение {update_key} пропущено")
+            self.stop("duplicate")
+        begin_update(update_key)
+
+
+bot.labeler.message_view.register_middleware(UpdateContextMiddleware)
+
+
 # ==================== ТЕКСТОВЫЕ КОМАНДЫ ====================
 
 @bot.on.message(text=["Начать", "начать", "Start", "start"])
@@ -152,44 +173,105 @@ async def handle_callback(event: GroupTypes.MessageEvent):
 
         action = payload.get('action', '') if payload else ''
 
+        # Повторная доставка или двойное нажатие — обработать один раз
+        reason = update_deduplicator.check('vk', [f"event:{event_id}"], user_id=user_id, action=action)
+        if reason:
+            logger.info(f"[VK] Повторное нажатие {action} от {user_id} пропущено ({reason})")
+            if reason == 'debounce':
+                await bot.api.messages.send_message_event_answer(
+                    event_id=event_id,
+                    user_id=user_id,
+                    peer_id=peer_id
+                )
+            return
+
+        # Повторная доставка того же события даст те же random_id
+        begin_update(f"event:{event_id}")
+
         logger.info(f"[VK] Callback от {user_id}: action={action}")
 
-        # Подтвердить нажатие кнопки
-        await bot.api.messages.send_message_event_answer(
-            event_id=event_id,
-            user_id=user_id,
-            peer_id=peer_id
-        )
+        async def answer(text: str = None):
+            """Подтвердить нажатие кнопки (с всплывающей подсказкой, если есть text)"""
+            extra = {"event_data": json.dumps({"type": "show_snackbar", "text": text})} if text else {}
+            await bot.api.messages.send_message_event_answer(
+                event_id=event_id,
+                user_id=user_id,
+                peer_id=peer_id,
+                **extra
+            )
+
+        # Устаревшую кнопку отклонить по её данным, не загружая пользователя
+        reason = callback_codec.stale_reason(callback_codec.decode(action))
+        if reason:
+            metrics.inc(f'callback.stale.{reason}')
+            await answer(callback_codec.STALE_BUTTON_TEXT)
+            logger.info(f"[VK] Пользователь {user_id}: кнопка {action} устарела ({reason})")
+            return
 
         # --- Start callbacks ---
         if action in ("start_show_status", "start_practice_from_start"):
             from vk_handlers.start import vk_handle_start_callback
+            await answer()
             await vk_handle_start_callback(bot.api, peer_id, user_id, cmid, action)
 
         # --- Menu callbacks ---
         elif action.startswith("menu_"):
             from vk_handlers.start import vk_handle_menu_callback
+            await answer()
             await vk_handle_menu_callback(bot.api, peer_id, user_id, cmid, action)
 
         # --- Time setting callbacks ---
         elif action.startswith("time_"):
             from vk_handlers.settings import vk_handle_time_callback
+            await answer()
             await vk_handle_time_callback(bot.api, peer_id, user_id, cmid, action)
 
         # --- Timezone setting callbacks ---
         elif action.startswith("tz_"):
             from vk_handlers.settings import vk_handle_timezone_callback
+            await answer()
             await vk_handle_timezone_callback(bot.api, peer_id, user_id, cmid, action)
 
         # --- Practice callbacks (всё остальное) ---
+        # Нажатие подтверждает роутер: кнопке с чужого шага нужна подсказка
         else:
             from vk_handlers.practices import vk_handle_practice_callback
-            await vk_handle_practice_callback(bot.api, peer_id, user_id, cmid, action)
+            await vk_handle_practice_callback(bot.api, peer_id, user_id, cmid, action, answer=answer)
 
     except Exception as e:
         logger.error(f"[VK] Ошибка обработки callback: {e}", exc_info=True)
 
 
+# ==================== РАЗРЕШЕНИЕ СООБЩЕНИЙ ====================
+
+@bot.on.raw_event(GroupEventType.MESSAGE_DENY, dataclass=GroupTypes.MessageDeny)
+async def handle_message_deny(event: GroupTypes.MessageDeny):
+    """Пользователь запретил сообщения от сообщества — рассылка его пропускает"""
+    from models import SessionLocal
+    from utils.db import mark_users_inactive
+    db = SessionLocal()
+    try:
+        mark_users_inactive(db, 'vk', [event.object.user_id], 'vk_message_deny')
+    except Exception as e:
+        logger.error(f"[VK] Ошибка деактивации {event.object.user_id}: {e}")
+    finally:
+        db.close()
+
+
+@bot.on.raw_event(GroupEventType.MESSAGE_ALLOW, dataclass=GroupTypes.MessageAllow)
+async def handle_message_allow(event: GroupTypes.MessageAllow):
+    """Пользователь снова разрешил сообщения — вернуть в рассылку"""
+    from models import SessionLocal
+    from utils.db import reactivate_user
+    db = SessionLocal()
+    try:
+        reactivate_user(db, 'vk', event.object.user_id)
+    except Exception as e:
+        logger.error(f"[VK] Ошибка реактивации {event.object.user_id}: {e}")
+    finally:
+        db.close()
+
+
 # ==================== ЗАПУСК ====================
 
 def main():
@@ -205,6 +287,37 @@ def main():
         logger.error(f"Ошибка загрузки практик: {e}")
         return
 
+    # Кэш имён пользователей: обработчики не ждут users.get
+    from utils.vk_profiles import vk_profile_cache
+    vk_profile_cache.bind(bot.api)
+    try:
+        vk_profile_cache.seed_from_db()
+    except Exception as e:
+        logger.warning(f"Не удалось заполнить кэш профилей VK: {e}")
+
+    # Напоминания VK рассылаются отсюда, а не из bot.py: рассылка и ответы
+    # делят одну очередь vk_outbound (лимит сообщества и приоритет ответов)
+    from utils.scheduler import init_scheduler, schedule_user_reminders, stop_scheduler
+
+    async def start_reminders():
+        init_scheduler()
+        schedule_user_reminders(platforms=('vk',))
+
+    async def stop_reminders():
+        stop_scheduler()
+
+    async def flush_session_state():
+        # Изменения состояния диалогов, ещё ждущие отложенной записи
+        from utils.session_state import session_state
+        try:
+            session_state.flush()
+        except Exception as e:
+            logger.error(f"Не удалось записать состояние диалогов при остановке: {e}")
+
+    bot.loop_wrapper.on_startup.append(start_reminders())
+    bot.loop_wrapper.on_shutdown.append(stop_reminders())
+    bot.loop_wrapper.on_shutdown.append(flush_session_state())
+
     logger.info("VK-бот запущен! Нажмите Ctrl+C для остановки.")
     bot.run_forever()
 
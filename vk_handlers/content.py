@@ -4,6 +4,7 @@ VK обработчики: примеры, рецепты, манифест, к
 import logging
 from utils import practices_manager
 from utils.formatting import markdown_to_plain
+from utils.vk_client import send_message
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +25,7 @@ async def vk_examples_command(api, peer_id):
 
     message += "Используй эти примеры как вдохновение для своих практик! 💡"
 
-    await api.messages.send(
-        peer_id=peer_id,
-        message=markdown_to_plain(message),
-        random_id=0
-    )
+    await send_message(api, peer_id, markdown_to_plain(message))
 
 
 async def vk_recipes_command(api, peer_id):
@@ -44,11 +41,7 @@ async def vk_recipes_command(api, peer_id):
 
     message += "Приятного аппетита! 🌿"
 
-    await api.messages.send(
-        peer_id=peer_id,
-        message=markdown_to_plain(message),
-        random_id=0
-    )
+    await send_message(api, peer_id, markdown_to_plain(message))
 
 
 async def vk_manifesto_command(api, peer_id):
@@ -69,22 +62,14 @@ async def vk_manifesto_command(api, peer_id):
     if outro:
         message += f"{outro}\n"
 
-    await api.messages.send(
-        peer_id=peer_id,
-        message=markdown_to_plain(message),
-        random_id=0
-    )
+    await send_message(api, peer_id, markdown_to_plain(message))
 
 
 async def vk_contact_command(api, peer_id):
     """Показать контакты поддержки"""
-    await api.messages.send(
-        peer_id=peer_id,
-        message=(
-            "Поддержка Sogreto Bot 💚\n\n"
-            "По всем вопросам пишите:\n"
-            "💬 Telegram: @sogreto_support\n\n"
-            "Мы ответим в течение 24 часов."
-        ),
-        random_id=0
-    )
+    await send_message(api, peer_id, (
+        "Поддержка Sogreto Bot 💚\n\n"
+        "По всем вопросам пишите:\n"
+        "💬 Telegram: @sogreto_support\n\n"
+        "Мы ответим в течение 24 часов."
+    ))
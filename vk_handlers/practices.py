@@ -12,29 +12,25 @@ from utils import practices_manager
 from utils.db import get_or_create_vk_user, update_user_progress_obj, reset_user_progress_obj
 from utils.formatting import markdown_to_plain
 from utils.vk_keyboards import create_vk_inline_keyboard, create_vk_callback_keyboard
+from utils.vk_profiles import vk_profile_cache
+from utils.accordion import render_examples, render_recipes
+from utils.session_state import session_state
+from utils import vk_client
+from utils import callback_codec
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
-# In-memory state для VK (аккордеоны примеров/рецептов)
-_user_state = {}
-
-
 # ==================== ХЕЛПЕРЫ ====================
 
 async def _edit(api, peer_id, cmid, message, keyboard=None):
     """Редактировать сообщение VK"""
-    kwargs = {"peer_id": peer_id, "conversation_message_id": cmid, "message": message}
-    if keyboard:
-        kwargs["keyboard"] = keyboard
-    await api.messages.edit(**kwargs)
+    await vk_client.edit_message(api, peer_id, cmid, message, keyboard)
 
 
 async def _send(api, peer_id, message, keyboard=None):
     """Отправить новое сообщение VK"""
-    kwargs = {"peer_id": peer_id, "message": message, "random_id": 0}
-    if keyboard:
-        kwargs["keyboard"] = keyboard
-    await api.messages.send(**kwargs)
+    await vk_client.send_message(api, peer_id, message, keyboard)
 
 
 def _get_user(db, vk_id):
@@ -42,8 +38,10 @@ def _get_user(db, vk_id):
     return db.query(User).filter_by(vk_id=vk_id).first()
 
 
-def _practice_kb(buttons_data):
-    """Создать VK-клавиатуру из кнопок practices.json"""
+def _practice_kb(buttons_data, stage=None, step=None):
+    """Создать VK-клавиатуру из кнопок practices.json (с контекстом шага, если он известен)"""
+    if stage is not None and step is not None:
+        buttons_data = callback_codec.encode_buttons(buttons_data, stage, step)
     return create_vk_inline_keyboard(buttons_data)
 
 
@@ -108,22 +106,46 @@ async def _send_substep_message_vk(api, peer_id, cmid, substep):
 
 # ==================== ГЛАВНЫЙ РОУТЕР ====================
 
-async def vk_handle_practice_callback(api, peer_id, user_id, cmid, action):
-    """Главный роутер callback-кнопок практик"""
+async def vk_handle_practice_callback(api, peer_id, user_id, cmid, action, answer=None):
+    """
+    Главный роутер callback-кнопок практик
+
+    Args:
+        answer: async answer(text=None) — подтвердить нажатие (из vk_bot.handle_callback);
+            None, если событие уже подтверждено вызывающим
+    """
     logger.info(f"[VK] Пользователь {user_id} нажал: {action}")
+    # Устаревшие по версии/времени кнопки отсеиваются ещё в vk_bot.handle_callback
+    callback = callback_codec.decode(action)
+    action = callback.action
+    # Нажатие подтверждается после сверки с прогрессом (чтобы показать
+    # подсказку), но в finally — даже если до сверки что-то упало
+    answered = answer is None
 
     db = SessionLocal()
     try:
         user = _get_user(db, user_id)
         if not user:
-            try:
-                users = await api.users.get(user_ids=[user_id])
-                first_name = users[0].first_name if users else None
-                last_name = users[0].last_name if users else None
-            except:
-                first_name, last_name = None, None
+            vk_profile_cache.bind(api)
+            first_name, last_name = vk_profile_cache.get(user_id)
             user = get_or_create_vk_user(db, vk_id=user_id, first_name=first_name, last_name=last_name)
 
+        # Кнопка навигации с чужого шага не должна сдвигать прогресс
+        if not callback_codec.matches_progress(callback, user.current_stage, user.current_step):
+            metrics.inc('callback.stale.progress')
+            logger.info(
+                f"[VK] Пользователь {user_id}: кнопка шага {callback.stage}.{callback.step} "
+                f"нажата на шаге {user.current_stage}.{user.current_step}"
+            )
+            if not answered:
+                answered = True
+                await answer(callback_codec.STALE_BUTTON_TEXT)
+            return
+
+        if not answered:
+            answered = True
+            await answer()
+
         # --- Навигация по шагам ---
         if action == "next_step":
             await _handle_next_step(api, peer_id, cmid, user, db)
@@ -134,33 +156,23 @@ async def vk_handle_practice_callback(api, peer_id, user_id, cmid, action):
 
         # --- Примеры ---
         elif action == "show_examples_menu":
-            _user_state.setdefault(user_id, {})['opened_categories'] = set()
+            session_state.delete('vk', user_id, 'opened_categories')
             await _handle_show_examples(api, peer_id, cmid, user, db, user_id)
         elif action.startswith("toggle_category_"):
             cat_id = action.replace("toggle_category_", "")
-            state = _user_state.setdefault(user_id, {})
-            opened = state.setdefault('opened_categories', set())
-            if cat_id in opened:
-                opened.remove(cat_id)
-            else:
-                opened.add(cat_id)
+            session_state.toggle('vk', user_id, 'opened_categories', cat_id)
             await _handle_show_examples(api, peer_id, cmid, user, db, user_id)
         elif action == "continue_from_examples":
-            _user_state.pop(user_id, None)
+            session_state.delete('vk', user_id, 'opened_categories')
             await _handle_next_step(api, peer_id, cmid, user, db)
 
         # --- Рецепты ---
         elif action == "show_recipes":
-            _user_state.setdefault(user_id, {})['opened_recipes'] = set()
+            session_state.delete('vk', user_id, 'opened_recipes')
             await _handle_show_recipes(api, peer_id, cmid, user, db, user_id)
         elif action.startswith("expand_recipe_") or action.startswith("collapse_recipe_"):
             recipe_id = action.replace("expand_recipe_", "").replace("collapse_recipe_", "")
-            state = _user_state.setdefault(user_id, {})
-            opened = state.setdefault('opened_recipes', set())
-            if recipe_id in opened:
-                opened.remove(recipe_id)
-            else:
-                opened.add(recipe_id)
+            session_state.toggle('vk', user_id, 'opened_recipes', recipe_id)
             await _handle_show_recipes(api, peer_id, cmid, user, db, user_id)
 
         # --- Манифест ---
@@ -263,6 +275,11 @@ async def vk_handle_practice_callback(api, peer_id, user_id, cmid, action):
         logger.error(f"[VK] Ошибка в practice callback: {e}", exc_info=True)
     finally:
         db.close()
+        if not answered:
+            try:
+                await answer()
+            except Exception as e:
+                logger.warning(f"[VK] Не удалось подтвердить нажатие {action} от {user_id}: {e}")
 
 
 # ==================== НАВИГАЦИЯ ПО ШАГАМ ====================
@@ -289,7 +306,7 @@ async def _handle_next_step(api, peer_id, cmid, user, db):
 
         message = _step_message(next_step)
         buttons = next_step.get('buttons', [])
-        keyboard = _practice_kb(buttons) if buttons else None
+        keyboard = _practice_kb(buttons, current_stage, next_step_id) if buttons else None
 
         await _edit(api, peer_id, cmid, message, keyboard)
         logger.info(f"[VK] Пользователь {user.vk_id} перешел на шаг {next_step_id} этапа {current_stage}")
@@ -325,7 +342,7 @@ async def _handle_prev_step(api, peer_id, cmid, user, db):
 
         message = _step_message(prev_step)
         buttons = prev_step.get('buttons', [])
-        keyboard = _practice_kb(buttons) if buttons else None
+        keyboard = _practice_kb(buttons, current_stage, prev_step_id) if buttons else None
 
         await _edit(api, peer_id, cmid, message, keyboard)
         logger.info(f"[VK] Пользователь {user.vk_id} вернулся на шаг {prev_step_id} этапа {current_stage}")
@@ -493,83 +510,20 @@ async def _handle_sprouts_appeared(api, peer_id, cmid, user, db):
 
 async def _handle_show_examples(api, peer_id, cmid, user, db, vk_user_id=None):
     """Показать примеры желаний с аккордеоном"""
-    opened = set()
-    if vk_user_id:
-        state = _user_state.get(vk_user_id, {})
-        opened = state.get('opened_categories', set())
-
-    examples = practices_manager.get_examples_menu()
+    opened = session_state.get('vk', vk_user_id, 'opened_categories', ()) if vk_user_id else ()
 
-    message = f"{examples.get('title', 'Примеры желаний')}\n\n"
-    message += examples.get('message', '') + "\n\n"
-
-    categories = examples.get('categories', [])
-    buttons = []
-
-    for category in categories:
-        cat_id = category.get('id', '')
-        is_open = cat_id in opened
-
-        arrow = "🔽" if is_open else "▶️"
-        buttons.append((f"{arrow} {category.get('title', '')}", f"toggle_category_{cat_id}"))
-
-        if is_open:
-            message += f"\n{category.get('title', '')}\n"
-            message += f"{category.get('description', '')}\n\n"
-            for item in category.get('items', []):
-                message += f"• {item}\n"
-            message += "\n"
-
-    buttons.append(("✅ Продолжить практику", "continue_from_examples"))
-
-    keyboard = create_vk_callback_keyboard(buttons)
-    await _edit(api, peer_id, cmid, markdown_to_plain(message), keyboard)
+    message, keyboard = render_examples('vk', opened)
+    await _edit(api, peer_id, cmid, message, keyboard)
 
 
 # ==================== РЕЦЕПТЫ ====================
 
 async def _handle_show_recipes(api, peer_id, cmid, user, db, vk_user_id=None):
     """Показать рецепты с аккордеоном"""
-    opened = set()
-    if vk_user_id:
-        state = _user_state.get(vk_user_id, {})
-        opened = state.get('opened_recipes', set())
-
-    recipes = practices_manager.get_recipes()
-
-    message = f"{recipes.get('title', 'Рецепты')} 🍽\n\n"
-    message += recipes.get('message', '')
-
-    items = recipes.get('items', [])
-
-    for recipe in items:
-        recipe_id = recipe.get('id', '')
-        if recipe_id in opened:
-            message += f"\n\n{recipe.get('title', '')}\n"
-            message += f"{recipe.get('subtitle', '')}\n\n"
-            message += f"Ингредиенты: {recipe.get('ingredients', '')}\n"
-            message += f"Как делать: {recipe.get('instructions', '')}\n"
-            if recipe.get('secret'):
-                message += f"В чём секрет: {recipe.get('secret')}\n"
-            if recipe.get('meaning'):
-                message += f"Смысл: {recipe.get('meaning')}\n"
-
-    buttons = []
-    for recipe in items:
-        recipe_id = recipe.get('id', '')
-        title = recipe.get('title', '')
-        if recipe_id in opened:
-            buttons.append((f"▼ {title}", f"collapse_recipe_{recipe_id}"))
-        else:
-            buttons.append((title, f"expand_recipe_{recipe_id}"))
+    opened = session_state.get('vk', vk_user_id, 'opened_recipes', ()) if vk_user_id else ()
 
-    if user.current_stage == 4:
-        buttons.append(("✅ Продолжить", "next_step"))
-    else:
-        buttons.append(("✅ Завершить практику", "next_daily_substep"))
-
-    keyboard = create_vk_callback_keyboard(buttons)
-    await _edit(api, peer_id, cmid, markdown_to_plain(message), keyboard)
+    message, keyboard = render_recipes('vk', opened, stage4=user.current_stage == 4)
+    await _edit(api, peer_id, cmid, message, keyboard)
 
 
 # ==================== МАНИФЕСТ ====================
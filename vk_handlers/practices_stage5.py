@@ -9,16 +9,14 @@ from utils import practices_manager
 from utils.db import update_user_progress_obj
 from utils.formatting import markdown_to_plain
 from utils.vk_keyboards import create_vk_callback_keyboard
+from utils import vk_client
 
 logger = logging.getLogger(__name__)
 
 
 async def _edit(api, peer_id, cmid, message, keyboard=None):
     """Редактировать сообщение"""
-    kwargs = {"peer_id": peer_id, "conversation_message_id": cmid, "message": message}
-    if keyboard:
-        kwargs["keyboard"] = keyboard
-    await api.messages.edit(**kwargs)
+    await vk_client.edit_message(api, peer_id, cmid, message, keyboard)
 
 
 def _get_stage5_daily_practice(day: int):
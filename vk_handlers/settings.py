@@ -6,24 +6,19 @@ from datetime import datetime
 from models import SessionLocal, User
 from utils.db import get_or_create_vk_user
 from utils.vk_keyboards import create_vk_callback_keyboard
+from utils import vk_client
 
 logger = logging.getLogger(__name__)
 
 
 async def _send(api, peer_id, message, keyboard=None):
     """Отправить сообщение"""
-    kwargs = {"peer_id": peer_id, "message": message, "random_id": 0}
-    if keyboard:
-        kwargs["keyboard"] = keyboard
-    await api.messages.send(**kwargs)
+    await vk_client.send_message(api, peer_id, message, keyboard)
 
 
 async def _edit(api, peer_id, cmid, message, keyboard=None):
     """Редактировать сообщение"""
-    kwargs = {"peer_id": peer_id, "conversation_message_id": cmid, "message": message}
-    if keyboard:
-        kwargs["keyboard"] = keyboard
-    await api.messages.edit(**kwargs)
+    await vk_client.edit_message(api, peer_id, cmid, message, keyboard)
 
 
 async def vk_show_time_selection(api, peer_id):
@@ -5,7 +5,10 @@ import logging
 from models import SessionLocal, User
 from utils.db import get_or_create_vk_user
 from utils.formatting import markdown_to_plain
+from utils.vk_profiles import vk_profile_cache
 from utils.vk_keyboards import create_vk_callback_keyboard, create_vk_menu_keyboard, create_vk_inline_keyboard
+from utils import vk_client
+from utils import callback_codec
 
 logger = logging.getLogger(__name__)
 
@@ -24,30 +27,19 @@ def _get_vk_menu_keyboard():
 
 
 async def _get_vk_user_info(api, user_id: int):
-    """Получить имя VK-пользователя"""
-    try:
-        users = await api.users.get(user_ids=[user_id])
-        if users:
-            return users[0].first_name, users[0].last_name
-    except Exception as e:
-        logger.warning(f"[VK] Не удалось получить инфо о пользователе {user_id}: {e}")
-    return None, None
+    """Получить имя VK-пользователя из кэша профилей (без запроса к users.get)"""
+    vk_profile_cache.bind(api)
+    return vk_profile_cache.get(user_id)
 
 
 async def _edit(api, peer_id, cmid, message, keyboard=None):
     """Редактировать сообщение"""
-    kwargs = {"peer_id": peer_id, "conversation_message_id": cmid, "message": message}
-    if keyboard:
-        kwargs["keyboard"] = keyboard
-    await api.messages.edit(**kwargs)
+    await vk_client.edit_message(api, peer_id, cmid, message, keyboard)
 
 
 async def _send(api, peer_id, message, keyboard=None):
     """Отправить сообщение"""
-    kwargs = {"peer_id": peer_id, "message": message, "random_id": 0}
-    if keyboard:
-        kwargs["keyboard"] = keyboard
-    await api.messages.send(**kwargs)
+    await vk_client.send_message(api, peer_id, message, keyboard)
 
 
 # ==================== КОМАНДЫ ====================
@@ -143,7 +135,7 @@ async def vk_handle_start_callback(api, peer_id, user_id, cmid, action):
             message = f"{title}\n\n{markdown_to_plain(msg)}"
 
             buttons = first_step.get('buttons', [])
-            keyboard = create_vk_inline_keyboard(buttons) if buttons else None
+            keyboard = create_vk_inline_keyboard(callback_codec.encode_buttons(buttons, 1, 1)) if buttons else None
 
             await _edit(api, peer_id, cmid, message, keyboard)
         finally:
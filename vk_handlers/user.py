@@ -10,17 +10,6 @@ from utils.vk_keyboards import create_vk_callback_keyboard
 logger = logging.getLogger(__name__)
 
 
-async def _get_vk_user_info(api, user_id: int):
-    """Получить имя VK-пользователя"""
-    try:
-        users = await api.users.get(user_ids=[user_id])
-        if users:
-            return users[0].first_name, users[0].last_name
-    except:
-        pass
-    return None, None
-
-
 async def vk_status_command(api, message):
     """Показать прогресс пользователя"""
     user_id = message.from_id